@@ -0,0 +1,56 @@
+# %%
+# Benchmark of the tree loading, run with `python benchmark_tree_load.py [n_jobs]`. The package
+# must be installed in the environment (e.g. with `pip install -e .` from the repository root)
+import os
+import sys
+import tempfile
+import time
+
+from ruamel import yaml
+
+from study_sub.utils.dict_yaml_utils import get_path_snapshot, load_yaml, write_yaml
+
+# %%
+n_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+# Build a synthetic tree with one job per parameter point
+dic_tree = {"base": {}}
+for idx_job in range(n_jobs):
+    dic_tree["base"][f"point_{idx_job}"] = {
+        "some_more_computations": {
+            "file": f"study_bench/base/point_{idx_job}/some_more_computations.py",
+            "context": "cpu",
+            "submission_type": "slurm",
+            "htc_flavor": None,
+            "status": "to_submit",
+            "path_run": f"/afs/cern.ch/work/study_bench/base/point_{idx_job}/run.sh",
+        }
+    }
+
+
+# %%
+def timeit(label, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{label:<40} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path_tree = f"{tmp_dir}/tree.yaml"
+    timeit(f"write_yaml ({n_jobs} jobs)", lambda: write_yaml(path_tree, dic_tree))
+    print(f"Size of the yaml file: {os.path.getsize(path_tree) / 1e6:.1f} MB")
+
+    # Reference: round-trip parser, as used before the snapshot
+    with open(path_tree) as f:
+        timeit("round-trip parser", lambda: yaml.YAML().load(f))
+
+    # Snapshot missing: C parser, then the snapshot is written
+    os.remove(get_path_snapshot(path_tree))
+    timeit("load_yaml (C parser + snapshot)", lambda: load_yaml(path_tree))
+
+    # Snapshot current
+    dic_loaded = timeit("load_yaml (snapshot)", lambda: load_yaml(path_tree))
+    assert dic_loaded == dic_tree
+
+# %%
@@ -4,5 +4,8 @@
 
 # Local imports
 from .cluster_submission import ClusterSubmission
+from .local_executor import LocalExecutor
+from .scheduler_snapshot import SchedulerSnapshot
+from .submission_engine import SubmissionEngine
 
-__all__ = ["ClusterSubmission"]
+__all__ = ["ClusterSubmission", "LocalExecutor", "SchedulerSnapshot", "SubmissionEngine"]
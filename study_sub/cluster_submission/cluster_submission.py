@@ -2,18 +2,55 @@
 # --- Imports
 # ==================================================================================================
 # Standard library imports
+import math
 import os
+import shutil
 import subprocess
-from pathlib import Path
-from typing import Self
+import tempfile
+from typing import Callable, Self
 
-import psutil
+# Local imports
+from ..dependency_graph import DependencyGraph
+from ..generate_run import RUNNER_FILENAME, generate_bundle_run_file
+from ..id_index import IdIndex, get_id_key_bundle_member, get_id_scheduler
+from ..job_index import Job, JobIndex
+from .local_executor import LocalExecutor
+from .scheduler_snapshot import SchedulerSnapshot
+from .submission_engine import SubmissionEngine
+from .submission_statements import (
+    HTC,
+    HTCDag,
+    HTCDocker,
+    LocalPC,
+    Slurm,
+    SlurmArray,
+    SlurmDocker,
+    DIC_HTC_FLAVOURS_MAX_RUNTIME,
+    fix_infn_path,
+    get_htc_flavour,
+    get_htc_path_manifest,
+)
 
-# Third party imports
-from study_gen._nested_dicts import nested_get
 
-# Local imports
-from .submission_statements import HTC, HTCDocker, LocalPC, Slurm, SlurmDocker
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Resources that can be requested for each job in the tree
+RESOURCE_KEYS = ["cpus", "memory", "walltime"]
+
+# Priorities of the jobs, given as keys of the tree nodes (jobs with the highest value first),
+# except for the generation. The runtime is the walltime of the job (e.g. set by
+# autosize_resources), so that the longest jobs start first.
+DIC_PRIORITIES = {"generation": None, "runtime": "walltime", "weight": "weight"}
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def parse_id_job(id_job):
+    # Plain scheduler ids are integers, array tasks ids (e.g. 1234_5) are kept as strings
+    id_job = str(id_job).strip()
+    return int(id_job) if id_job.isdigit() else id_job
 
 
 # ==================================================================================================
@@ -24,14 +61,28 @@ class ClusterSubmission:
         self: Self,
         study_name: str,
         l_jobs_to_submit: list[str],
-        dic_all_jobs: dict,
+        job_index: JobIndex,
         dic_tree: dict,
         path_submission_file: str,
         abs_path_study: str,
+        slurm_array_max_concurrent: int | None = None,
+        htc_max_materialize: int | None = None,
+        htc_max_idle: int | None = None,
+        slurm_docker_array: bool = True,
+        scheduler_snapshot: SchedulerSnapshot | None = None,
+        id_index: IdIndex | None = None,
+        local_executor: LocalExecutor | None = None,
+        local_blocking: bool = False,
+        submission_engine: SubmissionEngine | None = None,
+        max_in_flight: int | None = None,
+        priority: str | Callable[[str], float] | None = None,
+        bundle_size: int | None = None,
+        bundle_walltime: float | None = None,
+        bundle_cpus: int = 4,
     ):
         self.study_name = study_name
         self.l_jobs_to_submit = l_jobs_to_submit
-        self.dic_all_jobs = dic_all_jobs
+        self.job_index = job_index
         self.dic_tree = dic_tree
         self.path_submission_file = path_submission_file
         self.abs_path_study = abs_path_study
@@ -41,67 +92,184 @@ class ClusterSubmission:
             "htc_docker": HTCDocker,
             "slurm": Slurm,
             "slurm_docker": SlurmDocker,
+            "slurm_array": SlurmArray,
         }
 
-    # Getter for dic_id_to_path_job
-    @property
-    def dic_id_to_path_job(self):
-        dic_id_to_path_job = {}
-        found_at_least_one = False
-        for job in self.l_jobs_to_submit:
-            l_keys = self.dic_all_jobs[job]["l_keys"]
-            subdic_job = nested_get(self.dic_tree, l_keys)
-            if "id_sub" in subdic_job:
-                dic_id_to_path_job[subdic_job["id_sub"]] = self._return_abs_path_job(job)[0]
-                found_at_least_one = True
-
-        return dic_id_to_path_job if found_at_least_one else None
-
-    # Setter for dic_id_to_path_job
-    @dic_id_to_path_job.setter
-    def dic_id_to_path_job(self, dic_id_to_path_job):
-        assert isinstance(dic_id_to_path_job, dict)
-        # Ensure all ids are integers
-        dic_id_to_path_job = {
-            int(id_job): path_job for id_job, path_job in dic_id_to_path_job.items()
-        }
-        dic_job_to_id = {path_job: int(id_job) for id_job, path_job in dic_id_to_path_job.items()}
+        # Maximum number of tasks of a same array running at the same time (no limit if None)
+        self.slurm_array_max_concurrent = slurm_array_max_concurrent
 
-        # Update the tree
-        for job in self.l_jobs_to_submit:
-            path_job = self._return_abs_path_job(job)[0]
-            l_keys = self.dic_all_jobs[job]["l_keys"]
-            subdic_job = nested_get(self.dic_tree, l_keys)
-            if "id_sub" in subdic_job and int(subdic_job["id_sub"]) not in dic_id_to_path_job:
-                del subdic_job["id_sub"]
-            elif "id_sub" not in subdic_job and path_job in dic_job_to_id:
-                subdic_job["id_sub"] = dic_job_to_id[path_job]
-            # Else all is consistent
+        # Number of tasks in each array submission file
+        self.dic_n_tasks_array = {}
 
-    def _update_dic_id_to_path_job(self, running_jobs, queuing_jobs):
-        # Look for jobs in the dictionnary that are not running or queuing anymore
-        set_current_jobs = set(running_jobs + queuing_jobs)
-        if self.dic_id_to_path_job is not None:
-            dic_id_to_path_job = self.dic_id_to_path_job
-            for id_job, job in self.dic_id_to_path_job.items():
-                if job not in set_current_jobs:
-                    del dic_id_to_path_job[id_job]
+        # Submit slurm_docker jobs as arrays (one sbatch per array) rather than one sbatch per job
+        self.slurm_docker_array = slurm_docker_array
+
+        # State of the jobs in the schedulers, possibly shared with previous submissions
+        self.scheduler_snapshot = (
+            scheduler_snapshot if scheduler_snapshot is not None else SchedulerSnapshot()
+        )
+
+        # Scheduler ids of the jobs, in memory only (from the ids in the tree) if not provided
+        if id_index is None:
+            id_index = IdIndex(None)
+            id_index.import_job_index(job_index)
+        self.id_index = id_index
+
+        # Local jobs are run by a pool bounded by the number of cores, possibly shared with
+        # previous submissions. If local_blocking is True, the submission waits for them.
+        self.local_executor = local_executor if local_executor is not None else LocalExecutor()
+        self.local_blocking = local_blocking
+
+        # Concurrent and rate-limited submission of the submit commands, with retries
+        self.submission_engine = (
+            submission_engine if submission_engine is not None else SubmissionEngine()
+        )
+
+        # Maximum number of jobs materialized/idle at once in the HTCondor schedd (no limit if None)
+        self.htc_max_materialize = htc_max_materialize
+        self.htc_max_idle = htc_max_idle
+
+        # Maximum number of jobs of the user running or queuing at once in the scheduler (e.g. the
+        # MaxSubmitJobs or MAX_JOBS_PER_OWNER quota), no limit if None. The jobs to submit are
+        # ordered by priority, i.e. "generation" (deepest first), "runtime" (longest estimated
+        # runtime first), "weight" (highest weight first) or a function of the job (lowest first).
+        self.max_in_flight = max_in_flight
+        if priority is not None and not callable(priority) and priority not in DIC_PRIORITIES:
+            raise ValueError(f"Error: {priority} is not a valid priority")
+        self.priority = priority
+
+        # Jobs of a same submission type, context and flavour are packed in bundles of at most
+        # bundle_size jobs and bundle_walltime minutes (estimated from the walltime of the jobs),
+        # each bundle running as a single scheduler job, its jobs running in parallel on
+        # bundle_cpus cores (no bundling if both bundle_size and bundle_walltime are None)
+        self.bundle_size = bundle_size
+        self.bundle_walltime = bundle_walltime
+        self.bundle_cpus = bundle_cpus
+
+        # Bundles written by this submission, as pseudo-jobs, and the jobs they run
+        self.dic_bundles: dict[str, Job] = {}
+        self.dic_bundle_members: dict[str, list[str]] = {}
+
+        # Runner of the study, if the jobs are run from its manifest rather than their own run.sh
+        self.path_runner = dic_tree.get("path_runner")
+
+    def _get_job(self, job):
+        # Jobs of the tree, or bundles of jobs
+        return self.dic_bundles[job] if job in self.dic_bundles else self.job_index[job]
+
+    def _get_path_runner(self, job, submission_type):
+        # Bundles have their own run.sh, and slurm_docker jobs keep theirs for the INFN fix. The
+        # HTCondor jobs of a submission file share its executable, hence they all use the runner,
+        # which runs the run.sh of the folders missing from its manifest (e.g. bundles).
+        if submission_type in ["htc", "htc_docker"]:
+            return self.path_runner
+        if job in self.dic_bundles or submission_type == "slurm_docker":
+            return None
+        return self.path_runner
+
+    def _set_id_job(self, job, id_job, persist=False):
+        # The jobs of a bundle are recorded with the id of the bundle and their index in it
+        if job in self.dic_bundles:
+            for idx_member, member in enumerate(self.dic_bundle_members[job]):
+                self._set_id_job(member, get_id_key_bundle_member(id_job, idx_member), persist)
+            return
+
+        # With persist, the id is recorded on disk right away
+        if persist:
+            self.id_index.record(id_job, job)
+        else:
+            self.id_index.add(id_job, job)
+
+        # The current id is also kept in the tree, for information
+        self.job_index[job].node["id_sub"] = parse_id_job(id_job)
+
+    def _remove_id_job(self, id_job):
+        job = self.id_index.get_job(id_job)
+        self.id_index.remove(id_job)
+        if job is not None and job in self.job_index:
+            self.job_index[job].node.pop("id_sub", None)
+
+    def _get_submission_types_queried(self):
+        # Submission types whose jobs are found by querying_jobs
+        check_local, check_htc, check_slurm = self._check_submission_type()
+        set_submission_types_queried = set()
+        if check_local:
+            set_submission_types_queried.add("local")
+        if check_htc:
+            set_submission_types_queried.update(["htc", "htc_docker"])
+        if check_slurm:
+            set_submission_types_queried.update(["slurm", "slurm_docker", "slurm_array"])
+        return set_submission_types_queried
 
-            # Update dic_id_to_path_job
-            self.dic_id_to_path_job = dic_id_to_path_job
+    def _update_dic_id_to_path_job(self, running_jobs, queuing_jobs):
+        # Look for jobs in the index that are not running or queuing anymore, among all the jobs
+        # of the queried schedulers (not only the ones to submit, e.g. the jobs that finished)
+        set_submission_types_queried = self._get_submission_types_queried()
+        set_current_jobs = running_jobs | queuing_jobs
+        for id_job in list(self.id_index):
+            job = self.id_index.get_job(id_job)
+            if (
+                job in self.job_index
+                and self.job_index[job].node["submission_type"] in set_submission_types_queried
+                and self._return_abs_path_job(job)[0] not in set_current_jobs
+            ):
+                self._remove_id_job(id_job)
+
+        # Ids left in the tree by a previous version are synchronized with the index
+        for job in self.l_jobs_to_submit:
+            if self.id_index.get_id(job) is None and "id_sub" in self.job_index[job].node:
+                del self.job_index[job].node["id_sub"]
+        self.id_index.write()
+
+    def _remove_done_bundles(self, running_jobs, queuing_jobs):
+        # The folder of a bundle is removed once its jobs are all finished, or once none of them is
+        # running or queuing anymore (i.e. some failed and will be submitted again) if the
+        # scheduler of the bundle was queried
+        path_bundles = self._get_path_bundles()
+        if not os.path.isdir(path_bundles):
+            return
+        set_submission_types_queried = self._get_submission_types_queried()
+        set_current_jobs = running_jobs | queuing_jobs
+        dic_path_job_to_job = None
+        for entry in os.scandir(path_bundles):
+            try:
+                with open(f"{entry.path}/members.txt") as fid:
+                    l_folders = fid.read().split()
+            except OSError:
+                # Bundle being written
+                continue
+
+            # Path of the jobs as in the running and queuing jobs (the folders may be fixed for
+            # INFN)
+            l_path_jobs = [
+                f"{self.study_name}{folder.split(self.study_name)[1]}/"
+                for folder in l_folders
+                if self.study_name in folder
+            ]
+            if dic_path_job_to_job is None:
+                dic_path_job_to_job = {
+                    self._return_abs_path_job(job.file)[0]: job for job in self.job_index.jobs()
+                }
+            if all(
+                path_job in dic_path_job_to_job and dic_path_job_to_job[path_job].is_finished
+                for path_job in l_path_jobs
+            ) or (
+                entry.name.removeprefix("bundle_").split(".")[0] in set_submission_types_queried
+                and not any(path_job in set_current_jobs for path_job in l_path_jobs)
+            ):
+                shutil.rmtree(entry.path, ignore_errors=True)
 
     def _check_submission_type(self):
         check_local = False
         check_htc = False
         check_slurm = False
         for job in self.l_jobs_to_submit:
-            l_keys = self.dic_all_jobs[job]["l_keys"]
-            submission_type = nested_get(self.dic_tree, l_keys + ["submission_type"])
+            submission_type = self.job_index[job].node["submission_type"]
             if submission_type == "local":
                 check_local = True
             elif submission_type in ["htc", "htc_docker"]:
                 check_htc = True
-            elif submission_type in ["slurm", "slurm_docker"]:
+            elif submission_type in ["slurm", "slurm_docker", "slurm_array"]:
                 check_slurm = True
 
         if check_htc and check_slurm:
@@ -113,20 +281,29 @@ class ClusterSubmission:
         # First check whether the jobs are submitted on local, htc or slurm
         check_local, check_htc, check_slurm = self._check_submission_type()
 
-        # Then query accordingly
-        running_jobs = self.querying_jobs(check_local, check_htc, check_slurm, status="running")
-        queuing_jobs = self.querying_jobs(check_local, check_htc, check_slurm, status="queuing")
+        # Then query accordingly (the schedulers are only queried if the snapshot is outdated)
+        # Sets are returned, as they are tested for every job to submit. If the id index is
+        # missing, it is recovered from the scheduler with a single query.
+        running_jobs = set(
+            self.querying_jobs(
+                check_local, check_htc, check_slurm, "running", force_query_individually=True
+            )
+        )
+        queuing_jobs = set(
+            self.querying_jobs(
+                check_local, check_htc, check_slurm, "queuing", force_query_individually=True
+            )
+        )
         self._update_dic_id_to_path_job(running_jobs, queuing_jobs)
+        self._remove_done_bundles(running_jobs, queuing_jobs)
         if verbose:
-            print("Running: \n" + "\n".join(running_jobs))
-            print("queuing: \n" + "\n".join(queuing_jobs))
+            print("Running: \n" + "\n".join(sorted(running_jobs)))
+            print("queuing: \n" + "\n".join(sorted(queuing_jobs)))
         return running_jobs, queuing_jobs
 
     def _test_job(self, job, path_job, running_jobs, queuing_jobs):
         # Test if job is completed
-        l_keys = self.dic_all_jobs[job]["l_keys"]
-        completed = nested_get(self.dic_tree, l_keys + ["status"]) == "finished"
-        if completed:
+        if self._get_job(job).is_finished:
             print(f"{path_job} is already completed.")
 
         # Test if job is running
@@ -143,8 +320,12 @@ class ClusterSubmission:
         return False
 
     def _return_htc_flavour(self, job):
-        l_keys = self.dic_all_jobs[job]["l_keys"]
-        return nested_get(self.dic_tree, l_keys + ["htc_flavor"])
+        return self._get_job(job).node["htc_flavor"]
+
+    def _return_resources(self, job):
+        # Resources requested by the job (cpus, memory in MB and walltime in minutes), if any
+        node = self._get_job(job).node
+        return {key: node[key] for key in RESOURCE_KEYS if node.get(key) is not None}
 
     def _return_abs_path_job(self, job):
         # Get corresponding path job (remove the python file name)
@@ -163,15 +344,19 @@ class ClusterSubmission:
                 filename_sub = f"{sub_filename.split('.sub')[0]}_{idx_job}.sub"
 
                 # Get job context
-                l_keys = self.dic_all_jobs[job]["l_keys"]
-                context = nested_get(self.dic_tree, l_keys + ["context"])
+                context = self._get_job(job).node["context"]
 
                 # Write the submission files
                 # ! Careful, I implemented a fix for path due to the temporary home recovery folder
                 print(f'Writing submission file for node "{abs_path_job}"')
                 fix = True
                 Sub = self.dic_submission["slurm_docker"](
-                    filename_sub, abs_path_job, context, self.dic_tree["container_image"], fix=fix
+                    filename_sub,
+                    abs_path_job,
+                    context,
+                    self.dic_tree["container_image"],
+                    fix=fix,
+                    resources=self._return_resources(job),
                 )
                 with open(filename_sub, "w") as fid:
                     fid.write(Sub.head + "\n")
@@ -184,13 +369,128 @@ class ClusterSubmission:
                 list_of_jobs_updated.append(job)
         return l_filenames, list_of_jobs_updated
 
-    def _get_Sub(self, job, submission_type, sub_filename, abs_path_job, context):
+    def _get_slurm_max_array_size(self):
+        # MaxArraySize of the cluster, the highest task index being MaxArraySize - 1
+        max_array_size = 1001
+        try:
+            slurm_config = subprocess.run(
+                ["scontrol", "show", "config"], capture_output=True
+            ).stdout.decode("utf-8")
+        except FileNotFoundError:
+            return max_array_size
+        for line in slurm_config.split("\n"):
+            if line.startswith("MaxArraySize"):
+                max_array_size = int(line.split("=")[1])
+        return max_array_size
+
+    def _write_sub_files_slurm_array(
+        self,
+        sub_filename,
+        running_jobs,
+        queuing_jobs,
+        list_of_jobs,
+        submission_type="slurm_array",
+    ):
+        # Group jobs by context and resources, as all the tasks of an array share the same
+        # resources
+        dic_jobs_by_context = {}
+        for job in list_of_jobs:
+            path_job, abs_path_job = self._return_abs_path_job(job)
+            if self._test_job(job, path_job, running_jobs, queuing_jobs):
+                context = self._get_job(job).node["context"]
+                resources = tuple(sorted(self._return_resources(job).items()))
+                dic_jobs_by_context.setdefault((context, resources), []).append(job)
+
+        # Docker arrays run run.sh in the container, with the INFN fix applied to the manifest (the
+        # run.sh of the jobs being fixed when generated)
+        path_image = None
+        fix = False
+        prefix_array = "array"
+        if submission_type == "slurm_docker" and dic_jobs_by_context:
+            path_image = self.dic_tree.get("container_image")
+            if path_image is None:
+                raise ValueError(
+                    "Error: container_image is not defined in the tree. Please define it in the"
+                    " config.yaml file."
+                )
+            # ! Careful, I implemented a fix for path due to the temporary home recovery folder
+            fix = True
+            prefix_array = "docker_array"
+
+        # Create folder to the submission files if it does not exist
+        os.makedirs(os.path.dirname(sub_filename), exist_ok=True)
+
+        # Then split them in arrays no larger than the limit of the cluster
+        max_array_size = self._get_slurm_max_array_size() if dic_jobs_by_context else 0
+        l_filenames = []
+        list_of_jobs_updated = []
+        for (context, resources), l_jobs_context in dic_jobs_by_context.items():
+            for idx_start in range(0, len(l_jobs_context), max_array_size):
+                l_jobs_array = l_jobs_context[idx_start : idx_start + max_array_size]
+                # The tasks read their folder from the manifest only when they start, hence each
+                # array gets files that are never reused, as a previous array may still be queuing
+                fd, filename_sub = tempfile.mkstemp(
+                    prefix=f"{os.path.basename(sub_filename.split('.sub')[0])}_{prefix_array}_",
+                    suffix=".sub",
+                    dir=os.path.dirname(sub_filename),
+                )
+                os.close(fd)
+                filename_manifest = f"{filename_sub.removesuffix('.sub')}.txt"
+
+                # Manifest with the folder of each task
+                print(f"Writing array submission file {filename_sub} ({len(l_jobs_array)} jobs)")
+                with open(filename_manifest, "w") as fid:
+                    for job in l_jobs_array:
+                        path_folder = self._return_abs_path_job(job)[1].rstrip("/")
+                        fid.write(f"{fix_infn_path(path_folder) if fix else path_folder}\n")
+
+                Sub = SlurmArray(
+                    filename_sub,
+                    filename_manifest,
+                    context,
+                    len(l_jobs_array),
+                    self.slurm_array_max_concurrent,
+                    path_image=path_image,
+                    fix=fix,
+                    resources=dict(resources),
+                    path_runner=self._get_path_runner(None, submission_type),
+                )
+                with open(filename_sub, "w") as fid:
+                    fid.write(Sub.head + "\n")
+                    fid.write(Sub.body + "\n")
+                    fid.write(Sub.tail + "\n")
+
+                self.dic_n_tasks_array[filename_sub] = len(l_jobs_array)
+                l_filenames.append(filename_sub)
+                list_of_jobs_updated.extend(l_jobs_array)
+
+        return l_filenames, list_of_jobs_updated
+
+    def _get_Sub(
+        self, job, submission_type, sub_filename, abs_path_job, context, dependency=None, fix=False
+    ):
+        resources = self._return_resources(job)
+        path_runner = self._get_path_runner(job, submission_type)
         match submission_type:
             case "slurm":
-                return self.dic_submission[submission_type](sub_filename, abs_path_job, context)
+                return self.dic_submission[submission_type](
+                    sub_filename,
+                    abs_path_job,
+                    context,
+                    dependency=dependency,
+                    resources=resources,
+                    path_runner=path_runner,
+                )
             case "htc":
                 return self.dic_submission[submission_type](
-                    sub_filename, abs_path_job, context, self._return_htc_flavour(job)
+                    sub_filename,
+                    abs_path_job,
+                    context,
+                    self._return_htc_flavour(job),
+                    self.htc_max_materialize,
+                    self.htc_max_idle,
+                    resources=resources,
+                    path_runner=path_runner,
                 )
             case w if w in ["htc_docker", "slurm_docker"]:
                 # Path to singularity image
@@ -212,13 +512,25 @@ class ClusterSubmission:
                         context,
                         self.path_image,
                         self._return_htc_flavour(job),
+                        self.htc_max_materialize,
+                        self.htc_max_idle,
+                        resources=resources,
+                        path_runner=path_runner,
                     )
                 else:
                     return self.dic_submission[submission_type](
-                        sub_filename, abs_path_job, context, self.path_image
+                        sub_filename,
+                        abs_path_job,
+                        context,
+                        self.path_image,
+                        fix=fix,
+                        dependency=dependency,
+                        resources=resources,
                     )
             case "local":
-                return self.dic_submission[submission_type](sub_filename, abs_path_job)
+                return self.dic_submission[submission_type](
+                    sub_filename, abs_path_job, path_runner=path_runner
+                )
             case _:
                 raise ValueError(f"Error: {submission_type} is not a valid submission mode")
 
@@ -254,8 +566,7 @@ class ClusterSubmission:
                     print(f'Writing submission command for node "{abs_path_job}"')
 
                     # Get context
-                    l_keys = self.dic_all_jobs[job]["l_keys"]
-                    context = nested_get(self.dic_tree, l_keys + ["context"])
+                    context = self._get_job(job).node["context"]
 
                     # Get Submission object
                     Sub = self._get_Sub(job, submission_type, sub_filename, abs_path_job, context)
@@ -281,6 +592,49 @@ class ClusterSubmission:
 
         return ([sub_filename], list_of_jobs_updated) if ok_to_submit else ([], [])
 
+    def _write_sub_file_htc(
+        self,
+        sub_filename,
+        running_jobs,
+        queuing_jobs,
+        list_of_jobs,
+        submission_type,
+    ):
+        # Create folder to the submission file if it does not exist
+        os.makedirs(os.path.dirname(sub_filename), exist_ok=True)
+
+        # Collect the manifest lines, one per job
+        list_of_jobs_updated = []
+        l_manifest_lines = []
+        Sub_head = None
+        for job in list_of_jobs:
+            # Get corresponding path job (remove the python file name)
+            path_job, abs_path_job = self._return_abs_path_job(job)
+
+            # Test if job is running, queuing or completed
+            if self._test_job(job, path_job, running_jobs, queuing_jobs):
+                print(f'Writing submission command for node "{abs_path_job}"')
+                context = self._get_job(job).node["context"]
+                Sub = self._get_Sub(job, submission_type, sub_filename, abs_path_job, context)
+                l_manifest_lines.append(Sub.body)
+                list_of_jobs_updated.append(job)
+
+                # The head sets the maximum runtime if any job has a walltime
+                if Sub_head is None or (Sub_head.walltime is None and Sub.walltime is not None):
+                    Sub_head = Sub
+
+        if not l_manifest_lines:
+            return [], []
+
+        # Write the manifest, and the submission file which queues all its jobs in a single cluster
+        with open(get_htc_path_manifest(sub_filename), "w") as fid:
+            fid.write("\n".join(l_manifest_lines) + "\n")
+        with open(sub_filename, "w") as fid:
+            fid.write(Sub_head.head + "\n")
+            fid.write(Sub_head.tail + "\n")
+
+        return [sub_filename], list_of_jobs_updated
+
     def _write_sub_files(
         self,
         sub_filename,
@@ -289,12 +643,29 @@ class ClusterSubmission:
         list_of_jobs,
         submission_type,
     ):
-        # Slurm docker is a peculiar case as one submission file must be created per job
-        if submission_type == "slurm_docker":
+        # Slurm docker is a peculiar case as one submission file must be created per job (or per
+        # array of jobs)
+        if submission_type == "slurm_docker" and not self.slurm_docker_array:
             return self._write_sub_files_slurm_docker(
                 sub_filename, running_jobs, queuing_jobs, list_of_jobs
             )
 
+        # Slurm arrays need one submission file and one manifest per array
+        elif submission_type in ["slurm_array", "slurm_docker"]:
+            return self._write_sub_files_slurm_array(
+                sub_filename, running_jobs, queuing_jobs, list_of_jobs, submission_type
+            )
+
+        # HTCondor jobs are queued from a manifest, in a file specific to the submission type
+        elif submission_type in ["htc", "htc_docker"]:
+            return self._write_sub_file_htc(
+                f"{sub_filename.split('.sub')[0]}_{submission_type}.sub",
+                running_jobs,
+                queuing_jobs,
+                list_of_jobs,
+                submission_type,
+            )
+
         else:
             return self._write_sub_file(
                 sub_filename,
@@ -304,19 +675,229 @@ class ClusterSubmission:
                 submission_type,
             )
 
+    def _get_priority_key(self, job):
+        # Sorting key of the job, the jobs with the lowest key being submitted first
+        match self.priority:
+            case None:
+                return 0
+            case "generation":
+                return -self.job_index[job].gen
+            case w if callable(w):
+                return self.priority(job)
+            case _:
+                return -(self.job_index[job].node.get(DIC_PRIORITIES[self.priority]) or 0)
+
+    def _get_n_in_flight(self):
+        # All the running and queuing jobs of the user count towards the quota, including the ones
+        # of other studies
+        _, check_htc, check_slurm = self._check_submission_type()
+        n_in_flight = 0
+        if check_htc:
+            n_in_flight += len(self.scheduler_snapshot.get_condor_states())
+        if check_slurm:
+            n_in_flight += len(self.scheduler_snapshot.get_slurm_states())
+        return n_in_flight
+
+    def _get_jobs_in_window(self, running_jobs, queuing_jobs):
+        # Jobs to submit, by priority, and restricted to the free slots of the window. The jobs
+        # already completed, running or queuing are kept, as they are not submitted anyway.
+        if self.max_in_flight is None and self.priority is None:
+            return self.l_jobs_to_submit
+
+        l_jobs_skipped = []
+        l_jobs_candidates = []
+        for job in self.l_jobs_to_submit:
+            path_job = self._return_abs_path_job(job)[0]
+            if (
+                self.job_index[job].is_finished
+                or path_job in running_jobs
+                or path_job in queuing_jobs
+            ):
+                l_jobs_skipped.append(job)
+            else:
+                l_jobs_candidates.append(job)
+
+        # Stable sort, the jobs of same priority keep their order
+        l_jobs_candidates.sort(key=self._get_priority_key)
+        if self.max_in_flight is None:
+            return l_jobs_skipped + l_jobs_candidates
+
+        # Local jobs are not submitted to the scheduler, hence not limited
+        l_jobs_local = []
+        l_jobs_hpc = []
+        for job in l_jobs_candidates:
+            if self.job_index[job].node["submission_type"] == "local":
+                l_jobs_local.append(job)
+            else:
+                l_jobs_hpc.append(job)
+        if l_jobs_hpc:
+            n_in_flight = self._get_n_in_flight()
+            n_free = max(0, self.max_in_flight - n_in_flight)
+            n_jobs_hpc = len(l_jobs_hpc)
+            l_jobs_hpc, n_submissions = self._fill_window(l_jobs_hpc, n_free)
+            print(
+                f"{n_in_flight} jobs running or queuing out of {self.max_in_flight} allowed."
+                f" Submitting {len(l_jobs_hpc)} out of {n_jobs_hpc} jobs, in {n_submissions}"
+                " scheduler jobs."
+            )
+        return l_jobs_skipped + l_jobs_local + l_jobs_hpc
+
+    def _fill_window(self, l_jobs, n_free):
+        # Jobs (by priority) filling n_free scheduler jobs, and number of scheduler jobs used. The
+        # jobs are packed as by _bundle_jobs, a bundle taking a single slot of the window.
+        is_bundled = self.bundle_size is not None or self.bundle_walltime is not None
+        dic_bundles_open = {}
+        l_jobs_window = []
+        n_submissions = 0
+        for job in l_jobs:
+            node = self.job_index[job].node
+            group = (node["submission_type"], node["context"], node.get("htc_flavor"))
+            l_jobs_bundle = dic_bundles_open.get(group)
+            if is_bundled and l_jobs_bundle and self._fits_in_bundle(l_jobs_bundle + [job]):
+                l_jobs_bundle.append(job)
+            elif n_submissions < n_free:
+                n_submissions += 1
+                dic_bundles_open[group] = [job]
+            else:
+                # A job of lower priority may still fit in a bundle already open
+                continue
+            l_jobs_window.append(job)
+        return l_jobs_window, n_submissions
+
+    def _get_path_bundles(self):
+        return f"{os.path.dirname(self.path_submission_file)}/bundles"
+
+    def _get_bundle_parallelism(self, l_jobs):
+        # Number of jobs of the bundle running at once on the cores of the bundle
+        max_cpus = max(self.job_index[job].node.get("cpus") or 1 for job in l_jobs)
+        return max(1, self.bundle_cpus // max_cpus)
+
+    def _get_bundle_walltime(self, l_jobs):
+        # Upper bound of the walltime (in minutes) of the jobs run n_parallel at a time, None if
+        # the walltime of the jobs is not known
+        l_walltimes = [
+            self.job_index[job].node["walltime"]
+            for job in l_jobs
+            if self.job_index[job].node.get("walltime") is not None
+        ]
+        if not l_walltimes:
+            return None
+        return math.ceil(sum(l_walltimes) / self._get_bundle_parallelism(l_jobs) + max(l_walltimes))
+
+    def _fits_in_bundle(self, l_jobs):
+        if self.bundle_size is not None and len(l_jobs) > self.bundle_size:
+            return False
+        walltime = self._get_bundle_walltime(l_jobs)
+        return self.bundle_walltime is None or walltime is None or walltime <= self.bundle_walltime
+
+    def _make_bundle(self, l_jobs, submission_type, context, htc_flavor):
+        # The bundle is written in its own folder (never reused, as a previous bundle may still be
+        # running), with the list of the folders of its jobs and the run.sh running them. The
+        # folder is named after the submission type, to be removed once the bundle is done.
+        path_bundles = self._get_path_bundles()
+        os.makedirs(path_bundles, exist_ok=True)
+        abs_path_bundle = tempfile.mkdtemp(prefix=f"bundle_{submission_type}.", dir=path_bundles)
+        l_folders = [self._return_abs_path_job(job)[1].rstrip("/") for job in l_jobs]
+        n_parallel = self._get_bundle_parallelism(l_jobs)
+        print(f"Bundling {len(l_jobs)} jobs in {abs_path_bundle} ({n_parallel} at a time)")
+
+        # ! Careful, I implemented a fix for path due to the temporary home recovery folder
+        run_str = generate_bundle_run_file(
+            abs_path_bundle,
+            self.dic_tree["python_environment"],
+            n_parallel,
+            self._get_path_runner(None, submission_type),
+        )
+        members_str = "\n".join(l_folders) + "\n"
+        if submission_type == "slurm_docker":
+            run_str = fix_infn_path(run_str)
+            members_str = fix_infn_path(members_str)
+        with open(f"{abs_path_bundle}/members.txt", "w") as fid:
+            fid.write(members_str)
+        with open(f"{abs_path_bundle}/run.sh", "w") as fid:
+            fid.write(run_str)
+
+        # Resources of the bundle, the flavour being long enough for all its jobs
+        node = {"context": context, "submission_type": submission_type, "cpus": self.bundle_cpus}
+        l_memories = [self.job_index[job].node.get("memory") for job in l_jobs]
+        if any(memory is not None for memory in l_memories):
+            node["memory"] = max(memory or 0 for memory in l_memories) * n_parallel
+        walltime = self._get_bundle_walltime(l_jobs)
+        if walltime is not None:
+            node["walltime"] = walltime
+            l_flavours = list(DIC_HTC_FLAVOURS_MAX_RUNTIME)
+            if htc_flavor in l_flavours:
+                htc_flavor = max(htc_flavor, get_htc_flavour(walltime), key=l_flavours.index)
+            elif htc_flavor is not None:
+                # The flavour can't be compared to the walltime, the longest one is used
+                print(
+                    f"Warning, unknown HTCondor flavour {htc_flavor}. Using {l_flavours[-1]} for"
+                    f" the bundle {abs_path_bundle}."
+                )
+                htc_flavor = l_flavours[-1]
+        node["htc_flavor"] = htc_flavor
+
+        # The bundle is submitted as a job whose folder is the one of the bundle
+        bundle = f"{os.path.relpath(abs_path_bundle, self.abs_path_study)}/run.sh"
+        node["file"] = bundle
+        self.dic_bundles[bundle] = Job(bundle, [], 0, node, [])
+        self.dic_bundle_members[bundle] = list(l_jobs)
+        return bundle
+
+    def _bundle_jobs(self, list_of_jobs, submission_type, running_jobs, queuing_jobs):
+        # Jobs completed, running or queuing are kept as they are, as they are not submitted
+        l_jobs_kept = []
+        dic_jobs_by_group = {}
+        for job in list_of_jobs:
+            path_job = self._return_abs_path_job(job)[0]
+            node = self.job_index[job].node
+            if (
+                self.job_index[job].is_finished
+                or path_job in running_jobs
+                or path_job in queuing_jobs
+            ):
+                l_jobs_kept.append(job)
+            else:
+                group = (node["context"], node.get("htc_flavor"))
+                dic_jobs_by_group.setdefault(group, []).append(job)
+
+        # Jobs are packed in order, a bundle with a single job being submitted as a plain job
+        l_bundles = []
+        for (context, htc_flavor), l_jobs_group in dic_jobs_by_group.items():
+            l_jobs_bundles = [[]]
+            for job in l_jobs_group:
+                if l_jobs_bundles[-1] and not self._fits_in_bundle(l_jobs_bundles[-1] + [job]):
+                    l_jobs_bundles.append([])
+                l_jobs_bundles[-1].append(job)
+            for l_jobs_bundle in l_jobs_bundles:
+                if len(l_jobs_bundle) == 1:
+                    l_bundles.append(l_jobs_bundle[0])
+                else:
+                    l_bundles.append(
+                        self._make_bundle(l_jobs_bundle, submission_type, context, htc_flavor)
+                    )
+
+        return l_jobs_kept + l_bundles
+
     def write_sub_files(self):
         running_jobs, queuing_jobs = self._get_state_jobs(verbose=False)
 
         # Make a dict of all jobs to submit depending on the submission type
         dic_jobs_to_submit = {key: [] for key in self.dic_submission.keys()}
-        for job in self.l_jobs_to_submit:
-            l_keys = self.dic_all_jobs[job]["l_keys"]
-            submission_type = nested_get(self.dic_tree, l_keys + ["submission_type"])
-            dic_jobs_to_submit[submission_type].append(job)  # type: ignore
+        for job in self._get_jobs_in_window(running_jobs, queuing_jobs):
+            submission_type = self.job_index[job].node["submission_type"]
+            dic_jobs_to_submit[submission_type].append(job)
 
         # Write submission files for each submission type
         dic_submission_files = {}
         for submission_type, list_of_jobs in dic_jobs_to_submit.items():
+            # Local jobs are not bundled, as the local executor runs them in parallel already
+            is_bundled = self.bundle_size is not None or self.bundle_walltime is not None
+            if is_bundled and submission_type != "local" and len(list_of_jobs) > 0:
+                list_of_jobs = self._bundle_jobs(
+                    list_of_jobs, submission_type, running_jobs, queuing_jobs
+                )
+
             if len(list_of_jobs) > 0:
                 # Write submission files
                 l_submission_filenames, list_of_jobs_updated = self._write_sub_files(
@@ -335,44 +916,88 @@ class ClusterSubmission:
 
         return dic_submission_files
 
-    def _update_job_status_from_hpc_output(
+    def _parse_hpc_output(
         self,
-        submit_command,
+        output,
         submission_type,
-        dic_id_to_path_job_temp,
+        dic_id_to_job_temp,
         list_of_jobs,
         idx_submission=0,
+        n_tasks=None,
     ):
-        process = subprocess.run(
-            submit_command.split(" "),
-            capture_output=True,
-        )
-
-        output = process.stdout.decode("utf-8")
-        output_error = process.stderr.decode("utf-8")
-        if "ERROR" in output_error:
-            raise RuntimeError(f"Error in submission: {output}")
         for line in output.split("\n"):
             if "htc" in submission_type:
+                # All the jobs of the manifest are in one cluster, e.g. "3 job(s) submitted to
+                # cluster 1234.", the process ids following the order of the manifest
                 if "cluster" in line:
+                    n_jobs = int(line.split(" job(s)")[0])
                     cluster_id = int(line.split("cluster ")[1][:-1])
-                    dic_id_to_path_job_temp[cluster_id] = self._return_abs_path_job(
-                        list_of_jobs[idx_submission]
-                    )[0]
-                    idx_submission += 1
+                    for proc_id in range(n_jobs):
+                        dic_id_to_job_temp[f"{cluster_id}.{proc_id}"] = list_of_jobs[
+                            idx_submission
+                        ]
+                        idx_submission += 1
+            elif n_tasks is not None:
+                # One id per array, each task being identified by <id>_<index of the task>
+                if "Submitted" in line:
+                    job_id = int(line.split(" ")[3])
+                    for idx_task in range(n_tasks):
+                        dic_id_to_job_temp[f"{job_id}_{idx_task}"] = list_of_jobs[idx_submission]
+                        idx_submission += 1
             elif "slurm" in submission_type:
                 if "Submitted" in line:
                     job_id = int(line.split(" ")[3])
-                    dic_id_to_path_job_temp[job_id] = self._return_abs_path_job(
-                        list_of_jobs[idx_submission]
-                    )[0]
+                    dic_id_to_job_temp[job_id] = list_of_jobs[idx_submission]
                     idx_submission += 1
 
-        return dic_id_to_path_job_temp, idx_submission
+        return dic_id_to_job_temp, idx_submission
+
+    def _submit_local(self, list_of_jobs, dependency_graph=None):
+        # The local executor starts each job once its parents succeeded, hence all the jobs of a
+        # branch can be given at once
+        dic_jobs = {}
+        dic_parents = {}
+        set_jobs = set(list_of_jobs)
+        for job in list_of_jobs:
+            l_parents = []
+            if dependency_graph is not None:
+                l_parents = [
+                    parent.file for parent in self.job_index[job].parents if not parent.is_finished
+                ]
+            if any(
+                parent not in set_jobs
+                and not self.local_executor.is_tracking(parent)
+                and not self.local_executor.has_succeeded(parent)
+                for parent in l_parents
+            ):
+                print(
+                    f"Warning, {job} depends on a job that is neither finished nor run locally."
+                    " Skipping it."
+                )
+                set_jobs.discard(job)
+                continue
+            dic_parents[job] = l_parents
+
+            # Resources used by the job in the pool
+            node = self.job_index[job].node
+            dic_jobs[job] = (
+                self._return_abs_path_job(job)[1].rstrip("/"),
+                node.get("cpus") or 1,
+                node.get("memory") or 0,
+            )
+            print(f'Submitting node "{self._return_abs_path_job(job)[1]}" to the local executor')
+
+        self.local_executor.path_runner = self.path_runner
+        self.local_executor.submit(dic_jobs, dic_parents, blocking=self.local_blocking)
 
-    def submit(self, list_of_jobs, l_submission_filenames, submission_type):
+    def submit(
+        self, list_of_jobs, l_submission_filenames, submission_type, dependency_graph=None
+    ):
         # Check that the submission file(s) is/are appropriate for the submission mode
-        if len(l_submission_filenames) > 1 and submission_type != "slurm_docker":
+        if len(l_submission_filenames) > 1 and submission_type not in [
+            "slurm_docker",
+            "slurm_array",
+        ]:
             raise ValueError(
                 "Error: Multiple submission files should not be implemented for this submission"
                 " mode"
@@ -382,187 +1007,451 @@ class ClusterSubmission:
         if len(l_submission_filenames) == 0:
             print("No job being submitted.")
 
-        # Submit
-        dic_id_to_path_job_temp = {}
-        idx_submission = 0
-        for sub_filename in l_submission_filenames:
-            if submission_type == "local":
-                os.system(self.dic_submission[submission_type].get_submit_command(sub_filename))
-            elif submission_type in ["htc", "slurm", "htc_docker", "slurm_docker"]:
-                submit_command = self.dic_submission[submission_type].get_submit_command(
-                    sub_filename
-                )
-                dic_id_to_path_job_temp, idx_submission = self._update_job_status_from_hpc_output(
-                    submit_command,
-                    submission_type,
-                    dic_id_to_path_job_temp,
-                    list_of_jobs,
-                    idx_submission,
-                )
-            else:
-                raise ValueError(f"Error: {submission_type} is not a valid submission mode")
-
-        # Update and write the id-job file
-        if dic_id_to_path_job_temp:
-            assert len(dic_id_to_path_job_temp) == len(list_of_jobs)
-
-        # Merge with the previous id-job file
-        dic_id_to_path_job = self.dic_id_to_path_job
+        # Local jobs are run by the local executor
+        if submission_type == "local":
+            # The submission file is only kept as a record of the submitted jobs
+            if l_submission_filenames:
+                self._submit_local(list_of_jobs, dependency_graph)
+        elif submission_type in ["htc", "slurm", "htc_docker", "slurm_docker", "slurm_array"]:
+            self._submit_hpc(list_of_jobs, l_submission_filenames, submission_type)
+        else:
+            raise ValueError(f"Error: {submission_type} is not a valid submission mode")
 
-        # Update and write on disk
-        if dic_id_to_path_job is not None:
-            dic_id_to_path_job.update(dic_id_to_path_job_temp)
-            self.dic_id_to_path_job = dic_id_to_path_job
-        elif dic_id_to_path_job_temp:
-            dic_id_to_path_job = dic_id_to_path_job_temp
-            self.dic_id_to_path_job = dic_id_to_path_job
+        # The submitted jobs are not in the snapshot yet
+        self.scheduler_snapshot.invalidate()
 
         print("Jobs status after submission:")
         running_jobs, queuing_jobs = self._get_state_jobs(verbose=True)
 
-    def _get_local_jobs(self):
-        l_path_jobs = []
-        # Warning, does not work at the moment in lxplus...
-        for ps in psutil.pids():
-            try:
-                aux = psutil.Process(ps).cmdline()
-            except Exception:
-                aux = []
-            if len(aux) > 1 and "run.sh" in aux[-1]:
-                job = str(Path(aux[-1]).parent)
-
-                # Only get path after name of the study
-                job = job.split(self.study_name)[1]
-                l_path_jobs.append(f"{self.study_name}{job}/")
-        return l_path_jobs
+    def _get_submission_units(self, list_of_jobs, l_submission_filenames, submission_type):
+        # Split the submission in independent submit commands, each with the jobs it submits (in
+        # the order of the ids in its output) and its number of array tasks
+        l_units = []
+        idx_job = 0
+        for sub_filename in l_submission_filenames:
+            # The plain Slurm submission file is a list of sbatch commands, one per job
+            if submission_type == "slurm":
+                with open(sub_filename) as fid:
+                    for line in fid:
+                        if line.startswith("sbatch"):
+                            l_units.append((line.strip(), ([list_of_jobs[idx_job]], None)))
+                            idx_job += 1
+                continue
+
+            # Otherwise, one command per submission file, which may submit several jobs
+            n_tasks = self.dic_n_tasks_array.get(sub_filename)
+            if "htc" in submission_type:
+                n_jobs = len(list_of_jobs)
+            else:
+                n_jobs = n_tasks if n_tasks is not None else 1
+            submit_command = self.dic_submission[submission_type].get_submit_command(sub_filename)
+            l_units.append((submit_command, (list_of_jobs[idx_job : idx_job + n_jobs], n_tasks)))
+            idx_job += n_jobs
+
+        return l_units
+
+    def _submit_hpc(self, list_of_jobs, l_submission_filenames, submission_type):
+        # The submit commands are run concurrently by the submission engine, each id being
+        # recorded as soon as it is parsed, so that an interrupted submission can be resumed
+        # without submitting the same jobs twice
+        def on_success(payload, output):
+            l_jobs_unit, n_tasks = payload
+            dic_id_to_job_unit, _ = self._parse_hpc_output(
+                output, submission_type, {}, l_jobs_unit, n_tasks=n_tasks
+            )
+            for id_job, job in dic_id_to_job_unit.items():
+                self._set_id_job(job, id_job, persist=True)
+
+        l_units = self._get_submission_units(list_of_jobs, l_submission_filenames, submission_type)
+        l_failures = self.submission_engine.submit(l_units, on_success)
+
+        # Fold the recorded ids into the index
+        self.id_index.write()
+        self._raise_failures([(l_jobs_unit, error) for (l_jobs_unit, _), error in l_failures])
+
+    def _raise_failures(self, l_failures):
+        # The jobs that could not be submitted will be submitted again by the next submission
+        if l_failures:
+            raise RuntimeError(
+                "Error in submission of "
+                + ", ".join(job for l_jobs_failed, _ in l_failures for job in l_jobs_failed)
+                + f": {l_failures[0][1]}"
+            )
 
-    def _get_condor_jobs(self, status, force_query_individually=False):
-        l_path_jobs = []
-        dic_status = {"running": 1, "queuing": 2}
-        condor_output = subprocess.run(["condor_q"], capture_output=True).stdout.decode("utf-8")
+    def _submit_dag_slurm(self, list_of_jobs):
+        # Jobs are submitted by waves, parents first, so that the ids of the parents are known when
+        # the children are submitted. The jobs of a wave are submitted concurrently by the
+        # submission engine, each id being recorded as soon as it is parsed.
+        def on_success(job, output):
+            dic_id_to_job_unit, _ = self._parse_hpc_output(output, "slurm", {}, [job])
+            for id_job in dic_id_to_job_unit:
+                self._set_id_job(job, id_job, persist=True)
+
+        dic_idx_jobs = {job: idx_job for idx_job, job in enumerate(list_of_jobs)}
+        l_jobs_left = list(list_of_jobs)
+        set_jobs_left = set(list_of_jobs)
+        l_failures = []
+        while l_jobs_left:
+            l_units = []
+            l_jobs_waiting = []
+            for job in l_jobs_left:
+                path_job, abs_path_job = self._return_abs_path_job(job)
 
-        # Check which jobs are running
-        first_line = True
-        first_missing_job = True
-        for line in condor_output.split("\n")[4:]:
-            if line == "":
+                # Get the ids of the parents that are not finished yet, the job waiting for the
+                # next wave if some of them are still to be submitted. The parents run in a bundle
+                # depend on the scheduler job of the bundle.
+                dic_ids_parents = {}
+                state_parents = "submitted"
+                for parent in self.job_index[job].parents:
+                    if parent.is_finished:
+                        continue
+                    id_parent = self.id_index.get_id(parent.file)
+                    if id_parent is not None:
+                        dic_ids_parents[get_id_scheduler(id_parent)] = None
+                    elif parent.file in set_jobs_left:
+                        state_parents = "waiting"
+                    else:
+                        state_parents = "missing"
+                        break
+                if state_parents == "waiting":
+                    l_jobs_waiting.append(job)
+                    continue
+                if state_parents == "missing":
+                    print(
+                        f"Warning, {path_job} depends on a job that is neither finished nor"
+                        " submitted. Skipping it."
+                    )
+                    continue
+                dependency = f"afterok:{':'.join(dic_ids_parents)}" if dic_ids_parents else None
+
+                # Get the submission command of the job (arrays can't express per-task
+                # dependencies, hence array jobs are submitted individually in this mode)
+                submission_type = self.job_index[job].node["submission_type"]
+                if submission_type == "slurm_array":
+                    submission_type = "slurm"
+                context = self.job_index[job].node["context"]
+                if submission_type == "slurm_docker":
+                    filename_sub = (
+                        f"{self.path_submission_file.split('.sub')[0]}_dag_{dic_idx_jobs[job]}.sub"
+                    )
+                    # ! Careful, same fix for path as for the other slurm_docker submissions
+                    Sub = self._get_Sub(
+                        job,
+                        submission_type,
+                        filename_sub,
+                        abs_path_job,
+                        context,
+                        dependency,
+                        fix=True,
+                    )
+                    with open(filename_sub, "w") as fid:
+                        fid.write(Sub.head + "\n")
+                        fid.write(Sub.str_fixed_run + "\n")
+                        fid.write(Sub.body + "\n")
+                        fid.write(Sub.tail + "\n")
+                    submit_command = Sub.get_submit_command(filename_sub)
+                else:
+                    Sub = self._get_Sub(
+                        job,
+                        submission_type,
+                        self.path_submission_file,
+                        abs_path_job,
+                        context,
+                        dependency,
+                    )
+                    submit_command = Sub.body
+                print(f'Submitting node "{abs_path_job}" with dependency {dependency}')
+                l_units.append((submit_command, job))
+
+            # Jobs whose parents could not be submitted are skipped by the next wave
+            if not l_units:
                 break
-            jobid = int(line.split("ID:")[1][1:8])
-            condor_status = line.split("      ")[1:5]  # Done, Run, Idle, and potentially Hold
-
-            # If job is running/queuing, get the path to the job
-            if condor_status[dic_status[status]] == "1":
-                # Get path from dic_id_to_path_job if available
-                if self.dic_id_to_path_job is not None:
-                    if jobid in self.dic_id_to_path_job:
-                        l_path_jobs.append(self.dic_id_to_path_job[jobid])
-                    elif first_missing_job:
-                        print(
-                            "Warning, some jobs are queuing/running and are not in the id-job"
-                            " file. They may come from another study. Ignoring them."
+            for job, error in self.submission_engine.submit(l_units, on_success):
+                l_failures.append(([job], error))
+            l_jobs_left = l_jobs_waiting
+            set_jobs_left = set(l_jobs_waiting)
+
+        # Fold the recorded ids into the index
+        self.id_index.write()
+        self._raise_failures(l_failures)
+
+    def _submit_dag_htc(self, list_of_jobs, dependency_graph):
+        filename_dag = f"{self.path_submission_file.split('.sub')[0]}.dag"
+
+        # Jobs whose unfinished parents are not in the DAG (e.g. already queuing) can't be added
+        l_jobs_dag = []
+        set_jobs_dag = set()
+        for job in list_of_jobs:
+            if all(
+                parent.is_finished or parent.file in set_jobs_dag
+                for parent in self.job_index[job].parents
+            ):
+                l_jobs_dag.append(job)
+                set_jobs_dag.add(job)
+            else:
+                print(
+                    f"Warning, {self._return_abs_path_job(job)[0]} depends on a job that is not"
+                    " part of the DAG. Skipping it."
+                )
+        dic_node_names = {job: f"job_{idx_job}" for idx_job, job in enumerate(l_jobs_dag)}
+
+        # One node submission file per submission type, with the job specific values in the DAG
+        dic_node_filenames = {}
+        with open(filename_dag, "w") as fid:
+            for job in l_jobs_dag:
+                path_job, abs_path_job = self._return_abs_path_job(job)
+                submission_type = self.job_index[job].node["submission_type"]
+                filename_node = (
+                    f"{self.path_submission_file.split('.sub')[0]}_dag_{submission_type}.sub"
+                )
+                path_image = None
+                if submission_type == "htc_docker":
+                    path_image = self.dic_tree.get("container_image")
+                    if path_image is None:
+                        raise ValueError(
+                            "Error: container_image is not defined in the tree. Please define it in"
+                            " the config.yaml file."
                         )
-                        first_missing_job = False
+                Sub = HTCDag(
+                    filename_node,
+                    abs_path_job,
+                    self.job_index[job].node["context"],
+                    dic_node_names[job],
+                    self._return_htc_flavour(job),
+                    path_image,
+                    resources=self._return_resources(job),
+                    path_runner=self.path_runner,
+                )
+                # The head sets the maximum runtime if any node has a walltime
+                if filename_node not in dic_node_filenames or Sub.walltime is not None:
+                    dic_node_filenames[filename_node] = Sub.head
+                print(f'Writing DAG node for "{abs_path_job}"')
+                fid.write(Sub.body + "\n")
+
+            # Jobs of a same folder share their parents, hence a single statement per folder
+            for l_parents, l_children in dependency_graph.get_dependency_groups(l_jobs_dag):
+                fid.write(
+                    f"PARENT {' '.join(dic_node_names[job] for job in l_parents)}"
+                    + f" CHILD {' '.join(dic_node_names[job] for job in l_children)}\n"
+                )
 
-                elif force_query_individually:
-                    if first_line:
-                        print(
-                            "Warning, some jobs are queuing/running and the id-job file is"
-                            " missing... Querying them individually."
+        for filename_node, head in dic_node_filenames.items():
+            with open(filename_node, "w") as fid:
+                fid.write(head + "\n")
+
+        # Submit the DAG. Only the id of the DAGMan job is returned, not the ones of the nodes,
+        # hence the nodes are recorded with the id of the DAGMan job and their index in the DAG,
+        # like the jobs of a bundle: they are running or queuing as long as DAGMan is.
+        def on_success(l_jobs, output):
+            print(output)
+            for line in output.split("\n"):
+                if "cluster" in line:
+                    cluster_id = int(line.split("cluster ")[1].strip().rstrip("."))
+                    for idx_job, job in enumerate(l_jobs):
+                        self._set_id_job(
+                            job, get_id_key_bundle_member(cluster_id, idx_job), persist=True
                         )
-                        first_line = False
-                    job_details = subprocess.run(
-                        ["condor_q", "-l", f"{jobid}"], capture_output=True
-                    ).stdout.decode("utf-8")
-                    job = job_details.split('Cmd = "')[1].split("run.sh")[0]
 
-                    # Only get path after master_study
-                    job = job.split(self.study_name)[1]
-                    l_path_jobs.append(f"{self.study_name}{job}")
+        if l_jobs_dag:
+            l_failures = self.submission_engine.submit(
+                [(HTCDag.get_submit_command(filename_dag), l_jobs_dag)], on_success
+            )
+            self.id_index.write()
+            self._raise_failures(l_failures)
 
-                elif first_line:
-                    print(
-                        "Warning, some jobs are queuing/running and the id-job file is"
-                        " missing... Ignoring them."
-                    )
-                    first_line = False
+    def submit_dag(self, dependency_graph: DependencyGraph):
+        # Submit all the generations at once, each job starting as soon as its parents succeed
+        check_local, check_htc, check_slurm = self._check_submission_type()
+
+        # Create folder to the submission files if it does not exist
+        os.makedirs(os.path.dirname(self.path_submission_file), exist_ok=True)
+
+        # Keep the jobs that are not completed, running or queuing (parents come first)
+        running_jobs, queuing_jobs = self._get_state_jobs(verbose=False)
+        list_of_jobs = [
+            job
+            for job in self.l_jobs_to_submit
+            if self._test_job(job, self._return_abs_path_job(job)[0], running_jobs, queuing_jobs)
+        ]
+        # Local jobs are handled by the local executor, with the same dependencies
+        l_jobs_local = [
+            job for job in list_of_jobs if self.job_index[job].node["submission_type"] == "local"
+        ]
+        if l_jobs_local:
+            set_jobs_local = set(l_jobs_local)
+            list_of_jobs = [job for job in list_of_jobs if job not in set_jobs_local]
+
+        if len(list_of_jobs) == 0 and len(l_jobs_local) == 0:
+            print("No job being submitted.")
+        elif check_htc:
+            self._submit_dag_htc(list_of_jobs, dependency_graph)
+        elif check_slurm:
+            self._submit_dag_slurm(list_of_jobs)
+        if l_jobs_local:
+            self._submit_local(l_jobs_local, dependency_graph)
+
+        # The submitted jobs are not in the snapshot yet
+        self.scheduler_snapshot.invalidate()
+
+        print("Jobs status after submission:")
+        running_jobs, queuing_jobs = self._get_state_jobs(verbose=True)
 
+    def _get_local_jobs(self, status="running"):
+        # Jobs run by the local executor are known directly, and the jobs started by another
+        # session are found in the run registry of the study
+        if status == "queuing":
+            # Only the local executor queues jobs
+            return [
+                self._return_abs_path_job(job)[0] for job in self.local_executor.get_queuing_jobs()
+            ]
+
+        l_path_jobs = [
+            self._return_abs_path_job(job)[0] for job in self.local_executor.get_running_jobs()
+        ]
+        set_path_jobs = set(l_path_jobs)
+        for job in self.scheduler_snapshot.get_local_folders():
+            # Only get path after name of the study
+            if self.study_name in job:
+                path_job = f"{self.study_name}{job.split(self.study_name)[1]}/"
+                if path_job not in set_path_jobs:
+                    set_path_jobs.add(path_job)
+                    l_path_jobs.append(path_job)
         return l_path_jobs
 
-    def _get_slurm_jobs(self, status, force_query_individually=False):
-        l_path_jobs = []
-        dic_status = {"running": "RUNNING", "queuing": "PENDING"}
-        username = (
-            subprocess.run(["id", "-u", "-n"], capture_output=True).stdout.decode("utf-8").strip()
-        )
-        slurm_output = subprocess.run(
-            ["squeue", "-u", f"{username}", "-t", dic_status[status]], capture_output=True
-        ).stdout.decode("utf-8")
+    def _get_job_folder_from_command(self, jobid, l_details, dic_manifests):
+        # The folder of the job is given by the run.sh it runs, or the manifest line of its array
+        # task, or its output file, and otherwise its working directory
+        command = l_details[-1]
+        if "run.sh" in command:
+            return command.split("run.sh")[0]
+        if RUNNER_FILENAME in command and len(command.split()) > 1:
+            return command.split()[-1]
+        if command.endswith(".sub") and "_" in jobid:
+            path_manifest = f"{command.split('.sub')[0]}.txt"
+            if path_manifest not in dic_manifests:
+                try:
+                    with open(path_manifest) as fid:
+                        dic_manifests[path_manifest] = fid.read().split("\n")
+                except OSError:
+                    dic_manifests[path_manifest] = []
+            idx_task = int(jobid.split("_")[1])
+            if idx_task < len(dic_manifests[path_manifest]):
+                return dic_manifests[path_manifest][idx_task]
+            return None
+        if len(l_details) > 2 and l_details[1].endswith("output.txt"):
+            return l_details[1].split("output.txt")[0]
+        return l_details[0]
+
+    def _recover_ids(self, dic_commands):
+        # Rebuild the id index from the folders of all the jobs, obtained in a single query
+        dic_path_job_to_job = {
+            self._return_abs_path_job(job.file)[0]: job.file for job in self.job_index.jobs()
+        }
+        dic_manifests = {}
+        for jobid, l_details in dic_commands.items():
+            folder = self._get_job_folder_from_command(jobid, l_details, dic_manifests)
+            if folder is None or self.study_name not in folder:
+                continue
+
+            # Only get path after study_name
+            path_job = f"{self.study_name}{folder.split(self.study_name)[1].rstrip('/')}/"
+            if path_job in dic_path_job_to_job:
+                self._set_id_job(dic_path_job_to_job[path_job], jobid)
+
+            # The jobs of a bundle are listed in its folder
+            elif os.path.exists(f"{folder.rstrip('/')}/members.txt"):
+                with open(f"{folder.rstrip('/')}/members.txt") as fid:
+                    l_folders = fid.read().split()
+                for idx_member, folder_member in enumerate(l_folders):
+                    path_member = f"{self.study_name}{folder_member.split(self.study_name)[1]}/"
+                    if path_member in dic_path_job_to_job:
+                        self._set_id_job(
+                            dic_path_job_to_job[path_member],
+                            get_id_key_bundle_member(jobid, idx_member),
+                        )
+
+        # Persist the index, so that later runs don't need to recover it
+        self.id_index.write()
 
-        # Get job id and details
-        first_line = True
+    def _get_path_job_from_scheduler(
+        self, dic_states, status, get_jobs, get_commands, force_query_individually
+    ):
+        l_path_jobs = []
         first_missing_job = True
-        for line in slurm_output.split("\n")[1:]:
-            l_split = line.split()
-            if len(l_split) == 0:
-                break
-            jobid = int(l_split[0])
-            slurm_status = l_split[4]  # R or PD  # noqa: F841
-
-            # Get path from dic_id_to_path_job if available
-            if self.dic_id_to_path_job is not None:
-                if jobid in self.dic_id_to_path_job:
-                    l_path_jobs.append(self.dic_id_to_path_job[jobid])
-                elif first_missing_job:
-                    print(
-                        "Warning, some jobs are queuing/running and are not in the id-job"
-                        " file. They may come from another study. Ignoring them."
-                    )
-                    first_missing_job = False
 
-            elif force_query_individually:
-                if first_line:
-                    print(
-                        "Warning, some jobs are queuing/running and the id-job file is"
-                        " missing... Querying them individually."
-                    )
-                    first_line = False
-                job_details = subprocess.run(
-                    ["scontrol", "show", "jobid", "-dd", f"{jobid}"], capture_output=True
-                ).stdout.decode("utf-8")
-                job = (
-                    job_details.split("Command=")[1].split("run.sh")[0]
-                    if "run.sh" in job_details
-                    else job_details.split("StdOut=")[1].split("output.txt")[0]
-                )
-                # Only get path after study_name
-                job = job.split(self.study_name)[1]
-                l_path_jobs.append(f"{self.study_name}{job}")
+        # Without index, the ids are recovered from the commands of all the jobs at once
+        if len(self.id_index) == 0 and force_query_individually and dic_states:
+            print(
+                "Warning, some jobs are queuing/running and the id-job file is missing..."
+                " Recovering it from the scheduler."
+            )
+            self._recover_ids(get_commands())
 
-            elif first_line:
+        if len(self.id_index) == 0:
+            if status in dic_states.values():
                 print(
                     "Warning, some jobs are queuing/running and the id-job file is"
                     " missing... Ignoring them."
                 )
-                first_line = False
+            return l_path_jobs
+
+        for jobid, state in dic_states.items():
+            if state != status:
+                continue
+
+            # Get path from the id index (several jobs for a bundle)
+            l_jobs = get_jobs(jobid)
+            if l_jobs:
+                l_path_jobs.extend(self._return_abs_path_job(job)[0] for job in l_jobs)
+            elif first_missing_job:
+                print(
+                    "Warning, some jobs are queuing/running and are not in the id-job"
+                    " file. They may come from another study. Ignoring them."
+                )
+                first_missing_job = False
 
         return l_path_jobs
 
+    def _get_condor_jobs(self, status, force_query_individually=False):
+        def get_jobs(jobid):
+            # Jobs submitted one cluster per job are recorded with their cluster id only
+            l_jobs = self.id_index.get_jobs(jobid)
+            return l_jobs if l_jobs else self.id_index.get_jobs(jobid.split(".")[0])
+
+        return self._get_path_job_from_scheduler(
+            self.scheduler_snapshot.get_condor_states(),
+            status,
+            get_jobs,
+            self.scheduler_snapshot.get_condor_commands,
+            force_query_individually,
+        )
+
+    def _get_slurm_jobs(self, status, force_query_individually=False):
+        return self._get_path_job_from_scheduler(
+            self.scheduler_snapshot.get_slurm_states(),
+            status,
+            self.id_index.get_jobs,
+            self.scheduler_snapshot.get_slurm_commands,
+            force_query_individually,
+        )
+
     def querying_jobs(
-        self, check_local: bool, check_htc: bool, check_slurm: bool, status="running"
+        self,
+        check_local: bool,
+        check_htc: bool,
+        check_slurm: bool,
+        status="running",
+        force_query_individually=False,
     ):
         # sourcery skip: remove-redundant-if, remove-redundant-pass, swap-nested-ifs
         l_path_jobs = []
         if check_local:
-            if status == "running":
-                l_path_jobs.extend(self._get_local_jobs())
-            else:
-                # Always empty return as there is no queuing in local pc
-                pass
+            l_path_jobs.extend(self._get_local_jobs(status))
 
         if check_htc:
-            l_path_jobs.extend(self._get_condor_jobs(status))
+            l_path_jobs.extend(self._get_condor_jobs(status, force_query_individually))
 
         if check_slurm:
-            l_path_jobs.extend(self._get_slurm_jobs(status))
+            l_path_jobs.extend(self._get_slurm_jobs(status, force_query_individually))
 
         return l_path_jobs
@@ -0,0 +1,202 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import subprocess
+import threading
+import time
+from typing import Self
+
+
+# ==================================================================================================
+# --- Class
+# ==================================================================================================
+class LocalExecutor:
+    def __init__(
+        self: Self,
+        max_workers: int | None = None,
+        max_memory: float | None = None,
+        poll_interval: float = 0.5,
+    ):
+        # Number of cores shared by the jobs (each job using its number of cpus), and memory (in
+        # MB) shared by the jobs, not limited if None
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+        self.max_memory = max_memory
+        self.poll_interval = poll_interval
+
+        # Jobs waiting for their parents or for free resources, in submission order, with their
+        # folder and resources, and the parents each job waits for
+        self.dic_pending: dict[str, tuple[str, int, float]] = {}
+        self.dic_parents: dict[str, list[str]] = {}
+
+        # Jobs started, with their process, and exit code of the jobs that are done (None if
+        # cancelled because a parent failed)
+        self.dic_processes: dict[str, subprocess.Popen] = {}
+        self.dic_exit_codes: dict[str, int | None] = {}
+        self._dic_resources: dict[str, tuple[int, float]] = {}
+
+        # Runner of the study, run with the folder of the job instead of its run.sh if given
+        self.path_runner = None
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ==============================================================================================
+    # --- Methods to submit and wait for jobs
+    # ==============================================================================================
+    def submit(
+        self: Self,
+        dic_jobs: dict[str, tuple[str, int, float]],
+        dic_parents: dict[str, list[str]] | None = None,
+        blocking: bool = False,
+    ):
+        # dic_jobs maps each job to its folder (containing run.sh, unless the runner of the study is
+        # used) and its resources (cpus, memory). dic_parents maps each job to the parents it waits
+        # for (submitted to the executor before it, or with it), the job only starting once they
+        # all succeeded. Readiness is tracked by the executor itself, so that its thread never
+        # modifies the dependency graph used by the submissions.
+        with self._lock:
+            for job, job_spec in dic_jobs.items():
+                if job not in self.dic_processes:
+                    self.dic_pending[job] = job_spec
+                    self.dic_parents[job] = list((dic_parents or {}).get(job, []))
+                    self.dic_exit_codes.pop(job, None)
+
+            # The ready jobs are started right away, the others are started and followed from a
+            # background thread. The thread doesn't prevent the interpreter from exiting: the jobs
+            # started keep running in their own session, but the pending ones are not started
+            # anymore (use wait, or blocking, to wait for them).
+            self._start_ready_jobs()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="LocalExecutor", daemon=True)
+                self._thread.start()
+
+        if blocking:
+            self.wait()
+
+    def wait(self: Self):
+        # Block until all the jobs are done (or can't be started)
+        if self._thread is not None:
+            self._thread.join()
+
+    def terminate(self: Self):
+        # Kill the running jobs and forget about the pending ones
+        with self._lock:
+            self.dic_pending = {}
+            self.dic_parents = {}
+            for process in self.dic_processes.values():
+                process.terminate()
+
+    # ==============================================================================================
+    # --- Methods to get the state of the jobs
+    # ==============================================================================================
+    def get_running_jobs(self: Self) -> list[str]:
+        with self._lock:
+            return list(self.dic_processes)
+
+    def get_queuing_jobs(self: Self) -> list[str]:
+        with self._lock:
+            return list(self.dic_pending)
+
+    def get_pids(self: Self) -> dict[str, int]:
+        with self._lock:
+            return {job: process.pid for job, process in self.dic_processes.items()}
+
+    def is_tracking(self: Self, job: str) -> bool:
+        with self._lock:
+            return job in self.dic_pending or job in self.dic_processes
+
+    def has_succeeded(self: Self, job: str) -> bool:
+        with self._lock:
+            return self.dic_exit_codes.get(job) == 0
+
+    # ==============================================================================================
+    # --- Internal methods
+    # ==============================================================================================
+    def _is_ready(self: Self, job: str) -> bool:
+        return all(self.dic_exit_codes.get(parent) == 0 for parent in self.dic_parents[job])
+
+    def _is_cancelled(self: Self, job: str) -> bool:
+        # A parent failed (or was cancelled), hence the job can never run
+        return any(
+            parent in self.dic_exit_codes and self.dic_exit_codes[parent] != 0
+            for parent in self.dic_parents[job]
+        )
+
+    def _get_used_resources(self: Self) -> tuple[int, float]:
+        used_cpus = 0
+        used_memory = 0.0
+        for job in self.dic_processes:
+            used_cpus += self._dic_resources[job][0]
+            used_memory += self._dic_resources[job][1]
+        return used_cpus, used_memory
+
+    def _start_ready_jobs(self: Self):
+        used_cpus, used_memory = self._get_used_resources()
+        for job, (folder, cpus, memory) in list(self.dic_pending.items()):
+            # The pending jobs are in submission order, parents first, hence the cancellation of
+            # a job is propagated to its descendants in a single pass
+            if self._is_cancelled(job):
+                del self.dic_pending[job]
+                del self.dic_parents[job]
+                self.dic_exit_codes[job] = None
+                print(f"Warning, {job} is cancelled as one of its parents failed.")
+                continue
+            if not self._is_ready(job):
+                continue
+
+            # A job larger than the available resources can still run alone
+            if self.dic_processes and (
+                used_cpus + cpus > self.max_workers
+                or (self.max_memory is not None and used_memory + memory > self.max_memory)
+            ):
+                continue
+
+            # Each job in its own session, so that it is not killed with the submitting process
+            l_command = ["bash", f"{folder}/run.sh"]
+            if self.path_runner is not None:
+                l_command = ["bash", self.path_runner, folder]
+            with open(f"{folder}/output.txt", "w") as f_out, open(
+                f"{folder}/error.txt", "w"
+            ) as f_err:
+                self.dic_processes[job] = subprocess.Popen(
+                    l_command,
+                    cwd=folder,
+                    stdout=f_out,
+                    stderr=f_err,
+                    start_new_session=True,
+                )
+            self._dic_resources[job] = (cpus, memory)
+            del self.dic_pending[job]
+            del self.dic_parents[job]
+            used_cpus += cpus
+            used_memory += memory
+
+    def _collect_finished_jobs(self: Self):
+        for job, process in list(self.dic_processes.items()):
+            exit_code = process.poll()
+            if exit_code is None:
+                continue
+            del self.dic_processes[job]
+            del self._dic_resources[job]
+            self.dic_exit_codes[job] = exit_code
+
+    def _run(self: Self):
+        while True:
+            with self._lock:
+                self._collect_finished_jobs()
+                self._start_ready_jobs()
+
+                # Stop when nothing runs anymore (pending jobs left are waiting for parents that
+                # are not handled by the executor)
+                if not self.dic_processes:
+                    if self.dic_pending:
+                        print(
+                            "Warning, some local jobs depend on jobs that are not run by the"
+                            f" local executor, they are not started: {list(self.dic_pending)}"
+                        )
+                        self.dic_pending = {}
+                        self.dic_parents = {}
+                    return
+            time.sleep(self.poll_interval)
@@ -0,0 +1,193 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import subprocess
+import time
+from pathlib import Path
+from typing import Self
+
+# Third party imports
+import psutil
+
+# Local imports
+from ..generate_run import RUNNER_FILENAME
+from ..utils.run_registry import get_running_folders
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# States reported by the schedulers, mapped to the states used in the study
+DIC_CONDOR_STATES = {"2": "running", "1": "queuing"}  # JobStatus 2: Running, 1: Idle
+DIC_SLURM_STATES = {"RUNNING": "running", "PENDING": "queuing"}
+
+
+# ==================================================================================================
+# --- Class
+# ==================================================================================================
+class SchedulerSnapshot:
+    def __init__(self: Self, ttl: float = 10.0, path_tree: str | None = None):
+        # The schedulers are queried at most once per backend every ttl seconds, the result being
+        # shared by everything that needs the state of the jobs in the meantime
+        self.ttl = ttl
+
+        # Local jobs are found in the run registry of the tree, if any, and otherwise by scanning
+        # all the processes
+        self.path_tree = path_tree
+        self._dic_snapshots = {}
+        self._username = None
+
+    def invalidate(self: Self):
+        # E.g. after a submission, as the new jobs are not in the snapshot yet
+        self._dic_snapshots = {}
+
+    def _get(self: Self, backend: str, query):
+        snapshot = self._dic_snapshots.get(backend)
+        if snapshot is None or time.monotonic() - snapshot[0] > self.ttl:
+            snapshot = (time.monotonic(), query())
+            self._dic_snapshots[backend] = snapshot
+        return snapshot[1]
+
+    def get_condor_states(self: Self) -> dict[str, str]:
+        # Id (<cluster>.<proc>) to state of all the running or queuing HTCondor jobs
+        return self._get("htc", self._query_condor)
+
+    def get_slurm_states(self: Self) -> dict[str, str]:
+        # Id (<id> or <id>_<index of the task>) to state of all the running or queuing Slurm jobs
+        return self._get("slurm", self._query_slurm)
+
+    def get_condor_commands(self: Self) -> dict[str, tuple[str, ...]]:
+        # Id to (working directory, command) of all the HTCondor jobs, in a single query
+        return self._get("htc_commands", self._query_condor_commands)
+
+    def get_slurm_commands(self: Self) -> dict[str, tuple[str, ...]]:
+        # Id to (working directory, standard output, command) of all the Slurm jobs, in a single
+        # query
+        return self._get("slurm_commands", self._query_slurm_commands)
+
+    def get_local_folders(self: Self) -> list[str]:
+        # Folders of the run.sh files running on the local pc
+        return self._get("local", self._query_local)
+
+    @staticmethod
+    def _query_condor() -> dict[str, str]:
+        condor_output = subprocess.run(
+            ["condor_q", "-af:j", "JobStatus"], capture_output=True
+        ).stdout.decode("utf-8")
+
+        dic_states = {}
+        for line in condor_output.split("\n"):
+            l_split = line.split()
+            if len(l_split) >= 2 and l_split[1] in DIC_CONDOR_STATES:
+                dic_states[l_split[0]] = DIC_CONDOR_STATES[l_split[1]]
+
+        # With late materialization (max_materialize or max_idle), the jobs not materialized yet
+        # are only known from the factory of their cluster, and are queuing as long as it exists
+        factory_output = subprocess.run(
+            [
+                "condor_q",
+                "-factory",
+                "-af",
+                "ClusterId",
+                "JobMaterializeNextProcId",
+                "TotalSubmitProcs",
+            ],
+            capture_output=True,
+        ).stdout.decode("utf-8")
+        for line in factory_output.split("\n"):
+            l_split = line.split()
+            if len(l_split) == 3 and all(field.isdigit() for field in l_split):
+                cluster_id, next_proc_id, n_procs = l_split
+                for proc_id in range(int(next_proc_id), int(n_procs)):
+                    dic_states.setdefault(f"{cluster_id}.{proc_id}", "queuing")
+        return dic_states
+
+    @staticmethod
+    def _query_condor_commands() -> dict[str, tuple[str, ...]]:
+        # Fields are separated by commas, the arguments (e.g. the folder given to the runner)
+        # being the last one, so that they are kept whole
+        condor_output = subprocess.run(
+            ["condor_q", "-af:,", "ClusterId", "ProcId", "Iwd", "Cmd", "Args"], capture_output=True
+        ).stdout.decode("utf-8")
+
+        dic_commands = {}
+        for line in condor_output.split("\n"):
+            l_split = [field.strip() for field in line.split(",", 4)]
+            if len(l_split) == 5:
+                command = l_split[3] if l_split[4] == "undefined" else " ".join(l_split[3:])
+                dic_commands[f"{l_split[0]}.{l_split[1]}"] = (l_split[2], command)
+        return dic_commands
+
+    def _get_username(self: Self) -> str:
+        # The username never changes, no need to ask for it at every query
+        if self._username is None:
+            self._username = (
+                subprocess.run(["id", "-u", "-n"], capture_output=True)
+                .stdout.decode("utf-8")
+                .strip()
+            )
+        return self._username
+
+    def _query_slurm_commands(self: Self) -> dict[str, tuple[str, ...]]:
+        # Fields are given a large width and separated by "|", the command (with its arguments,
+        # e.g. the folder given to the runner) being the last one, so that it is kept whole
+        slurm_output = subprocess.run(
+            [
+                "squeue",
+                "--array",
+                "--noheader",
+                "-u",
+                self._get_username(),
+                "-O",
+                "JobArrayID:64|,WorkDir:1024|,StdOut:1024|,Command:4096",
+            ],
+            capture_output=True,
+        ).stdout.decode("utf-8")
+
+        dic_commands = {}
+        for line in slurm_output.split("\n"):
+            l_split = [field.strip() for field in line.split("|", 3)]
+            if len(l_split) == 4:
+                dic_commands[l_split[0]] = (l_split[1], l_split[2], l_split[3])
+        return dic_commands
+
+    def _query_slurm(self: Self) -> dict[str, str]:
+        # Array tasks are listed individually (as <id>_<index of the task>), without header
+        slurm_output = subprocess.run(
+            [
+                "squeue",
+                "--array",
+                "--noheader",
+                "-u",
+                self._get_username(),
+                "-t",
+                ",".join(DIC_SLURM_STATES),
+                "-o",
+                "%i %T",
+            ],
+            capture_output=True,
+        ).stdout.decode("utf-8")
+
+        dic_states = {}
+        for line in slurm_output.split("\n"):
+            l_split = line.split()
+            if len(l_split) >= 2 and l_split[1] in DIC_SLURM_STATES:
+                dic_states[l_split[0]] = DIC_SLURM_STATES[l_split[1]]
+        return dic_states
+
+    def _query_local(self: Self) -> list[str]:
+        if self.path_tree is not None:
+            return get_running_folders(self.path_tree)
+
+        l_folders = []
+        # Warning, does not work at the moment in lxplus...
+        for ps in psutil.pids():
+            try:
+                aux = psutil.Process(ps).cmdline()
+            except Exception:
+                aux = []
+            if len(aux) > 1 and "run.sh" in aux[-1]:
+                l_folders.append(str(Path(aux[-1]).parent))
+            elif len(aux) > 2 and aux[-2].endswith(RUNNER_FILENAME):
+                l_folders.append(aux[-1])
+        return l_folders
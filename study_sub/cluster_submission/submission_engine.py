@@ -0,0 +1,143 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import asyncio
+import random
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Self
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Errors due to a busy or throttling scheduler, for which the submission is retried later. The
+# messages are specific, as retrying a submission rejected for good only delays the error.
+TRANSIENT_ERRORS = [
+    "socket timed out",
+    "resource temporarily unavailable",
+    "connection refused",
+    "failed to connect",
+    "try again",
+    "violates accounting/qos policy",
+    "qosmaxsubmitjob",
+    "unable to contact slurm controller",
+    "slurm_persist_conn",
+    "can't find address of local schedd",
+    "failed to end classad message",
+]
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def is_transient_error(output: str) -> bool:
+    output = output.lower()
+    return any(error in output for error in TRANSIENT_ERRORS)
+
+
+def run_coroutine(coroutine):
+    # asyncio.run can't be used from a running event loop (e.g. in a notebook), in which case the
+    # coroutine is run in its own thread
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+# ==================================================================================================
+# --- Classes
+# ==================================================================================================
+class TokenBucket:
+    def __init__(self: Self, rate: float, capacity: float):
+        # rate tokens are added per second, up to capacity
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+
+    async def acquire(self: Self):
+        # Only used from a single event loop, hence no lock is needed
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SubmissionEngine:
+    def __init__(
+        self: Self,
+        max_parallel: int = 4,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        # At most max_parallel submit commands run at once, at most rate commands are started per
+        # second (with bursts of up to burst commands), and transient errors are retried up to
+        # max_retries times, waiting backoff_base * 2**attempt seconds (capped to backoff_max)
+        self.max_parallel = max_parallel
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def submit(
+        self: Self,
+        l_units: list[tuple[str, Any]],
+        on_success: Callable[[Any, str], None],
+    ) -> list[tuple[Any, str]]:
+        # Each unit is a submit command with its payload (e.g. the jobs it submits). on_success is
+        # called with the payload and the output of the command as soon as a command succeeds, so
+        # that the ids are recorded even if the run is interrupted. The units that failed are
+        # returned with their error.
+        return run_coroutine(self._submit(l_units, on_success))
+
+    async def _submit(self: Self, l_units, on_success):
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        token_bucket = TokenBucket(self.rate, self.burst)
+        l_failures = []
+
+        async def submit_unit(submit_command, payload):
+            for attempt in range(self.max_retries + 1):
+                async with semaphore:
+                    await token_bucket.acquire()
+                    returncode, output, output_error = await self._run(submit_command)
+                if returncode == 0 and "ERROR" not in output_error:
+                    on_success(payload, output)
+                    return
+
+                # Retry transient errors with an exponential backoff (with jitter, so that the
+                # retries are spread), without holding a slot in the meantime
+                if attempt < self.max_retries and is_transient_error(output + output_error):
+                    delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+                    print(
+                        f"Warning, transient error when running {submit_command}, retrying in"
+                        f" {delay:.0f}s: {output_error.strip()}"
+                    )
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                else:
+                    l_failures.append((payload, f"{output}{output_error}".strip()))
+                    return
+
+        await asyncio.gather(*(submit_unit(command, payload) for command, payload in l_units))
+        return l_failures
+
+    @staticmethod
+    async def _run(submit_command):
+        process = await asyncio.create_subprocess_exec(
+            *shlex.split(submit_command),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        return process.returncode, stdout.decode("utf-8"), stderr.decode("utf-8")
@@ -2,17 +2,108 @@
 # --- Imports
 # ==================================================================================================
 # Standard library imports
+import math
+
+# Local imports
+from ..generate_run import get_run_command
+
+# ! Ugly fix, will need to be removed when INFN is fixed
+INFN_PATH_TO_REPLACE = "/storage-hpc/gpfs_data/HPC/home_recovery"
+INFN_PATH_REPLACEMENT = "/home/HPC"
+
+# Maximum runtime (in minutes) of the HTCondor flavours, from the shortest to the longest
+DIC_HTC_FLAVOURS_MAX_RUNTIME = {
+    "espresso": 20,
+    "microcentury": 60,
+    "longlunch": 120,
+    "workday": 480,
+    "tomorrow": 1440,
+    "testmatch": 4320,
+    "nextweek": 10080,
+}
+
+# Memory (in MB) requested per cpu on HTCondor when the memory of the job is not given
+HTC_DEFAULT_MEMORY_PER_CPU = 2000
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def fix_infn_path(path):
+    return path.replace(INFN_PATH_TO_REPLACE, INFN_PATH_REPLACEMENT)
+
+
+def get_htc_flavour(walltime):
+    # Shortest flavour allowing the walltime (in minutes) of the job
+    for htc_flavor, max_runtime in DIC_HTC_FLAVOURS_MAX_RUNTIME.items():
+        if walltime <= max_runtime:
+            return htc_flavor
+    return htc_flavor
+
+
+def get_htc_path_manifest(sub_filename):
+    return f"{sub_filename.split('.sub')[0]}_manifest.txt"
+
+
+def get_htc_executable(folder_variable, path_runner=None):
+    # The job folder is given to the runner of the study as argument
+    if path_runner is None:
+        return f"executable = $({folder_variable})/run.sh\n"
+    return f"executable = {path_runner}\narguments = $({folder_variable})\n"
+
+
+def get_htc_common_head(
+    max_materialize=None, max_idle=None, path_runner=None, max_runtime=True
+):
+    # Job specific values are taken from the manifest, note that the flavour must be set before
+    # the queue statement to apply to the job. The maximum runtime is only set if a job of the
+    # submission has a walltime (the others being limited by their flavour only).
+    head = (
+        "error  = error.txt\n"
+        + "output = output.txt\n"
+        + "log  = log.txt\n"
+        + "initialdir = $(initialdir)\n"
+        + get_htc_executable("initialdir", path_runner)
+        + "request_GPUs = $(request_GPUs)\n"
+        + "request_CPUs = $(request_CPUs)\n"
+        + "request_memory = $(request_memory)\n"
+        + '+JobFlavour = "$(flavour)"'
+    )
+    if max_runtime:
+        head += "\n+MaxRuntime = $(max_runtime)"
+
+    # Limit the number of jobs materialized (or idle) at once in the schedd
+    if max_materialize is not None:
+        head += f"\nmax_materialize = {max_materialize}"
+    if max_idle is not None:
+        head += f"\nmax_idle = {max_idle}"
+    return head
+
+
+def get_htc_manifest_line(path_job_folder, htc_flavor, request_GPUs, l_resources):
+    return f"{path_job_folder}, {htc_flavor}, {request_GPUs}, {', '.join(map(str, l_resources))}"
+
+
+def get_htc_queue_statement(sub_filename):
+    return (
+        "queue initialdir, flavour, request_GPUs, request_CPUs, request_memory, max_runtime from"
+        f" {get_htc_path_manifest(sub_filename)}"
+    )
+
 
 # ==================================================================================================
 # --- Class for job submission
 # ==================================================================================================
 class SubmissionStatement:
-    def __init__(self, sub_filename, path_job_folder, context):
+    def __init__(self, sub_filename, path_job_folder, context, resources=None, path_runner=None):
         self.sub_filename = sub_filename
         self.path_job_folder = (
             path_job_folder[:-1] if path_job_folder[-1] == "/" else path_job_folder
         )
 
+        # Runner of the study, replacing the run.sh of the job if given
+        self.path_runner = path_runner
+
         # GPU configuration
         if context in ["cupy", "opencl"]:
             self.request_GPUs = 1
@@ -21,13 +112,58 @@ class SubmissionStatement:
             self.request_GPUs = 0
             self.slurm_queue_statement = "#SBATCH --partition=slurm_hpc_acc"
 
+        # Resources of the job, i.e. cpus, memory (in MB) and walltime (in minutes), the defaults of
+        # the submission mode being used for the ones not given
+        resources = resources if resources is not None else {}
+        self.cpus = resources.get("cpus")
+        self.memory = resources.get("memory")
+        self.walltime = resources.get("walltime")
+
+    def get_slurm_options(self):
+        # Two tasks by default, as before the resources could be set
+        if self.cpus is None:
+            l_options = ["--ntasks=2"]
+        else:
+            l_options = ["--ntasks=1", f"--cpus-per-task={self.cpus}"]
+        # Slurm only accepts whole numbers of MB and minutes
+        if self.memory is not None:
+            l_options.append(f"--mem={math.ceil(self.memory)}M")
+        if self.walltime is not None:
+            l_options.append(f"--time={math.ceil(self.walltime)}")
+        return l_options
+
+    def get_slurm_directives(self):
+        return "\n".join(f"#SBATCH {option}" for option in self.get_slurm_options())
+
+    def get_run_command(self):
+        return get_run_command(self.path_job_folder, self.path_runner)
+
+    def get_htc_flavour_job(self, htc_flavor):
+        # Flavour of the job, from its walltime if not given (the shortest one otherwise)
+        if htc_flavor is not None:
+            return htc_flavor
+        if self.walltime is not None:
+            return get_htc_flavour(self.walltime)
+        return next(iter(DIC_HTC_FLAVOURS_MAX_RUNTIME))
+
+    def get_htc_resources(self):
+        # Cpus, memory (in MB) and maximum runtime (in seconds). Without walltime, the maximum
+        # runtime is undefined, i.e. only limited by the flavour (the attribute being shared by all
+        # the jobs of the submission file)
+        request_CPUs = self.cpus if self.cpus is not None else 1
+        request_memory = (
+            self.memory if self.memory is not None else HTC_DEFAULT_MEMORY_PER_CPU * request_CPUs
+        )
+        max_runtime = "undefined" if self.walltime is None else math.ceil(60 * self.walltime)
+        return [request_CPUs, math.ceil(request_memory), max_runtime]
+
 
 class LocalPC(SubmissionStatement):
-    def __init__(self, sub_filename, path_job_folder, context=None):
-        super().__init__(sub_filename, path_job_folder, context)
+    def __init__(self, sub_filename, path_job_folder, context=None, path_runner=None):
+        super().__init__(sub_filename, path_job_folder, context, path_runner=path_runner)
 
         self.head = "# Running on local pc"
-        self.body = f"bash {self.path_job_folder}/run.sh &"
+        self.body = f"bash {self.get_run_command()} &"
         self.tail = "# Local pc"
         self.submit_command = self.get_submit_command(sub_filename)
 
@@ -37,11 +173,25 @@ class LocalPC(SubmissionStatement):
 
 
 class Slurm(SubmissionStatement):
-    def __init__(self, sub_filename, path_job_folder, context):
-        super().__init__(sub_filename, path_job_folder, context)
+    def __init__(
+        self,
+        sub_filename,
+        path_job_folder,
+        context,
+        dependency=None,
+        resources=None,
+        path_runner=None,
+    ):
+        super().__init__(sub_filename, path_job_folder, context, resources, path_runner)
+
+        # Optional dependency on other jobs (e.g. afterok:<id_1>:<id_2>), the job is cancelled if
+        # the dependency can never be satisfied
+        str_dependency = ""
+        if dependency is not None:
+            str_dependency = f"--dependency={dependency} --kill-on-invalid-dep=yes "
 
         self.head = "# Running on SLURM "
-        self.body = f"sbatch --ntasks=2 {self.slurm_queue_statement.split(' ')[1] if self.slurm_queue_statement != "" else self.slurm_queue_statement} --output=output.txt --error=error.txt --gres=gpu:{self.request_GPUs} {self.path_job_folder}/run.sh"
+        self.body = f"sbatch {str_dependency}{' '.join(self.get_slurm_options())} {self.slurm_queue_statement.split(' ')[1] if self.slurm_queue_statement != '' else self.slurm_queue_statement} --output=output.txt --error=error.txt --gres=gpu:{self.request_GPUs} {self.get_run_command()}"
         self.tail = "# SLURM"
         self.submit_command = self.get_submit_command(sub_filename)
 
@@ -51,18 +201,26 @@ class Slurm(SubmissionStatement):
 
 
 class SlurmDocker(SubmissionStatement):
-    def __init__(self, sub_filename, path_job_folder, context, path_image, fix=False):
-        super().__init__(sub_filename, path_job_folder, context)
+    def __init__(
+        self,
+        sub_filename,
+        path_job_folder,
+        context,
+        path_image,
+        fix=False,
+        dependency=None,
+        resources=None,
+    ):
+        super().__init__(sub_filename, path_job_folder, context, resources)
 
         # ! Ugly fix, will need to be removed when INFN is fixed
         if fix:
-            to_replace = "/storage-hpc/gpfs_data/HPC/home_recovery"
-            replacement = "/home/HPC"
-            self.path_job_folder = self.path_job_folder.replace(to_replace, replacement)
-            path_image = path_image.replace(to_replace, replacement)
-            self.sub_filename = self.sub_filename.replace(to_replace, replacement)
+            self.path_job_folder = fix_infn_path(self.path_job_folder)
+            path_image = fix_infn_path(path_image)
+            self.sub_filename = fix_infn_path(self.sub_filename)
             self.str_fixed_run = (
-                f"sed -i 's/{to_replace}/{replacement}/' {self.path_job_folder}/run.sh\n"
+                f"sed -i 's#{INFN_PATH_TO_REPLACE}#{INFN_PATH_REPLACEMENT}#g'"
+                f" {self.path_job_folder}/run.sh\n"
             )
 
         self.head = (
@@ -72,9 +230,11 @@ class SlurmDocker(SubmissionStatement):
             + "\n"
             + f"#SBATCH --output={self.path_job_folder}/output.txt\n"
             + f"#SBATCH --error={self.path_job_folder}/error.txt\n"
-            + "#SBATCH --ntasks=2\n"
+            + f"{self.get_slurm_directives()}\n"
             + f"#SBATCH --gres=gpu:{self.request_GPUs}"
         )
+        if dependency is not None:
+            self.head += f"\n#SBATCH --dependency={dependency}\n#SBATCH --kill-on-invalid-dep=yes"
         self.body = f"singularity exec {path_image} {self.path_job_folder}/run.sh"
         self.tail = "# SLURM Docker"
         self.submit_command = self.get_submit_command(sub_filename)
@@ -84,24 +244,93 @@ class SlurmDocker(SubmissionStatement):
         return f"sbatch {sub_filename}"
 
 
-class HTC(SubmissionStatement):
-    def __init__(self, sub_filename, path_job_folder, context, htc_flavor="espresso"):
-        super().__init__(sub_filename, path_job_folder, context)
+class SlurmArray(SubmissionStatement):
+    def __init__(
+        self,
+        sub_filename,
+        path_manifest,
+        context,
+        n_tasks,
+        max_concurrent=None,
+        path_image=None,
+        fix=False,
+        resources=None,
+        path_runner=None,
+    ):
+        # One task per job, the folder of each task being read from the line of the manifest
+        # matching its array index. If path_image is given, run.sh is run in the container. All
+        # the tasks share the same resources.
+        super().__init__(sub_filename, path_manifest, context, resources, path_runner)
+        self.path_manifest = self.path_job_folder
 
+        # ! Ugly fix, will need to be removed when INFN is fixed (the manifest is written with the
+        # fixed paths already)
+        if fix:
+            self.path_manifest = fix_infn_path(self.path_manifest)
+            if path_image is not None:
+                path_image = fix_infn_path(path_image)
+
+        str_array = f"0-{n_tasks - 1}"
+        if max_concurrent is not None:
+            str_array += f"%{max_concurrent}"
+
+        # Outputs are redirected per task in the job folder
+        run_command = get_run_command('"$job_folder"', path_runner)
         self.head = (
-            "# This is a HTCondor submission file\n"
-            + "error  = error.txt\n"
-            + "output = output.txt\n"
-            + "log  = log.txt"
+            "#!/bin/bash\n"
+            + "# This is a SLURM array submission file"
+            + (" using Docker\n" if path_image is not None else "\n")
+            + self.slurm_queue_statement
+            + "\n"
+            + f"#SBATCH --array={str_array}\n"
+            + "#SBATCH --output=/dev/null\n"
+            + "#SBATCH --error=/dev/null\n"
+            + f"{self.get_slurm_directives()}\n"
+            + f"#SBATCH --gres=gpu:{self.request_GPUs}"
         )
         self.body = (
-            f"initialdir = {self.path_job_folder}\n"
-            + f"executable = {self.path_job_folder}/run.sh\n"
-            + f"request_GPUs = {self.request_GPUs}\n"
-            + "queue\n"
-            + f"+JobFlavour  = {htc_flavor}"
+            f'job_folder=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {self.path_manifest})\n'
+            + 'cd "$job_folder"\n'
+            + "exec > output.txt 2> error.txt\n"
+            + (
+                f"bash {run_command}"
+                if path_image is None
+                else f"singularity exec {path_image} {run_command}"
+            )
         )
-        self.tail = "# HTC"
+        self.tail = "# SLURM array" if path_image is None else "# SLURM Docker array"
+        self.submit_command = self.get_submit_command(sub_filename)
+
+    @staticmethod
+    def get_submit_command(sub_filename):
+        return f"sbatch {sub_filename}"
+
+
+class HTC(SubmissionStatement):
+    def __init__(
+        self,
+        sub_filename,
+        path_job_folder,
+        context,
+        htc_flavor="espresso",
+        max_materialize=None,
+        max_idle=None,
+        resources=None,
+        path_runner=None,
+    ):
+        super().__init__(sub_filename, path_job_folder, context, resources, path_runner)
+
+        # All the jobs are queued in a single cluster, from a manifest with one line per job
+        self.head = "# This is a HTCondor submission file\n" + get_htc_common_head(
+            max_materialize, max_idle, path_runner, self.walltime is not None
+        )
+        self.body = get_htc_manifest_line(
+            self.path_job_folder,
+            self.get_htc_flavour_job(htc_flavor),
+            self.request_GPUs,
+            self.get_htc_resources(),
+        )
+        self.tail = get_htc_queue_statement(sub_filename)
         self.submit_command = self.get_submit_command(sub_filename)
 
     @staticmethod
@@ -110,28 +339,88 @@ class HTC(SubmissionStatement):
 
 
 class HTCDocker(SubmissionStatement):
-    def __init__(self, sub_filename, path_job_folder, context, path_image, htc_flavor="espresso"):
-        super().__init__(sub_filename, path_job_folder, context)
+    def __init__(
+        self,
+        sub_filename,
+        path_job_folder,
+        context,
+        path_image,
+        htc_flavor="espresso",
+        max_materialize=None,
+        max_idle=None,
+        resources=None,
+        path_runner=None,
+    ):
+        super().__init__(sub_filename, path_job_folder, context, resources, path_runner)
 
         self.head = (
             "# This is a HTCondor submission file using Docker\n"
-            + "error  = error.txt\n"
-            + "output = output.txt\n"
-            + "log  = log.txt\n"
             + "universe = vanilla\n"
             + "+SingularityImage ="
-            + f' "{path_image}"'
+            + f' "{path_image}"\n'
+            + get_htc_common_head(
+                max_materialize, max_idle, path_runner, self.walltime is not None
+            )
         )
-        self.body = (
-            f"initialdir = {self.path_job_folder}\n"
-            + f"executable = {self.path_job_folder}/run.sh\n"
-            + f"request_GPUs = {self.request_GPUs}\n"
-            + "queue"
-            + f"+JobFlavour  = {htc_flavor}"
+        self.body = get_htc_manifest_line(
+            self.path_job_folder,
+            self.get_htc_flavour_job(htc_flavor),
+            self.request_GPUs,
+            self.get_htc_resources(),
         )
-        self.tail = "# HTC Docker"
+        self.tail = get_htc_queue_statement(sub_filename)
         self.submit_command = self.get_submit_command(sub_filename)
 
     @staticmethod
     def get_submit_command(sub_filename):
         return f"condor_submit {sub_filename}"
+
+
+class HTCDag(SubmissionStatement):
+    def __init__(
+        self,
+        sub_filename,
+        path_job_folder,
+        context,
+        node_name,
+        htc_flavor="espresso",
+        path_image=None,
+        resources=None,
+        path_runner=None,
+    ):
+        super().__init__(sub_filename, path_job_folder, context, resources, path_runner)
+
+        # Submission file shared by all the nodes of the DAG, the job specific values are passed
+        # through the VARS statements of the DAG file
+        self.head = (
+            "# This is a HTCondor submission file for the nodes of a DAG\n"
+            + "error  = error.txt\n"
+            + "output = output.txt\n"
+            + "log  = log.txt\n"
+        )
+        if path_image is not None:
+            self.head += "universe = vanilla\n" + f'+SingularityImage = "{path_image}"\n'
+        self.head += (
+            "initialdir = $(job_folder)\n"
+            + get_htc_executable("job_folder", path_runner)
+            + "request_GPUs = $(request_GPUs)\n"
+            + "request_CPUs = $(request_CPUs)\n"
+            + "request_memory = $(request_memory)\n"
+            + '+JobFlavour = "$(htc_flavor)"\n'
+            + ("+MaxRuntime = $(max_runtime)\n" if self.walltime is not None else "")
+            + "queue"
+        )
+        request_CPUs, request_memory, max_runtime = self.get_htc_resources()
+        htc_flavor = self.get_htc_flavour_job(htc_flavor)
+        self.body = (
+            f"JOB {node_name} {self.sub_filename}\n"
+            + f'VARS {node_name} job_folder="{self.path_job_folder}"'
+            + f' request_GPUs="{self.request_GPUs}" htc_flavor="{htc_flavor}"'
+            + f' request_CPUs="{request_CPUs}" request_memory="{request_memory}"'
+            + f' max_runtime="{max_runtime}"'
+        )
+        self.tail = "# HTC DAG"
+
+    @staticmethod
+    def get_submit_command(dag_filename):
+        return f"condor_submit_dag -force {dag_filename}"
@@ -4,10 +4,8 @@
 # Standard library imports
 from typing import Self
 
-# Third party imports
-from study_gen._nested_dicts import nested_get
-
 # Local imports
+from .job_index import JobIndex
 
 
 # ==================================================================================================
@@ -16,29 +14,25 @@ from study_gen._nested_dicts import nested_get
 class DependencyGraph:
     def __init__(
         self: Self,
-        dic_tree: dict,
-        dic_all_jobs: dict,
+        job_index: JobIndex,
     ):
-        self.dic_tree = dic_tree
-        self.dic_all_jobs = dic_all_jobs
+        self.job_index = job_index
         self.dependency_graph = {}
+        self.reverse_dependency_graph = {}
+
+        # Number of unfinished parents of every job, maintained incrementally as jobs finish
+        self.dic_n_unfinished_parents = {}
+        self.set_finished_jobs = set()
 
     def build_full_dependency_graph(self: Self):
-        self.set_l_keys = {
-            tuple(self.dic_all_jobs[job]["l_keys"][:-1]) for job in self.dic_all_jobs
-        }
-        for job in self.dic_all_jobs:
-            l_keys = self.dic_all_jobs[job]["l_keys"]
-            self.dependency_graph[job] = set()
-            # Add all parents to the dependency graph
-            for i in range(len(l_keys) - 1):
-                l_keys_parent = l_keys[:i]
-                if tuple(l_keys_parent) in self.set_l_keys:
-                    parent = nested_get(self.dic_tree, l_keys_parent)
-                    # Look for all the jobs in the parent (but not the generations below)
-                    for name_parent, sub_dict in parent.items():
-                        if "file" in sub_dict:
-                            self.dependency_graph[job].add(sub_dict["file"])
+        # The job index is built with a prefix traversal of the tree, in which the jobs of each
+        # folder are the parents of all the jobs of its subfolders. Both edge directions are
+        # therefore available in O(N + E).
+        self.dependency_graph = {}
+        self.reverse_dependency_graph = {}
+        for job in self.job_index.jobs():
+            self.dependency_graph[job.file] = {parent.file for parent in job.parents}
+            self.reverse_dependency_graph[job.file] = {child.file for child in job.children}
         return self.dependency_graph
 
     def get_unfinished_dependency(self, job: str):
@@ -46,14 +40,71 @@ class DependencyGraph:
         if self.dependency_graph == {}:
             self.build_full_dependency_graph()
 
-        # Get the list of dependencies
-        l_dependencies = self.dependency_graph[job]
+        # Get the list of dependencies that are not finished yet
+        return [dep for dep in self.dependency_graph[job] if not self.job_index[dep].is_finished]
+
+    def initialize_readiness(self: Self) -> list[str]:
+        # Count the unfinished parents of every job from the status in the tree. The jobs of a
+        # same folder share their list of parents, which is therefore only counted once.
+        self.set_finished_jobs = {job.file for job in self.job_index.jobs() if job.is_finished}
+        self.dic_n_unfinished_parents = {}
+        dic_n_unfinished_by_folder = {}
+        l_ready_jobs = []
+        for job in self.job_index.jobs():
+            id_parents = id(job.parents)
+            if id_parents not in dic_n_unfinished_by_folder:
+                dic_n_unfinished_by_folder[id_parents] = sum(
+                    parent.file not in self.set_finished_jobs for parent in job.parents
+                )
+            self.dic_n_unfinished_parents[job.file] = dic_n_unfinished_by_folder[id_parents]
+
+            # Unfinished jobs whose dependencies are all finished
+            if self.dic_n_unfinished_parents[job.file] == 0 and not job.is_finished:
+                l_ready_jobs.append(job.file)
+
+        return l_ready_jobs
+
+    def get_ready_jobs(self: Self) -> list[str]:
+        # All the jobs ready to run, in a single pass
+        return self.initialize_readiness()
+
+    def apply_completions(self: Self, l_jobs_finished: list[str]) -> list[str]:
+        # Update the counters with a batch of finished jobs (e.g. from the journal or a scheduler
+        # query) and return the jobs that just became ready. The cost only depends on the number of
+        # children of the finished jobs.
+        if not self.dic_n_unfinished_parents:
+            self.initialize_readiness()
+
+        l_newly_ready_jobs = []
+        for file in l_jobs_finished:
+            # Ignore duplicates and jobs already known as finished
+            if file in self.set_finished_jobs:
+                continue
+            self.set_finished_jobs.add(file)
+
+            for child in self.job_index[file].children:
+                self.dic_n_unfinished_parents[child.file] -= 1
+                if (
+                    self.dic_n_unfinished_parents[child.file] == 0
+                    and child.file not in self.set_finished_jobs
+                ):
+                    l_newly_ready_jobs.append(child.file)
+
+        return l_newly_ready_jobs
 
-        # Get the corresponding list of l_keys
-        ll_keys = [self.dic_all_jobs[dep]["l_keys"] for dep in l_dependencies]
+    def get_dependency_groups(self: Self, l_jobs: list[str]) -> list[tuple[list[str], list[str]]]:
+        # Group the jobs that share the same parents (i.e. the jobs of a same folder), keeping only
+        # the edges between jobs of l_jobs. Useful to write compact DAG files.
+        set_jobs = set(l_jobs)
+        dic_groups = {}
+        for file in l_jobs:
+            job = self.job_index[file]
+            id_parents = id(job.parents)
+            if id_parents not in dic_groups:
+                l_parents = [parent.file for parent in job.parents if parent.file in set_jobs]
+                dic_groups[id_parents] = (l_parents, [])
+            dic_groups[id_parents][1].append(file)
 
         return [
-            dep
-            for dep, l_keys in zip(l_dependencies, ll_keys)
-            if nested_get(self.dic_tree, l_keys + ["status"]) != "finished"
+            (l_parents, l_children) for l_parents, l_children in dic_groups.values() if l_parents
         ]
@@ -1,101 +1,305 @@
 # ==================================================================================================
 # --- Imports
 # ==================================================================================================
-# Third party imports
-import yaml
+# Standard library imports
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Local imports
+from .utils.journal_utils import (
+    MARKER_EXTENSION,
+    get_filename_marker,
+    get_marker_commands,
+    get_run_key,
+)
+from .utils.run_registry import get_registry_commands
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Study-level runner, and manifest of the jobs it runs, written in the study folder
+RUNNER_FILENAME = "runner.sh"
+RUNNER_MANIFEST_FILENAME = "runner_manifest.txt"
+
+# Keys of the staging of a job in the tree, i.e. the inputs copied to the scratch folder, the
+# outputs copied back (both globs relative to the job folder), and the scratch area
+STAGING_KEYS = ["inputs", "outputs", "scratch"]
+DEFAULT_SCRATCH = "${TMPDIR:-/tmp}"
 
 
 # ==================================================================================================
 # --- Functions
 # ==================================================================================================
 def generate_run_file(
-    job_folder, job_name, setup_env_script, generation_number, tree_path, l_keys, htc=False
+    job_folder,
+    job_name,
+    setup_env_script,
+    generation_number,
+    tree_path,
+    l_keys,
+    htc=False,
+    local=False,
+    staging=None,
 ):
-    # if htc:
-    #     file_str = _generate_run_file_htc(job_folder, job_name, setup_env_script, generation_number)
-    # else:
-    file_str = _generate_run_file(job_folder, job_name, setup_env_script)
-
-    # Tag the job as finished with all keys from l_keys
-    file_str += f"""
-# Ensure job run was successful and tag as finished
-if [ $? -eq 0 ]; then
-    python -m study_sub.scripts.log_finish {tree_path} {' '.join(l_keys)}
-fi
-"""
+    file_str = _generate_run_file(job_folder, job_name, setup_env_script, staging)
+
+    # Local jobs register themselves in the run registry of the study while they run
+    if local:
+        file_str = file_str.replace(
+            "#!/bin/bash\n",
+            "#!/bin/bash\n" + get_registry_commands(tree_path, get_run_key(l_keys), job_folder),
+        )
+
+    # Signal the end of the job with all keys from l_keys, and exit with the code of the job so
+    # that failures are seen by the schedulers and the local executor
+    file_str += _generate_finish_commands(
+        tree_path, " ".join(l_keys), get_filename_marker(l_keys)
+    )
 
     return file_str
 
 
-def _generate_run_file(job_folder, job_name, setup_env_script):
+def _generate_finish_commands(tree_path, str_keys, filename_marker):
+    # The marker is folded into the tree (status: finished if the job succeeded) by the next read
+    # of the tree, rather than by a python process started at the end of each job
     return (
+        "\n# Signal the end of the job, the job being tagged as finished if it succeeded\n"
+        + get_marker_commands(tree_path, str_keys, filename_marker)
+        + "exit $exit_code\n"
+    )
+
+
+def _generate_run_file(job_folder, job_name, setup_env_script, staging=None):
+    # The usage of the job is written to usage.txt, for the automatic sizing of the resources of
+    # the next jobs (memory and cpu usage are only measured if GNU time is available)
+    # The environment is not sourced again when the job runs in a bundle that sourced it already
+    run_str = (
         "#!/bin/bash\n"
-        + f"source {setup_env_script}\n"
+        + f'if [ "$STUDY_SUB_ENVIRONMENT" != "{setup_env_script}" ]; then\n'
+        + f"    source {setup_env_script}\n"
+        + "fi\n"
+        + f"cd {job_folder}\n"
+        + "measure=()\n"
+        + "rm -f usage.txt\n"
+        + "if [ -x /usr/bin/time ]; then\n"
+        + '    measure=(/usr/bin/time -f "max_rss_kb %M\\ncpu_percent %P" -o usage.txt)\n'
+        + "fi\n"
+    )
+    run_str_job = (
+        "start_time=$SECONDS\n"
+        + f'"${{measure[@]}}" python {job_name} > output_python.txt 2> error_python.txt\n'
+        + "exit_code=$?\n"
+        + 'echo "elapsed $((SECONDS - start_time))" >> usage.txt\n'
+    )
+    if staging is None:
+        return run_str + run_str_job
+    return (
+        run_str
+        + _generate_stage_in_commands(job_name, staging)
+        + run_str_job
+        + _generate_stage_out_commands(job_folder, staging)
+        + "fi\n"
+    )
+
+
+def _check_staging(staging):
+    if not isinstance(staging, dict) or not set(staging) <= set(STAGING_KEYS):
+        raise ValueError(
+            f"Error: the staging of a job must be a dictionnary with keys among {STAGING_KEYS}"
+        )
+
+    # The inputs are copied in the folder of the job in the scratch area, itself in a temporary
+    # folder, hence they can't be more than one level above the folder of the job
+    for input_file in staging.get("inputs", []):
+        if os.path.normpath(input_file).split("/")[:2] == ["..", ".."]:
+            raise ValueError(
+                f"Error: the input {input_file} of the staging can't be copied to the scratch"
+                " area, as it is more than one level above the folder of the job."
+            )
+
+
+def _generate_stage_in_commands(job_name, staging):
+    # The job runs in its own folder of the node-local scratch area, with a copy of its script and
+    # of its inputs (kept at the same path relative to the job folder, e.g. ../config.yaml), so
+    # that it does not read nor write on the shared filesystem while it runs. The job fails (and
+    # its failure is signalled as for the other jobs) if the scratch area can't be used, rather
+    # than running without its inputs. The commands open a block closed after the stage out.
+    _check_staging(staging)
+    scratch = staging.get("scratch") or DEFAULT_SCRATCH
+    str_inputs = " ".join(staging.get("inputs", []))
+    return (
+        "shopt -s nullglob\n"
+        + f'scratch_dir=$(mktemp -d "{scratch}/study_sub.XXXXXX")\n'
+        + 'if [ -z "$scratch_dir" ] || ! mkdir -p "$scratch_dir/job"'
+        + f' || ! cp -r --parents {job_name} {str_inputs} "$scratch_dir/job"'
+        + ' || ! cd "$scratch_dir/job"; then\n'
+        + f'    echo "Error: the inputs could not be copied to {scratch}" >&2\n'
+        + '    if [ -n "$scratch_dir" ]; then\n'
+        + '        rm -rf "$scratch_dir"\n'
+        + "    fi\n"
+        + "    exit_code=1\n"
+        + "else\n"
+    )
+
+
+def _generate_stage_out_commands(job_folder, staging):
+    # The logs and the declared outputs are copied back in a single command once the job is done,
+    # and the job fails if they can't be (e.g. quota exceeded)
+    str_outputs = " ".join(staging.get("outputs", []))
+    return (
+        "if ! cp -r --parents output_python.txt error_python.txt usage.txt"
+        + f" {str_outputs} {job_folder}; then\n"
+        + f'    echo "Error: the outputs could not be copied back to {job_folder}" >&2\n'
+        + "    if [ $exit_code -eq 0 ]; then\n"
+        + "        exit_code=1\n"
+        + "    fi\n"
+        + "fi\n"
         + f"cd {job_folder}\n"
-        + f"python {job_name} > output_python.txt 2> error_python.txt\n"
+        + 'rm -rf "$scratch_dir"\n'
+    )
+
+
+def get_path_run_hashes(path_tree):
+    # Hash of the content of each run file when it was last written, next to the tree
+    return f"{path_tree}.run_hashes.json"
+
+
+def _hash_run_str(run_str):
+    return hashlib.blake2b(run_str.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def write_run_file(path_run, run_str, unchanged=False):
+    # An unchanged file is not written again (nor read), as each access is slow on network
+    # filesystems (AFS/EOS), unless it was removed. Returns True if written.
+    if unchanged and os.path.exists(path_run):
+        return False
+    with open(path_run, "w") as f:
+        f.write(run_str)
+    return True
+
+
+def write_run_files(dic_run_str, max_workers=32, path_hashes=None):
+    # Write the run files (path to content) in parallel, the latency of network filesystems being
+    # much higher than the cost of the write itself. The files are compared to the hashes recorded
+    # in path_hashes (if given) when they were last written, so that the unchanged ones are
+    # skipped. Returns the number of files written.
+    dic_hashes_previous = {}
+    if path_hashes is not None and os.path.exists(path_hashes):
+        try:
+            with open(path_hashes) as f:
+                dic_hashes_previous = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print(f"Warning, ignoring unreadable hashes of the run files {path_hashes}")
+
+    dic_hashes = {path_run: _hash_run_str(run_str) for path_run, run_str in dic_run_str.items()}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        l_written = list(
+            executor.map(
+                lambda path_run: write_run_file(
+                    path_run,
+                    dic_run_str[path_run],
+                    dic_hashes_previous.get(path_run) == dic_hashes[path_run],
+                ),
+                dic_run_str,
+            )
+        )
+
+    # Atomic replacement, once all the files are written
+    if path_hashes is not None and dic_hashes != dic_hashes_previous:
+        path_temp = f"{path_hashes}.{os.getpid()}.tmp"
+        with open(path_temp, "w") as f:
+            json.dump(dic_hashes, f)
+        os.replace(path_temp, path_hashes)
+    return sum(l_written)
+
+
+def get_run_command(job_folder, path_runner=None):
+    # Command running a job, either its own run.sh or the runner of the study
+    if path_runner is None:
+        return f"{job_folder}/run.sh"
+    return f"{path_runner} {job_folder}"
+
+
+def generate_runner_manifest(l_records):
+    # One record (folder, script, local flag, run key and keys) per job, sorted by folder and
+    # padded to the same width, so that the record of a job is read with a single seek from its
+    # index, or found by a binary search on its folder. Returns the manifest and the width of the
+    # records.
+    l_lines = sorted(
+        f"{job_folder}\t{job_name}\t{int(local)}\t{get_run_key(l_keys)}\t{' '.join(l_keys)}"
+        for job_folder, job_name, local, l_keys in l_records
+    )
+    width = max((len(line.encode()) for line in l_lines), default=0) + 1
+    manifest_str = "".join(
+        line + " " * (width - 1 - len(line.encode())) + "\n" for line in l_lines
     )
+    return manifest_str, width
 
 
-# def _generate_run_file_htc(job_folder, job_name, setup_env_script, generation_number):
-#     if generation_number == 1:
-#         # No need to move to HTC as gen 1 is never IO intensive
-#         return _generate_run_file(job_folder, job_name, setup_env_script)
-#     if generation_number == 2:
-#         raise ValueError("Generation 2 htc submission is not supported yet...")
-#         # return _generate_run_sh_htc_gen_2(job_folder, job_name, setup_env_script)
-#     if generation_number >= 3:
-#         print(
-#             f"Generation {generation_number} local htc submission is not supported yet..."
-#             " Submitting as for generation 1"
-#         )
-#         return _generate_run_file(job_folder, job_name, setup_env_script)
-
-
-# ! THIS CODE IS NOT UP TO DATE AND WILL NOT WORK
-# def _generate_run_sh_htc_gen_2(job_folder, job_name, setup_env_script):
-#     # Get local path and abs path to gen 2
-#     abs_path = job_folder
-#     local_path = abs_path.split("/")[-1]
-
-#     # Mutate all paths in config to be absolute
-#     with open(f"{abs_path}/config.yaml", "r") as f:
-#         config = yaml.load(f, Loader=yaml.FullLoader)
-
-#     # Get paths to mutate
-#     path_collider = config["config_simulation"]["collider_file"]
-#     path_particles = config["config_simulation"]["particle_file"]
-#     path_log = config["log_file"]
-#     new_path_collider = f"{abs_path}/{path_collider}"
-#     new_path_particles = f"{abs_path}/{path_particles}"
-#     new_path_log = f"{abs_path}/{path_log}"
-
-#     # Prepare strings for sec
-#     path_collider = path_collider.replace("/", "\/")
-#     path_particles = path_particles.replace("/", "\/")
-#     path_log = path_log.replace("/", "\/")
-#     new_path_collider = new_path_collider.replace("/", "\/")
-#     new_path_particles = new_path_particles.replace("/", "\/")
-#     new_path_log = new_path_log.replace("/", "\/")
-
-#     # Return final run script
-#     return (
-#         f"#!/bin/bash\n"
-#         f'source {node.root.parameters["setup_env_script"]}\n'
-#         # Copy config gen 1
-#         f"cp -f {abs_path}/../config.yaml .\n"
-#         # Copy config gen 2 in local path
-#         f"mkdir {local_path}\n"
-#         f"cp -f {abs_path}/config.yaml {local_path}\n"
-#         f"cd {local_path}\n"
-#         # Mutate the paths in config to be absolute
-#         f'sed -i "s/{path_collider}/{new_path_collider}/g" config.yaml\n'
-#         f'sed -i "s/{path_particles}/{new_path_particles}/g" config.yaml\n'
-#         f'sed -i "s/{path_log}/{new_path_log}/g" config.yaml\n'
-#         # Run the job
-#         f"python {node.get_abs_path()}/{python_command} > output_python.txt 2>"
-#         " error_python.txt\n"
-#         # Delete the config so it's not copied back
-#         f"rm -f ../config.yaml\n"
-#         # Copy back output
-#         f"cp -f *.txt *.parquet *.yaml {abs_path}\n"
-#     )
+def generate_runner_file(path_manifest, width, n_jobs, setup_env_script, tree_path):
+    # Single run file of the study, replacing the run.sh of each job: the job is given by its index
+    # in the manifest or by its folder, and is then run as by its own run.sh
+    run_str = _generate_run_file('"$job_folder"', '"$job_name"', setup_env_script)
+    registry_str = get_registry_commands(tree_path, "${run_key}", "$job_folder")
+    return (
+        "#!/bin/bash\n"
+        + f"manifest={path_manifest}\n"
+        + f"width={width}\n"
+        + f"n_jobs={n_jobs}\n"
+        + "read_record() {\n"
+        + '    dd if="$manifest" bs=$width skip=$1 count=1 status=none\n'
+        + "}\n"
+        + "find_record() {\n"
+        + "    # Binary search on the folders, compared byte-wise as they were sorted\n"
+        + "    local LC_ALL=C low=0 high=$((n_jobs - 1)) mid record\n"
+        + "    while [ $low -le $high ]; do\n"
+        + "        mid=$(((low + high) / 2))\n"
+        + "        record=$(read_record $mid)\n"
+        + "        if [[ \"${record%%$'\\t'*}\" == \"$1\" ]]; then\n"
+        + '            echo "$record"\n'
+        + "            return\n"
+        + "        elif [[ \"${record%%$'\\t'*}\" < \"$1\" ]]; then\n"
+        + "            low=$((mid + 1))\n"
+        + "        else\n"
+        + "            high=$((mid - 1))\n"
+        + "        fi\n"
+        + "    done\n"
+        + "}\n"
+        + 'if [[ "$1" =~ ^[0-9]+$ ]]; then\n'
+        + '    record=$(read_record "$1")\n'
+        + "else\n"
+        + '    record=$(find_record "${1%/}")\n'
+        + "fi\n"
+        + "IFS=$'\\t' read -r job_folder job_name is_local run_key keys <<< \"$record\"\n"
+        + 'if [ -z "$job_folder" ]; then\n'
+        + "    # Folders not in the manifest (bundles, staged jobs) are run by their own run.sh\n"
+        + '    if [ -f "${1%/}/run.sh" ]; then\n'
+        + '        exec bash "${1%/}/run.sh"\n'
+        + "    fi\n"
+        + '    echo "Error: job $1 not found in $manifest" >&2\n'
+        + "    exit 1\n"
+        + "fi\n"
+        + 'read -r -a l_keys <<< "$keys"\n'
+        + 'if [ "$is_local" = 1 ]; then\n'
+        + "".join(f"    {line}\n" for line in registry_str.splitlines())
+        + "fi\n"
+        + run_str.removeprefix("#!/bin/bash\n")
+        + _generate_finish_commands(tree_path, "${l_keys[*]}", "${run_key}" + MARKER_EXTENSION)
+    )
+
+
+def generate_bundle_run_file(bundle_folder, setup_env_script, n_parallel, path_runner=None):
+    # Worker loop of a bundle: the environment is sourced once, and the jobs listed in members.txt
+    # are run n_parallel at a time, each job logging its own completion. The exit code is non-zero
+    # if any job failed.
+    run_command = "run.sh" if path_runner is None else f'{path_runner} \"$1\"'
+    return (
+        "#!/bin/bash\n"
+        + f"source {setup_env_script}\n"
+        + f"export STUDY_SUB_ENVIRONMENT={setup_env_script}\n"
+        + f"cd {bundle_folder}\n"
+        + f"xargs -a members.txt -d '\\n' -P {n_parallel} -I {{}} bash -c"
+        + f" 'cd \"$1\" && bash {run_command} > output.txt 2> error.txt' _ {{}}\n"
+    )
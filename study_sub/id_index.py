@@ -0,0 +1,211 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import json
+import os
+from typing import Iterator, Self
+
+# Local imports
+from .job_index import JobIndex
+
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Separates the id of a bundle from the index of the job in the bundle
+BUNDLE_SEPARATOR = "@"
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def get_path_id_index(path_tree: str) -> str:
+    return f"{path_tree}.ids.json"
+
+
+def get_path_id_log(path_id_index: str) -> str:
+    return f"{path_id_index}.log"
+
+
+def get_id_key(id_job: int | str) -> str:
+    # Ids are stored as strings, e.g. 1234 (Slurm), 1234_5 (Slurm array task) or 1234.5
+    # (HTCondor <cluster>.<proc>)
+    return str(id_job)
+
+
+def get_id_key_bundle_member(id_job: int | str, idx_member: int) -> str:
+    # The jobs run in a bundle share the id of the bundle, and are told apart by their index in it
+    return f"{get_id_key(id_job)}{BUNDLE_SEPARATOR}{idx_member}"
+
+
+def get_id_scheduler(id_job: int | str) -> str:
+    # Id of the scheduler job running the job, i.e. the id of the bundle for the jobs of a bundle
+    return get_id_key(id_job).split(BUNDLE_SEPARATOR)[0]
+
+
+# ==================================================================================================
+# --- Class
+# ==================================================================================================
+class IdIndex:
+    def __init__(self: Self, path_tree: str | None):
+        # Persisted next to the tree, and only written when modified (in memory only if no tree
+        # is given)
+        self.path_id_index = get_path_id_index(path_tree) if path_tree is not None else None
+        self.modified = False
+        self._stat_signature = None
+
+        # Current ids to job, and job to current and historical ids
+        self.dic_id_to_job: dict[str, str] = {}
+        self.dic_job_to_ids: dict[str, dict] = {}
+
+        # Id of each bundle to the jobs it runs
+        self.dic_bundle_to_jobs: dict[str, set[str]] = {}
+        self._load()
+
+    def _get_stat_signature(self: Self):
+        stat = os.stat(self.path_id_index)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _load(self: Self):
+        if not self.exists():
+            return
+        self.dic_job_to_ids = {}
+        self.dic_id_to_job = {}
+        self.dic_bundle_to_jobs = {}
+        if os.path.exists(self.path_id_index):
+            with open(self.path_id_index) as f:
+                self.dic_job_to_ids = json.load(f)
+            self._stat_signature = self._get_stat_signature()
+            for job, dic_ids in self.dic_job_to_ids.items():
+                if dic_ids["current"] is not None:
+                    self._index_id(dic_ids["current"], job)
+
+        # Then replay the ids recorded since the index was last written (e.g. by an interrupted
+        # submission)
+        path_id_log = get_path_id_log(self.path_id_index)
+        if os.path.exists(path_id_log):
+            with open(path_id_log) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partially written last line
+                        continue
+                    self.add(record["id"], record["job"])
+
+    def refresh(self: Self):
+        # Reload the index if it has been written by another process since it was last loaded, or
+        # if ids have been recorded in the log
+        if not self.exists():
+            return
+        if (
+            not os.path.exists(self.path_id_index)
+            or self._get_stat_signature() != self._stat_signature
+            or os.path.exists(get_path_id_log(self.path_id_index))
+        ):
+            self._load()
+
+    def exists(self: Self) -> bool:
+        return self.path_id_index is not None and (
+            os.path.exists(self.path_id_index)
+            or os.path.exists(get_path_id_log(self.path_id_index))
+        )
+
+    def record(self: Self, id_job: int | str, job: str):
+        # Add an id and persist it right away, by appending it to the log of the index (folded
+        # into the index by the next write)
+        self.add(id_job, job)
+        if self.path_id_index is not None:
+            with open(get_path_id_log(self.path_id_index), "a") as f:
+                f.write(json.dumps({"id": get_id_key(id_job), "job": job}) + "\n")
+
+    def write(self: Self):
+        if not self.modified or self.path_id_index is None:
+            return
+
+        # Atomic replacement, so that the index is never read half-written
+        path_temp = f"{self.path_id_index}.{os.getpid()}.tmp"
+        with open(path_temp, "w") as f:
+            json.dump(self.dic_job_to_ids, f)
+        os.replace(path_temp, self.path_id_index)
+        self._stat_signature = self._get_stat_signature()
+        self.modified = False
+
+        # The recorded ids are now in the index
+        path_id_log = get_path_id_log(self.path_id_index)
+        if os.path.exists(path_id_log):
+            os.remove(path_id_log)
+
+    def import_job_index(self: Self, job_index: JobIndex):
+        # Migration of the ids stored in the tree by previous versions
+        for job in job_index.jobs():
+            if "id_sub" in job.node:
+                self.add(job.node["id_sub"], job.file)
+
+    def add(self: Self, id_job: int | str, job: str):
+        id_key = get_id_key(id_job)
+
+        # The previous id of the job (e.g. from an earlier, failed, submission) is kept in history
+        dic_ids = self.dic_job_to_ids.setdefault(job, {"current": None, "history": []})
+        if dic_ids["current"] == id_key:
+            return
+        if dic_ids["current"] is not None:
+            self.remove(dic_ids["current"])
+
+        # An id can only refer to one job
+        if id_key in self.dic_id_to_job:
+            self.remove(id_key)
+
+        dic_ids["current"] = id_key
+        self._index_id(id_key, job)
+        self.modified = True
+
+    def _index_id(self: Self, id_key: str, job: str):
+        self.dic_id_to_job[id_key] = job
+        if BUNDLE_SEPARATOR in id_key:
+            id_bundle = id_key.split(BUNDLE_SEPARATOR)[0]
+            self.dic_bundle_to_jobs.setdefault(id_bundle, set()).add(job)
+
+    def remove(self: Self, id_job: int | str):
+        # The job is not running nor queuing anymore, its id is moved to its history
+        id_key = get_id_key(id_job)
+        job = self.dic_id_to_job.pop(id_key, None)
+        if job is None:
+            return
+        if BUNDLE_SEPARATOR in id_key:
+            id_bundle = id_key.split(BUNDLE_SEPARATOR)[0]
+            self.dic_bundle_to_jobs[id_bundle].discard(job)
+            if not self.dic_bundle_to_jobs[id_bundle]:
+                del self.dic_bundle_to_jobs[id_bundle]
+        dic_ids = self.dic_job_to_ids[job]
+        dic_ids["current"] = None
+        dic_ids["history"].append(id_key)
+        self.modified = True
+
+    def get_job(self: Self, id_job: int | str) -> str | None:
+        return self.dic_id_to_job.get(get_id_key(id_job))
+
+    def get_jobs(self: Self, id_job: int | str) -> list[str]:
+        # The job with this id, or all the jobs of the bundle with this id
+        id_key = get_id_key(id_job)
+        if id_key in self.dic_id_to_job:
+            return [self.dic_id_to_job[id_key]]
+        return sorted(self.dic_bundle_to_jobs.get(id_key, []))
+
+    def get_id(self: Self, job: str) -> str | None:
+        dic_ids = self.dic_job_to_ids.get(job)
+        return dic_ids["current"] if dic_ids is not None else None
+
+    def get_history(self: Self, job: str) -> list[str]:
+        dic_ids = self.dic_job_to_ids.get(job)
+        return list(dic_ids["history"]) if dic_ids is not None else []
+
+    def __contains__(self: Self, id_job: int | str) -> bool:
+        return get_id_key(id_job) in self.dic_id_to_job
+
+    def __iter__(self: Self) -> Iterator[str]:
+        return iter(self.dic_id_to_job)
+
+    def __len__(self: Self) -> int:
+        return len(self.dic_id_to_job)
@@ -0,0 +1,111 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+from typing import Any, Iterator, Self
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def is_job_node(value: Any) -> bool:
+    # A job is a dictionnary with a (non-dictionnary) file key
+    return isinstance(value, dict) and "file" in value and not isinstance(value["file"], dict)
+
+
+# ==================================================================================================
+# --- Classes
+# ==================================================================================================
+class Job:
+    __slots__ = ("file", "l_keys", "gen", "node", "parents", "children")
+
+    def __init__(self: Self, file: str, l_keys: list[str], gen: int, node: dict, parents: list):
+        self.file = file
+        self.l_keys = l_keys
+        self.gen = gen
+
+        # Direct reference to the dictionnary of the job in the tree, attributes are read and
+        # written through it
+        self.node = node
+
+        # Jobs in the ancestor folders of the job, which must be finished before it can run. The
+        # list is shared between all the jobs of a same folder.
+        self.parents = parents
+        self.children = []
+
+    @property
+    def name(self: Self) -> str:
+        return self.file.split("/")[-1]
+
+    @property
+    def status(self: Self) -> str | None:
+        return self.node.get("status")
+
+    @property
+    def is_finished(self: Self) -> bool:
+        return self.node.get("status") == "finished"
+
+    def __repr__(self: Self) -> str:
+        return f"Job({self.file!r}, gen={self.gen})"
+
+
+class JobIndex:
+    def __init__(self: Self, dic_tree: dict):
+        # The index holds references to the nodes of this tree, it must be rebuilt if the tree is
+        # reloaded
+        self.dic_tree = dic_tree
+        self.dic_jobs: dict[str, Job] = {}
+        self.dic_jobs_by_l_keys: dict[tuple[str, ...], Job] = {}
+        self._build()
+
+    def _build(self: Self):
+        # Iterative traversal of the tree, each folder is visited once. The stack holds the folders
+        # to visit with their keys and the jobs of their ancestor folders.
+        l_stack = [(self.dic_tree, [], [])]
+        while l_stack:
+            dic_folder, l_keys, l_parents = l_stack.pop()
+
+            # Register the jobs of the folder first, as they are the parents of all the jobs found
+            # in the subfolders
+            l_jobs_folder = []
+            l_subfolders = []
+            for key, value in dic_folder.items():
+                if is_job_node(value):
+                    job = Job(value["file"], l_keys + [key], len(l_keys), value, l_parents)
+                    self.dic_jobs[job.file] = job
+                    self.dic_jobs_by_l_keys[tuple(job.l_keys)] = job
+                    l_jobs_folder.append(job)
+                elif isinstance(value, dict):
+                    l_subfolders.append((key, value))
+
+            # Link the jobs to their parents
+            for parent in l_parents:
+                parent.children.extend(l_jobs_folder)
+
+            # Subfolders are pushed in reverse order to be visited in the tree order
+            l_parents_subfolders = l_parents + l_jobs_folder if l_jobs_folder else l_parents
+            for key, value in reversed(l_subfolders):
+                l_stack.append((value, l_keys + [key], l_parents_subfolders))
+
+    def __getitem__(self: Self, file: str) -> Job:
+        return self.dic_jobs[file]
+
+    def __contains__(self: Self, file: str) -> bool:
+        return file in self.dic_jobs
+
+    def __iter__(self: Self) -> Iterator[str]:
+        return iter(self.dic_jobs)
+
+    def __len__(self: Self) -> int:
+        return len(self.dic_jobs)
+
+    def get_job_from_l_keys(self: Self, l_keys: list[str]) -> Job | None:
+        # E.g. to map the records of the journal back to the jobs
+        return self.dic_jobs_by_l_keys.get(tuple(l_keys))
+
+    def jobs(self: Self) -> Iterator[Job]:
+        return iter(self.dic_jobs.values())
+
+    def to_dic_all_jobs(self: Self) -> dict[str, dict[str, Any]]:
+        # Format returned by ConfigJobs.find_all_jobs
+        return {job.file: {"gen": job.gen, "l_keys": list(job.l_keys)} for job in self.jobs()}
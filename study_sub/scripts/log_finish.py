@@ -4,12 +4,8 @@
 # Standard library imports
 import sys
 
-# Third party imports
-from filelock import SoftFileLock
-from study_gen._nested_dicts import nested_set
-
 # Local imports
-from ..utils.dict_yaml_utils import load_yaml, write_yaml
+from ..tree_store import get_tree_store
 
 # ==================================================================================================
 # --- Script
@@ -19,16 +15,6 @@ from ..utils.dict_yaml_utils import load_yaml, write_yaml
 tree_path = sys.argv[1]
 l_keys = sys.argv[2:]
 
-# Define lock
-lock = SoftFileLock(f"{tree_path}.lock", timeout=30)
-
-# Update tag
-with lock:
-    # Load the tree
-    tree = load_yaml(tree_path)
-
-    # Update the tree
-    nested_set(tree, l_keys + ["status"], "finished")
-
-    # Write the tree
-    write_yaml(tree_path, tree)
+# Update tag. For a yaml tree, the status is appended to the journal of the tree and folded into
+# the tree by the next read. For a sqlite tree, only the row of the job is updated.
+get_tree_store(tree_path).set_status(l_keys, "finished")
@@ -0,0 +1,41 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import argparse
+
+# Local imports
+from ..study_sub import StudySub
+
+# ==================================================================================================
+# --- Script
+# ==================================================================================================
+
+# Submit the jobs of the study as soon as they are ready, until the study is complete, e.g.
+# nohup python -m study_sub.scripts.watch study/tree.yaml .venv > watch.log 2>&1 &
+parser = argparse.ArgumentParser(description="Watch a study and submit its jobs when ready.")
+parser.add_argument("path_tree")
+parser.add_argument("path_python_environment")
+parser.add_argument("--path-container-image", default=None)
+parser.add_argument("--tree-backend", default="yaml")
+parser.add_argument("--poll-interval-min", type=float, default=30.0)
+parser.add_argument("--poll-interval-max", type=float, default=600.0)
+parser.add_argument("--max-attempts", type=int, default=3)
+parser.add_argument("--max-in-flight", type=int, default=None)
+parser.add_argument("--priority", default=None)
+parser.add_argument("--local-max-workers", type=int, default=None)
+args = parser.parse_args()
+
+StudySub(
+    args.path_tree,
+    args.path_python_environment,
+    path_container_image=args.path_container_image,
+    tree_backend=args.tree_backend,
+).watch(
+    poll_interval_min=args.poll_interval_min,
+    poll_interval_max=args.poll_interval_max,
+    max_attempts=args.max_attempts,
+    local_max_workers=args.local_max_workers,
+    max_in_flight=args.max_in_flight,
+    priority=args.priority,
+)
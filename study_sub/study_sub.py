@@ -3,18 +3,33 @@
 # ==================================================================================================
 # Standard library imports
 import os
-from typing import Self
-
-# Third party imports
-from filelock import SoftFileLock
-from study_gen._nested_dicts import nested_get, nested_set
+from contextlib import contextmanager
+from typing import Callable, Self
 
 # Local imports
-from .cluster_submission import ClusterSubmission
+from .cluster_submission import (
+    ClusterSubmission,
+    LocalExecutor,
+    SchedulerSnapshot,
+    SubmissionEngine,
+)
+from .cluster_submission.submission_statements import fix_infn_path
 from .dependency_graph import DependencyGraph
-from .generate_run import generate_run_file
+from .generate_run import (
+    RUNNER_FILENAME,
+    RUNNER_MANIFEST_FILENAME,
+    generate_run_file,
+    generate_runner_file,
+    generate_runner_manifest,
+    get_path_run_hashes,
+    write_run_files,
+)
+from .id_index import IdIndex
+from .job_index import JobIndex
+from .study_watcher import StudyWatcher
+from .tree_store import SqliteTreeStore, get_tree_store
 from .utils.config_utils import ConfigJobs
-from .utils.dict_yaml_utils import load_yaml, write_yaml
+from .utils.resource_utils import autosize_resources
 
 
 # ==================================================================================================
@@ -26,7 +41,22 @@ class StudySub:
         path_tree: str,
         path_python_environment: str,
         path_container_image: str | None = None,
+        tree_backend: str = "yaml",
     ):
+        # Storage backend of the tree, either the yaml file itself or a sqlite database next to it
+        # (imported from the yaml file the first time)
+        if tree_backend == "sqlite" and os.path.splitext(path_tree)[1] in [".yaml", ".yml"]:
+            path_tree_yaml = path_tree
+            path_tree = f"{os.path.splitext(path_tree)[0]}.sqlite"
+            is_new_store = not os.path.exists(path_tree)
+            self.tree_store = SqliteTreeStore(path_tree)
+            if is_new_store and os.path.exists(path_tree_yaml):
+                self.tree_store.import_yaml(path_tree_yaml)
+        elif tree_backend in ["yaml", "sqlite"]:
+            self.tree_store = get_tree_store(path_tree)
+        else:
+            raise ValueError(f"Error: {tree_backend} is not a valid tree backend")
+
         # Path to study files
         self.path_tree = path_tree
 
@@ -60,23 +90,55 @@ class StudySub:
             self.path_container_image = path_container_image
 
         # Lock file to avoid concurrent access (softlock as several platforms are used)
-        self.lock = SoftFileLock(f"{self.path_tree}.lock", timeout=30)
+        self.lock = self.tree_store.lock
+
+        # Index of the jobs of the last loaded tree
+        self._job_index = None
+
+        # State of the jobs in the schedulers, shared between the successive submissions. Local
+        # jobs are found through the run registry of the study.
+        self.scheduler_snapshot = SchedulerSnapshot(path_tree=self.abs_path_tree)
 
-    # dic_tree as a property so that it is reloaded every time it is accessed
+        # Scheduler ids of the jobs, persisted next to the tree
+        self.id_index = IdIndex(path_tree)
+
+        # Pool running the local jobs, shared between the successive submissions
+        self.local_executor = LocalExecutor()
+
+        # Concurrent submission of the jobs to the schedulers (parallelism, rate limit and retries
+        # can be set through its attributes)
+        self.submission_engine = SubmissionEngine()
+
+    # dic_tree as a property so that it is reloaded every time it has been modified on disk, the
+    # completion markers of the finished jobs being folded into it first. The parsed tree is
+    # cached and shared as long as the store is unchanged.
     @property
     def dic_tree(self: Self):
-        return load_yaml(self.path_tree)
+        return self.tree_store.load()
 
     # Setter for the dic_tree property
     @dic_tree.setter
     def dic_tree(self: Self, value: dict):
-        write_yaml(self.path_tree, value)
+        self.tree_store.write(value)
 
-    # Property for the same reason
-    def configure_jobs(self: Self):
-        # Lock since we are modifying the tree
+    def compact_journal(self: Self):
+        # Fold the statuses logged by finished jobs into the tree, in one batch
+        self.tree_store.compact()
+
+    @contextmanager
+    def _edit_tree(self: Self):
+        # Lock since the tree is modified, and drop the cached tree if the edit fails halfway, as
+        # the cached object would otherwise keep changes that were never written
         with self.lock:
-            dic_tree = ConfigJobs(self.dic_tree).find_and_configure_jobs()
+            try:
+                yield self.dic_tree
+            except BaseException:
+                self.tree_store.invalidate()
+                raise
+
+    def configure_jobs(self: Self):
+        with self._edit_tree() as dic_tree:
+            dic_tree = ConfigJobs(dic_tree).find_and_configure_jobs()
 
             # Add the python environment, container image and absolute path of the study to the tree
             dic_tree["python_environment"] = self.path_python_environment
@@ -86,78 +148,175 @@ class StudySub:
             # Explicitly set the dic_tree property to force rewrite
             self.dic_tree = dic_tree
 
-    def get_all_jobs(self: Self):
-        return ConfigJobs(self.dic_tree).find_all_jobs()
-
-    def generate_run_files(self: Self):
-        dic_all_jobs = self.get_all_jobs()
-        # Lock since we are modifying the tree
-        with self.lock:
+    def get_job_index(self: Self, dic_tree: dict | None = None):
+        # Reuse the tree already loaded by the caller, if any
+        if dic_tree is None:
             dic_tree = self.dic_tree
-            for job in dic_all_jobs:
-                l_keys = dic_all_jobs[job]["l_keys"]
-                job_name = job.split("/")[-1]
-                relative_job_folder = "/".join(job.split("/")[:-1])
+
+        # The index is only rebuilt when the tree has been reloaded
+        if self._job_index is None or self._job_index.dic_tree is not dic_tree:
+            self._job_index = JobIndex(dic_tree)
+        return self._job_index
+
+    def get_all_jobs(self: Self, dic_tree: dict | None = None):
+        return self.get_job_index(dic_tree).to_dic_all_jobs()
+
+    def generate_run_files(self: Self, max_workers: int = 32, runner: bool = False):
+        # Run files whose content is unchanged (from the hashes recorded next to the tree) are
+        # not rewritten, and the others are written by max_workers threads. The tree is only
+        # rewritten if the path of a run file changed.
+        # With runner=True, a single runner is written for the whole study, with a manifest of the
+        # jobs it runs, instead of one run.sh per job (except for slurm_docker jobs, whose run.sh
+        # has the INFN fix applied, and for jobs with staging)
+        # The staging of a job is set in the tree, e.g. staging: {inputs: [config.yaml],
+        # outputs: ["*.parquet"], scratch: /pool}, to run it in the node-local scratch area
+        # ($TMPDIR by default) rather than in its folder of the shared filesystem
+        path_runner = f"{self.abs_path}/{self.study_name}/{RUNNER_FILENAME}"
+        path_runner_manifest = f"{self.abs_path}/{self.study_name}/{RUNNER_MANIFEST_FILENAME}"
+        with self._edit_tree() as dic_tree:
+            dic_run_str = {}
+            dic_path_run = {}
+            l_runner_records = []
+            for job in self.get_job_index(dic_tree).jobs():
+                relative_job_folder = "/".join(job.file.split("/")[:-1])
                 absolute_job_folder = f"{self.abs_path}/{relative_job_folder}"
-                generation_number = dic_all_jobs[job]["gen"]
+                if (
+                    runner
+                    and job.node["submission_type"] != "slurm_docker"
+                    and job.node.get("staging") is None
+                ):
+                    l_runner_records.append(
+                        (
+                            absolute_job_folder,
+                            job.name,
+                            job.node["submission_type"] == "local",
+                            job.l_keys,
+                        )
+                    )
+                    dic_path_run.setdefault(path_runner, []).append(job)
+                    continue
+
                 run_str = generate_run_file(
                     absolute_job_folder,
-                    job_name,
+                    job.name,
                     self.path_python_environment,
-                    generation_number,
+                    job.gen,
                     self.abs_path_tree,
-                    l_keys,
-                    htc="htc" in nested_get(dic_tree, l_keys + ["submission_type"]),
+                    job.l_keys,
+                    htc="htc" in job.node["submission_type"],
+                    local=job.node["submission_type"] == "local",
+                    staging=job.node.get("staging"),
                 )
-                # Write the run file
+                # ! Ugly fix, will need to be removed when INFN is fixed. The paths of the run
+                # files of slurm_docker jobs are fixed once here, rather than at each submission
+                if job.node["submission_type"] == "slurm_docker":
+                    run_str = fix_infn_path(run_str)
                 path_run_job = f"{absolute_job_folder}/run.sh"
-                with open(path_run_job, "w") as f:
-                    f.write(run_str)
-
-                # Record the path to the run file in the tree
-                nested_set(dic_tree, l_keys + ["path_run"], path_run_job)
-
-            # Update the dict
-            self.dic_tree = dic_tree
-
-    def submit(self: Self, one_generation_at_a_time: bool = False):
-        dic_all_jobs = self.get_all_jobs()
+                dic_run_str[path_run_job] = run_str
+                dic_path_run[path_run_job] = [job]
 
-        with self.lock:
-            # Get dic tree once to avoid reloading it for every job
-            dic_tree = self.dic_tree
+            # The runner and its manifest are written like the other run files
+            if l_runner_records:
+                manifest_str, width = generate_runner_manifest(l_runner_records)
+                dic_run_str[path_runner_manifest] = manifest_str
+                dic_run_str[path_runner] = generate_runner_file(
+                    path_runner_manifest,
+                    width,
+                    len(l_runner_records),
+                    self.path_python_environment,
+                    self.abs_path_tree,
+                )
 
-            # Collect dict of list of unfinished jobs for every tree branch and every gen
-            dic_to_submit_by_gen = {}
-            for job in dic_all_jobs:
-                # ! This hasn't been debuged properly for n_gen > 2
-                l_dep = DependencyGraph(dic_tree, dic_all_jobs).get_unfinished_dependency(job)
-                if len(l_dep) == 0:
-                    gen = dic_all_jobs[job]["gen"]
-                    if gen not in dic_to_submit_by_gen:
-                        dic_to_submit_by_gen[gen] = []
-                    dic_to_submit_by_gen[gen].append(job)
+            # Write the run files
+            n_written = write_run_files(
+                dic_run_str,
+                max_workers=max_workers,
+                path_hashes=get_path_run_hashes(self.path_tree),
+            )
+            print(
+                f"{n_written} run files written, {len(dic_run_str) - n_written} unchanged run files"
+                " skipped."
+            )
 
-            # Only keep the topmost generation if one_generation_at_a_time is True
-            if one_generation_at_a_time:
-                max_gen = max(dic_to_submit_by_gen.keys())
-                dic_to_submit_by_gen = {max_gen: dic_to_submit_by_gen[max_gen]}
+            # Record the path to the run files (and to the runner) in the tree
+            is_modified = False
+            for path_run_job, l_jobs in dic_path_run.items():
+                for job in l_jobs:
+                    if job.node.get("path_run") != path_run_job:
+                        job.node["path_run"] = path_run_job
+                        is_modified = True
+            path_runner_tree = path_runner if l_runner_records else None
+            if dic_tree.get("path_runner") != path_runner_tree:
+                dic_tree["path_runner"] = path_runner_tree
+                is_modified = True
 
-            # Convert dic_to_submit_by_gen to contain all requested information
-            l_jobs_to_submit = [job for dic_gen in dic_to_submit_by_gen.values() for job in dic_gen]
+            # Update the dict
+            if is_modified:
+                self.dic_tree = dic_tree
 
-            path_submission_file = (
-                f"{self.abs_path}/{self.study_name}/submission/submission_file.sub"
-            )
-            cluster_submission = ClusterSubmission(
-                self.study_name,
-                l_jobs_to_submit,
-                dic_all_jobs,
-                dic_tree,
-                path_submission_file,
+    def autosize_resources(
+        self: Self,
+        percentile: float = 90.0,
+        margin: float = 1.2,
+        min_samples: int = 3,
+        overwrite: bool = False,
+    ):
+        # Set the cpus, memory and walltime of the remaining jobs (and the flavour of the HTCondor
+        # ones) from the given percentile of the usage of the finished jobs running the same
+        # script, increased by margin. Only scripts with at least min_samples finished jobs are
+        # sized, and resources already set are kept unless overwrite is True.
+        with self._edit_tree() as dic_tree:
+            n_jobs_updated = autosize_resources(
+                self.get_job_index(dic_tree),
                 self.abs_path,
+                percentile=percentile,
+                margin=margin,
+                min_samples=min_samples,
+                overwrite=overwrite,
             )
+            print(f"Resources of {n_jobs_updated} jobs set from the usage of the finished jobs.")
+            if n_jobs_updated > 0:
+                self.dic_tree = dic_tree
+
+    def _refresh_id_index(self: Self, job_index: JobIndex):
+        # Ids stored in the tree by previous versions are imported in the index once
+        self.id_index.refresh()
+        if not self.id_index.exists() and len(self.id_index) == 0:
+            self.id_index.import_job_index(job_index)
+
+    def _get_cluster_submission(
+        self: Self,
+        dic_tree: dict,
+        job_index: JobIndex,
+        l_jobs_to_submit: list[str],
+        **kwargs_submission,
+    ) -> ClusterSubmission:
+        # The scheduler snapshot, id index, local executor and submission engine are shared by all
+        # the submissions of the study
+        path_submission_file = f"{self.abs_path}/{self.study_name}/submission/submission_file.sub"
+        return ClusterSubmission(
+            self.study_name,
+            l_jobs_to_submit,
+            job_index,
+            dic_tree,
+            path_submission_file,
+            self.abs_path,
+            scheduler_snapshot=self.scheduler_snapshot,
+            id_index=self.id_index,
+            local_executor=self.local_executor,
+            submission_engine=self.submission_engine,
+            **kwargs_submission,
+        )
 
+    def _submit_jobs(
+        self: Self,
+        cluster_submission: ClusterSubmission,
+        dependency_graph: DependencyGraph,
+        dag: bool = False,
+    ):
+        if dag:
+            cluster_submission.submit_dag(dependency_graph)
+        else:
             # Write and submit the submission files
             dic_submission_files = cluster_submission.write_sub_files()
             for submission_type, (
@@ -165,8 +324,148 @@ class StudySub:
                 l_submission_filenames,
             ) in dic_submission_files.items():
                 cluster_submission.submit(
-                    list_of_jobs, l_submission_filenames, submission_type
+                    list_of_jobs, l_submission_filenames, submission_type, dependency_graph
                 )
 
+    def _get_local_descendants(self: Self, job_index: JobIndex, l_jobs_to_submit: list[str]):
+        # Unfinished local jobs whose unfinished parents are all local jobs being submitted (the
+        # jobs of the index come after their parents)
+        set_jobs_local = {
+            job for job in l_jobs_to_submit if job_index[job].node["submission_type"] == "local"
+        }
+        l_descendants = []
+        if not set_jobs_local:
+            return l_descendants
+        for job in job_index.jobs():
+            if (
+                job.file in set_jobs_local
+                or job.is_finished
+                or job.node["submission_type"] != "local"
+            ):
+                continue
+            l_parents = [parent.file for parent in job.parents if not parent.is_finished]
+            if l_parents and all(parent in set_jobs_local for parent in l_parents):
+                set_jobs_local.add(job.file)
+                l_descendants.append(job.file)
+        return l_descendants
+
+    def _configure_local_executor(
+        self: Self, local_max_workers: int | None = None, local_max_memory: float | None = None
+    ):
+        if local_max_workers is not None:
+            self.local_executor.max_workers = local_max_workers
+        if local_max_memory is not None:
+            self.local_executor.max_memory = local_max_memory
+
+    def submit(
+        self: Self,
+        one_generation_at_a_time: bool = False,
+        dag: bool = False,
+        slurm_array_max_concurrent: int | None = None,
+        htc_max_materialize: int | None = None,
+        htc_max_idle: int | None = None,
+        slurm_docker_array: bool = True,
+        local_max_workers: int | None = None,
+        local_max_memory: float | None = None,
+        local_blocking: bool = False,
+        max_in_flight: int | None = None,
+        priority: str | Callable[[str], float] | None = None,
+        bundle_size: int | None = None,
+        bundle_walltime: float | None = None,
+        bundle_cpus: int = 4,
+    ):
+        # With dag=True, all the unfinished jobs are submitted at once, using the dependencies of
+        # the scheduler (Slurm afterok or HTCondor DAGMan)
+        # The other arguments throttle the scheduler, i.e. the number of tasks of a Slurm array
+        # running at once, and the number of HTCondor jobs materialized/idle at once in the schedd
+        # With slurm_docker_array=False, slurm_docker jobs are submitted with one sbatch per job
+        # Local jobs run in a pool of local_max_workers cores (all by default) and, optionally,
+        # local_max_memory MB. With local_blocking=True, the submission waits for them to finish.
+        # With max_in_flight, only enough jobs are submitted to have at most max_in_flight jobs
+        # of the user running or queuing in the scheduler, by priority ("generation", "runtime",
+        # "weight" or a function of the job). Calling submit repeatedly keeps the scheduler filled
+        # up to this quota.
+        # With bundle_size (and/or bundle_walltime, in minutes), short non-local jobs are packed
+        # into bundles of at most bundle_size jobs (bundle_walltime minutes), each bundle being a
+        # single scheduler job running its jobs on bundle_cpus cores (and counted as a single job
+        # by max_in_flight).
+        if dag and max_in_flight is not None:
+            # All the jobs of a DAG are given to the scheduler at once, hence can't be throttled
+            raise ValueError("Error: max_in_flight is not supported with dag=True.")
+        if dag and (bundle_size is not None or bundle_walltime is not None):
+            print("Warning, bundling is not supported with dag=True. Ignoring it.")
+            bundle_size, bundle_walltime = None, None
+        self._configure_local_executor(local_max_workers, local_max_memory)
+        with self._edit_tree() as dic_tree:
+            job_index = self.get_job_index(dic_tree)
+            dependency_graph = DependencyGraph(job_index)
+            self._refresh_id_index(job_index)
+
+            if dag:
+                # All the unfinished jobs, parents always come before their children
+                l_jobs_to_submit = [job.file for job in job_index.jobs() if not job.is_finished]
+            else:
+                # Collect dict of list of ready jobs for every tree branch and every gen, the
+                # dependency graph being built only once
+                dic_to_submit_by_gen = {}
+                for job in dependency_graph.get_ready_jobs():
+                    gen = job_index[job].gen
+                    if gen not in dic_to_submit_by_gen:
+                        dic_to_submit_by_gen[gen] = []
+                    dic_to_submit_by_gen[gen].append(job)
+
+                # Only keep the topmost generation if one_generation_at_a_time is True
+                if one_generation_at_a_time and dic_to_submit_by_gen:
+                    max_gen = max(dic_to_submit_by_gen.keys())
+                    dic_to_submit_by_gen = {max_gen: dic_to_submit_by_gen[max_gen]}
+
+                # Convert dic_to_submit_by_gen to contain all requested information
+                l_jobs_to_submit = [
+                    job for dic_gen in dic_to_submit_by_gen.values() for job in dic_gen
+                ]
+
+                # The local executor starts the next generations of the local jobs itself, as soon
+                # as their parents succeeded
+                if not one_generation_at_a_time:
+                    l_jobs_to_submit += self._get_local_descendants(job_index, l_jobs_to_submit)
+
+            cluster_submission = self._get_cluster_submission(
+                dic_tree,
+                job_index,
+                l_jobs_to_submit,
+                slurm_array_max_concurrent=slurm_array_max_concurrent,
+                htc_max_materialize=htc_max_materialize,
+                htc_max_idle=htc_max_idle,
+                slurm_docker_array=slurm_docker_array,
+                local_blocking=local_blocking,
+                max_in_flight=max_in_flight,
+                priority=priority,
+                bundle_size=bundle_size,
+                bundle_walltime=bundle_walltime,
+                bundle_cpus=bundle_cpus,
+            )
+            self._submit_jobs(cluster_submission, dependency_graph, dag=dag)
+
             # Update dic_tree from cluster_submission
             self.dic_tree = cluster_submission.dic_tree
+
+    def watch(
+        self: Self,
+        poll_interval_min: float = 30.0,
+        poll_interval_max: float = 600.0,
+        max_attempts: int = 3,
+        local_max_workers: int | None = None,
+        local_max_memory: float | None = None,
+        **kwargs_submission,
+    ):
+        # Keep submitting the jobs as soon as they are ready, until the study is complete (or can't
+        # progress anymore). The other arguments are the ones of submit (except dag,
+        # one_generation_at_a_time and local_blocking).
+        self._configure_local_executor(local_max_workers, local_max_memory)
+        StudyWatcher(
+            self, poll_interval_min, poll_interval_max, max_attempts, **kwargs_submission
+        ).run()
+
+    def wait_local_jobs(self: Self):
+        # Block until all the jobs given to the local executor are done
+        self.local_executor.wait()
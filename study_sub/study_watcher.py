@@ -0,0 +1,193 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import time
+from typing import Self
+
+# Local imports
+from .dependency_graph import DependencyGraph
+
+
+# ==================================================================================================
+# --- Class
+# ==================================================================================================
+class StudyWatcher:
+    def __init__(
+        self: Self,
+        study_sub,
+        poll_interval_min: float = 30.0,
+        poll_interval_max: float = 600.0,
+        max_attempts: int = 3,
+        **kwargs_submission,
+    ):
+        # The schedulers are polled every poll_interval_min seconds while jobs finish or are
+        # submitted, the interval doubling (up to poll_interval_max) while nothing happens
+        self.study_sub = study_sub
+        self.poll_interval_min = poll_interval_min
+        self.poll_interval_max = poll_interval_max
+
+        # Jobs are submitted at most max_attempts times, so that a failing job is not resubmitted
+        # forever
+        self.max_attempts = max_attempts
+        self.kwargs_submission = kwargs_submission
+
+        # Tree, job index and dependency graph are kept in memory between the polls, and only
+        # updated with the jobs that finished in the meantime
+        self.dic_tree = None
+        self.job_index = None
+        self.dependency_graph = None
+
+        # Unfinished jobs whose parents are all finished, in the order they became ready
+        self.dic_ready_jobs: dict[str, None] = {}
+
+        # Number of submissions of each job, and number of successive failed submissions
+        self.dic_n_attempts: dict[str, int] = {}
+        self.set_exhausted_jobs: set[str] = set()
+        self.n_failed_submissions = 0
+
+    # ==============================================================================================
+    # --- Methods to follow the state of the study
+    # ==============================================================================================
+    def _build(self: Self, dic_tree: dict):
+        # Full build, only done at start or if the tree has been rewritten by another process
+        self.dic_tree = dic_tree
+        self.job_index = self.study_sub.get_job_index(dic_tree)
+        self.dependency_graph = DependencyGraph(self.job_index)
+        self.dic_ready_jobs = dict.fromkeys(self.dependency_graph.initialize_readiness())
+        self.study_sub._refresh_id_index(self.job_index)
+
+    def _ingest_completions(self: Self, dic_tree: dict, l_keys_finished: list[list[str]]) -> int:
+        # Returns the number of jobs that finished since the last poll
+        if dic_tree is not self.dic_tree:
+            n_finished = 0
+            if self.dependency_graph is not None:
+                print("The tree has been modified by another process, reloading it.")
+                n_finished = len(self.dependency_graph.set_finished_jobs)
+            self._build(dic_tree)
+            return max(0, len(self.dependency_graph.set_finished_jobs) - n_finished)
+
+        l_jobs_finished = []
+        for l_keys in l_keys_finished:
+            job = self.job_index.get_job_from_l_keys(l_keys)
+            if job is not None and job.file in self.dic_ready_jobs:
+                l_jobs_finished.append(job)
+                del self.dic_ready_jobs[job.file]
+
+        # Only the children of the finished jobs are visited
+        l_files_finished = [job.file for job in l_jobs_finished]
+        for job in self.dependency_graph.apply_completions(l_files_finished):
+            self.dic_ready_jobs[job] = None
+        self.study_sub.id_index.refresh()
+        return len(l_jobs_finished)
+
+    def _is_complete(self: Self) -> bool:
+        return len(self.dependency_graph.set_finished_jobs) == len(self.job_index)
+
+    def _is_submitted(self: Self, job: str, id_job_before: str | None) -> bool:
+        # Local jobs are given to the local executor, the other ones get a new scheduler id
+        local_executor = self.study_sub.local_executor
+        if self.job_index[job].node["submission_type"] == "local":
+            return local_executor.is_tracking(job) or job in local_executor.dic_exit_codes
+        id_job = self.study_sub.id_index.get_id(job)
+        return id_job is not None and id_job != id_job_before
+
+    # ==============================================================================================
+    # --- Methods to poll and submit
+    # ==============================================================================================
+    def _get_jobs_to_submit(self: Self, set_in_flight: set[str]) -> list[str]:
+        l_jobs_to_submit = []
+        for job in self.dic_ready_jobs:
+            if job in set_in_flight:
+                continue
+            if self.dic_n_attempts.get(job, 0) >= self.max_attempts:
+                if job not in self.set_exhausted_jobs:
+                    print(
+                        f"Warning, {job} has been submitted {self.max_attempts} times without"
+                        " finishing. It will not be submitted again."
+                    )
+                    self.set_exhausted_jobs.add(job)
+                continue
+            l_jobs_to_submit.append(job)
+        return l_jobs_to_submit
+
+    def _submit(self: Self, cluster_submission, l_jobs_to_submit: list[str]) -> int:
+        # Returns the number of jobs submitted
+        dic_ids_before = {job: self.study_sub.id_index.get_id(job) for job in l_jobs_to_submit}
+        cluster_submission.l_jobs_to_submit = l_jobs_to_submit
+        try:
+            self.study_sub._submit_jobs(cluster_submission, self.dependency_graph)
+            self.n_failed_submissions = 0
+        except RuntimeError as e:
+            # The jobs that could not be submitted are submitted again at the next poll
+            print(f"Warning, submission failed: {e}")
+            self.n_failed_submissions += 1
+
+        n_submitted = 0
+        for job in l_jobs_to_submit:
+            if self._is_submitted(job, dic_ids_before[job]):
+                self.dic_n_attempts[job] = self.dic_n_attempts.get(job, 0) + 1
+                n_submitted += 1
+        return n_submitted
+
+    def poll(self: Self) -> str:
+        # Ingest the completions, submit the ready jobs and return the state of the study, i.e.
+        # "complete", "stalled", "active" (jobs finished or were submitted) or "idle"
+        with self.study_sub.lock:
+            # Fold the pending updates first. The keys of the finished jobs are drained once the
+            # tree is loaded, since loading it may fold the updates that arrived in the meantime
+            self.study_sub.tree_store.compact()
+            with self.study_sub._edit_tree() as dic_tree:
+                l_keys_finished = self.study_sub.tree_store.pop_finished_keys()
+                n_finished = self._ingest_completions(dic_tree, l_keys_finished)
+                if self._is_complete():
+                    return "complete"
+
+                # Ready jobs already running or queuing (the schedulers are queried once)
+                l_ready_jobs = list(self.dic_ready_jobs)
+                cluster_submission = self.study_sub._get_cluster_submission(
+                    dic_tree, self.job_index, l_ready_jobs, **self.kwargs_submission
+                )
+                running_jobs, queuing_jobs = cluster_submission._get_state_jobs(verbose=False)
+                set_in_flight = set()
+                for job in l_ready_jobs:
+                    path_job = cluster_submission._return_abs_path_job(job)[0]
+                    if path_job in running_jobs or path_job in queuing_jobs:
+                        set_in_flight.add(job)
+
+                # The tree is only written when jobs are submitted
+                n_submitted = 0
+                l_jobs_to_submit = self._get_jobs_to_submit(set_in_flight)
+                if l_jobs_to_submit:
+                    n_submitted = self._submit(cluster_submission, l_jobs_to_submit)
+                    self.study_sub.dic_tree = cluster_submission.dic_tree
+
+        # Nothing runs anymore, and nothing can be submitted
+        if (
+            not set_in_flight
+            and n_submitted == 0
+            and (not l_jobs_to_submit or self.n_failed_submissions >= self.max_attempts)
+        ):
+            return "stalled"
+        return "active" if n_finished > 0 or n_submitted > 0 else "idle"
+
+    def run(self: Self):
+        poll_interval = self.poll_interval_min
+        while True:
+            state = self.poll()
+            if state == "complete":
+                print("All the jobs of the study are finished.")
+                return
+            if state == "stalled":
+                print(
+                    "Warning, the study can't progress anymore (no job running or queuing, and no"
+                    " job can be submitted). Stopping."
+                )
+                return
+
+            # Poll fast while the study progresses, and slow down while the queue is idle
+            if state == "active":
+                poll_interval = self.poll_interval_min
+            else:
+                poll_interval = min(2 * poll_interval, self.poll_interval_max)
+            time.sleep(poll_interval)
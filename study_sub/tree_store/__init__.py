@@ -0,0 +1,9 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+
+# Local imports
+from .sqlite_tree_store import SqliteTreeStore
+from .tree_store import TreeStore, YamlTreeStore, get_tree_store
+
+__all__ = ["SqliteTreeStore", "TreeStore", "YamlTreeStore", "get_tree_store"]
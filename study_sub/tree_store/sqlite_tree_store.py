@@ -0,0 +1,306 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import json
+import sqlite3
+from typing import Any, Self
+
+# Third party imports
+from study_gen._nested_dicts import nested_get, nested_set
+
+# Local imports
+from ..utils.dict_yaml_utils import load_yaml, write_yaml
+from ..utils.journal_utils import has_pending_markers, pop_marker_records, remove_markers
+from .tree_store import TreeStore
+
+# ==================================================================================================
+# --- Schema
+# ==================================================================================================
+
+# One row per job. The attributes column holds the whole job node (source of truth, with its key
+# order), while the other columns are indexed copies of the attributes that are queried often.
+# id_sub is declared without type so that integer ids are kept as integers.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    l_keys TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    gen INTEGER NOT NULL,
+    status TEXT,
+    submission_type TEXT,
+    id_sub,
+    attributes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_gen_status ON jobs (gen, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_submission_type ON jobs (submission_type);
+CREATE INDEX IF NOT EXISTS idx_jobs_id_sub ON jobs (id_sub);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def _split_tree(dic_tree: dict) -> tuple[dict, list[tuple]]:
+    # Separate the job nodes from the rest of the tree. In the returned skeleton, job nodes are
+    # replaced by None so that the key order is kept when the tree is rebuilt.
+    skeleton = {}
+    l_rows = []
+    l_stack = [(dic_tree, skeleton, [])]
+    while l_stack:
+        dic_source, dic_target, l_keys = l_stack.pop()
+        for key, value in dic_source.items():
+            if isinstance(value, dict) and "file" in value and not isinstance(value["file"], dict):
+                dic_target[key] = None
+                l_rows.append((l_keys + [key], value))
+            elif isinstance(value, dict):
+                dic_target[key] = {}
+                l_stack.append((value, dic_target[key], l_keys + [key]))
+            else:
+                dic_target[key] = value
+
+    # Rows are sorted by path to get a deterministic position
+    l_rows.sort(key=lambda row: row[0])
+    return skeleton, [
+        (
+            json.dumps(l_keys),
+            position,
+            node["file"],
+            len(l_keys) - 1,
+            node.get("status"),
+            node.get("submission_type"),
+            node.get("id_sub"),
+            json.dumps(node),
+        )
+        for position, (l_keys, node) in enumerate(l_rows)
+    ]
+
+
+def _rows_to_dic_jobs(l_rows: list[tuple]) -> dict[str, dict[str, Any]]:
+    # Same format as ConfigJobs.find_all_jobs
+    return {file: {"gen": gen, "l_keys": json.loads(l_keys)} for l_keys, file, gen in l_rows}
+
+
+# ==================================================================================================
+# --- Class
+# ==================================================================================================
+class SqliteTreeStore(TreeStore):
+    def __init__(self: Self, path_tree: str):
+        super().__init__(path_tree)
+
+        # Autocommit mode, transactions are handled explicitly. Note that WAL mode requires a
+        # filesystem that supports shared memory and POSIX locks (i.e. not AFS/EOS).
+        self.connection = sqlite3.connect(path_tree, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+        # Tree and rows as last loaded or written by this connection
+        self._dic_tree = None
+        self._dic_rows = {}
+        self._data_version = None
+
+    def _get_data_version(self: Self) -> int:
+        # Changes every time another connection commits to the database
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self: Self) -> dict:
+        # Fold the completion markers written by finished jobs first
+        if has_pending_markers(self.path_tree):
+            self.compact()
+
+        data_version = self._get_data_version()
+        if self._dic_tree is not None and data_version == self._data_version:
+            return self._dic_tree
+
+        row = self.connection.execute(
+            "SELECT value FROM metadata WHERE key = 'skeleton'"
+        ).fetchone()
+        dic_tree = json.loads(row[0]) if row is not None else {}
+
+        self._dic_rows = {}
+        for row in self.connection.execute(
+            "SELECT l_keys, position, file, gen, status, submission_type, id_sub, attributes"
+            " FROM jobs ORDER BY position"
+        ):
+            # The attributes are kept as serialized by write (the json functions of sqlite don't
+            # serialize them the same way), to find the rows that changed
+            node = json.loads(row[7])
+            self._dic_rows[row[0]] = row[:7] + (json.dumps(node),)
+            nested_set(dic_tree, json.loads(row[0]), node)
+
+        self._dic_tree = dic_tree
+        self._data_version = data_version
+        return dic_tree
+
+    def write(self: Self, dic_tree: dict):
+        skeleton, l_rows = _split_tree(dic_tree)
+        dic_rows = {row[0]: row for row in l_rows}
+
+        # Only write the rows that changed since the last load, and only the status of the jobs
+        # whose status changed, so that statuses set concurrently by other jobs are not
+        # overwritten with stale values
+        l_rows_inserted = []
+        l_rows_updated = []
+        l_rows_updated_keep_status = []
+        for row in l_rows:
+            row_loaded = self._dic_rows.get(row[0])
+            if row_loaded is None:
+                l_rows_inserted.append(row)
+            elif row_loaded[4] != row[4]:
+                l_rows_updated.append(row[1:] + row[:1])
+            elif row_loaded != row:
+                l_rows_updated_keep_status.append(row[1:4] + row[5:] + row[7:] + row[:1])
+        l_rows_deleted = [(l_keys,) for l_keys in self._dic_rows if l_keys not in dic_rows]
+
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # The tree written is only up to date if no other connection committed since the load
+            is_current = self._data_version is not None
+            is_current = is_current and self._get_data_version() == self._data_version
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", l_rows_inserted
+            )
+            self.connection.executemany(
+                "UPDATE jobs SET position = ?, file = ?, gen = ?, status = ?, submission_type = ?,"
+                " id_sub = ?, attributes = ? WHERE l_keys = ?",
+                l_rows_updated,
+            )
+            self.connection.executemany(
+                "UPDATE jobs SET position = ?, file = ?, gen = ?, submission_type = ?, id_sub = ?,"
+                " attributes = CASE WHEN status IS NULL THEN ? ELSE json_set(?, '$.status', status)"
+                " END WHERE l_keys = ?",
+                l_rows_updated_keep_status,
+            )
+            self.connection.executemany("DELETE FROM jobs WHERE l_keys = ?", l_rows_deleted)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('skeleton', ?)", (json.dumps(skeleton),)
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            self.invalidate()
+            raise
+
+        # Otherwise, the changes of the other connections are reloaded by the next load
+        self._dic_tree = dic_tree
+        self._dic_rows = dic_rows
+        self._data_version = self._get_data_version() if is_current else None
+
+    def set_status(self: Self, l_keys: list[str], status: str):
+        # Single row transaction, no need for the lock of the whole tree
+        self._set_statuses([{"l_keys": l_keys, "status": status}])
+        self.invalidate()
+
+    def _set_statuses(self: Self, l_records: list[dict]):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany(
+                "UPDATE jobs SET status = ?, attributes = json_set(attributes, '$.status', ?)"
+                " WHERE l_keys = ?",
+                [
+                    (record["status"], record["status"], json.dumps(list(record["l_keys"])))
+                    for record in l_records
+                ],
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def compact(self: Self) -> list[list[str]]:
+        # Apply the statuses of the completion markers to the loaded tree, in place, so that the
+        # jobs indexed from it remain valid.
+        # The markers are written to the database first, in a single transaction
+        l_records, l_paths_markers = pop_marker_records(self.path_tree)
+        if l_records:
+            self._set_statuses(l_records)
+        remove_markers(l_paths_markers)
+
+        if self._dic_tree is None:
+            return []
+
+        # Other connections committed since the tree was loaded (possibly more than statuses),
+        # hence the tree is reloaded in full by the next load. The own commits of the connection
+        # don't change the data version.
+        if self._get_data_version() != self._data_version:
+            self.invalidate()
+            return []
+
+        l_keys_finished = []
+        for record in l_records:
+            l_keys = json.dumps(list(record["l_keys"]))
+            row = self._dic_rows.get(l_keys)
+            if row is None or row[4] == record["status"]:
+                continue
+            node = nested_get(self._dic_tree, record["l_keys"])
+            node["status"] = record["status"]
+            self._dic_rows[l_keys] = row[:4] + (record["status"],) + row[5:7] + (json.dumps(node),)
+            if record["status"] == "finished":
+                l_keys_finished.append(list(record["l_keys"]))
+
+        self.l_keys_finished.extend(l_keys_finished)
+        return l_keys_finished
+
+    def invalidate(self: Self):
+        self._dic_tree = None
+        self._dic_rows = {}
+        self._data_version = None
+
+    def get_jobs(
+        self: Self,
+        status: str | None = None,
+        exclude_status: str | None = None,
+        gen: int | None = None,
+        submission_type: str | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        # E.g. all unfinished gen-2 jobs: get_jobs(exclude_status="finished", gen=2)
+        l_conditions = []
+        l_parameters = []
+        for condition, parameter in [
+            ("status = ?", status),
+            ("status IS NOT ?", exclude_status),
+            ("gen = ?", gen),
+            ("submission_type = ?", submission_type),
+        ]:
+            if parameter is not None:
+                l_conditions.append(condition)
+                l_parameters.append(parameter)
+
+        query = "SELECT l_keys, file, gen FROM jobs"
+        if l_conditions:
+            query += " WHERE " + " AND ".join(l_conditions)
+        query += " ORDER BY position"
+        return _rows_to_dic_jobs(self.connection.execute(query, l_parameters).fetchall())
+
+    def get_job_from_id_sub(self: Self, id_sub: int | str) -> dict[str, dict[str, Any]] | None:
+        l_rows = self.connection.execute(
+            "SELECT l_keys, file, gen FROM jobs WHERE id_sub = ?", (id_sub,)
+        ).fetchall()
+        return _rows_to_dic_jobs(l_rows) if l_rows else None
+
+    def import_yaml(self: Self, path_yaml: str):
+        # Replace the whole content of the database with the yaml tree
+        skeleton, l_rows = _split_tree(load_yaml(path_yaml))
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute("DELETE FROM jobs")
+            self.connection.executemany(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", l_rows
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('skeleton', ?)", (json.dumps(skeleton),)
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.invalidate()
+
+    def export_yaml(self: Self, path_yaml: str):
+        write_yaml(path_yaml, self.load())
@@ -0,0 +1,116 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+from typing import Self
+
+# Third party imports
+from filelock import SoftFileLock
+
+# Local imports
+from ..utils.dict_yaml_utils import invalidate_yaml_cache, load_yaml_cached, write_yaml_cached
+from ..utils.journal_utils import (
+    append_status_record,
+    apply_status_records,
+    has_pending_records,
+    pop_marker_records,
+    pop_status_records,
+    remove_folded_journals,
+    remove_markers,
+)
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def get_tree_store(path_tree: str) -> "TreeStore":
+    # The backend is deduced from the extension, so that scripts only need the path of the tree
+    if os.path.splitext(path_tree)[1] in [".sqlite", ".db"]:
+        # Imported here to avoid a circular import
+        from .sqlite_tree_store import SqliteTreeStore
+
+        return SqliteTreeStore(path_tree)
+    return YamlTreeStore(path_tree)
+
+
+# ==================================================================================================
+# --- Classes
+# ==================================================================================================
+class TreeStore:
+    def __init__(self: Self, path_tree: str):
+        self.path_tree = path_tree
+
+        # Lock file to avoid concurrent access (softlock as several platforms are used)
+        self.lock = SoftFileLock(f"{self.path_tree}.lock", timeout=30)
+
+        # Keys of the jobs found finished by the compactions, kept until drained with
+        # pop_finished_keys, as loading the tree may also compact it
+        self.l_keys_finished: list[list[str]] = []
+
+    def load(self: Self) -> dict:
+        raise NotImplementedError
+
+    def write(self: Self, dic_tree: dict):
+        raise NotImplementedError
+
+    def set_status(self: Self, l_keys: list[str], status: str):
+        raise NotImplementedError
+
+    def invalidate(self: Self):
+        # Drop any cached version of the tree
+        pass
+
+    def compact(self: Self) -> list[list[str]]:
+        # Fold any pending update into the tree, and return the keys of the jobs that finished
+        return []
+
+    def pop_finished_keys(self: Self) -> list[list[str]]:
+        # Keys of the jobs found finished by all the compactions since the last call
+        l_keys_finished, self.l_keys_finished = self.l_keys_finished, []
+        return l_keys_finished
+
+
+class YamlTreeStore(TreeStore):
+    def load(self: Self) -> dict:
+        # Fold the status records appended (or markers written) by finished jobs first
+        if has_pending_records(self.path_tree):
+            self.compact()
+        return load_yaml_cached(self.path_tree)
+
+    def write(self: Self, dic_tree: dict):
+        write_yaml_cached(self.path_tree, dic_tree)
+
+    def set_status(self: Self, l_keys: list[str], status: str):
+        # Only append to the journal, the tree is rewritten lazily
+        append_status_record(self.path_tree, l_keys, status)
+
+    def invalidate(self: Self):
+        invalidate_yaml_cache(self.path_tree)
+
+    def compact(self: Self) -> list[list[str]]:
+        # Apply all the records of the journal and of the completion markers to the tree, and
+        # write it only once. The cached tree is updated in place, hence the jobs indexed from it
+        # remain valid.
+        with self.lock:
+            l_records, l_paths_folding = pop_status_records(self.path_tree)
+            l_records_markers, l_paths_markers = pop_marker_records(self.path_tree)
+            l_records += l_records_markers
+            if l_records:
+                dic_tree = load_yaml_cached(self.path_tree)
+                try:
+                    apply_status_records(dic_tree, l_records)
+                    self.write(dic_tree)
+                except BaseException:
+                    self.invalidate()
+                    raise
+
+            # Only remove the journals and markers once the tree has been written
+            remove_folded_journals(l_paths_folding)
+            remove_markers(l_paths_markers)
+
+        l_keys_finished = [
+            record["l_keys"] for record in l_records if record["status"] == "finished"
+        ]
+        self.l_keys_finished.extend(l_keys_finished)
+        return l_keys_finished
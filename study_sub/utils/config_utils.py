@@ -2,9 +2,11 @@
 # --- Imports
 # ==================================================================================================
 # Standard library imports
-import copy
 from typing import Any, Self
 
+# Local imports
+from ..job_index import Job, JobIndex
+
 
 # ==================================================================================================
 # --- Functions
@@ -64,15 +66,16 @@ def ask_and_set_run_on(dic_gen: dict[str, Any]):
         try:
             submission_type = input(
                 f"What type of submission do you want to use for job {dic_gen['file']}?"
-                " 1: local, 2: htc, 3: htc_docker, 4: slurm, 5: slurm_docker. Default is local."
+                " 1: local, 2: htc, 3: htc_docker, 4: slurm, 5: slurm_docker, 6: slurm_array."
+                " Default is local."
             )
             submission_type = 1 if submission_type == "" else int(submission_type)
-            if submission_type in range(1, 6):
+            if submission_type in range(1, 7):
                 break
             else:
                 raise ValueError
         except ValueError:
-            print("Invalid input. Please enter a number between 1 and 5.")
+            print("Invalid input. Please enter a number between 1 and 6.")
 
     dict_submission_type = {
         1: "local",
@@ -80,6 +83,7 @@ def ask_and_set_run_on(dic_gen: dict[str, Any]):
         3: "htc_docker",
         4: "slurm",
         5: "slurm_docker",
+        6: "slurm_array",
     }
     dic_gen["submission_type"] = dict_submission_type[submission_type]
 
@@ -115,94 +119,60 @@ class ConfigJobs:
         # Load the corresponding yaml as dicts
         self.dic_tree = dic_tree
 
-    def _find_and_configure_jobs_recursion(
-        self: Self,
-        dic_gen: dict[str, Any],
-        depth: int = 0,
-        l_keys: list[str] | None = None,
-        find_only: bool = False,
-    ):
-        if l_keys is None:
-            l_keys = []
-
-        if not hasattr(self, "dic_all_jobs"):
-            raise AttributeError("dic_all_jobs should be set before calling this method")
-
-        # Recursively look for job key in the tree, keeping track of the depth
-        # of the job in the tree
-        for key, value in dic_gen.items():
-            if isinstance(value, dict):
-                self._find_and_configure_jobs_recursion(
-                    dic_gen=value, depth=depth + 1, l_keys=l_keys + [key], find_only=find_only
-                )
-            elif key == "file":
-                # Add job the the list of all jobs
-                # In theory, the list of keys can be obtained from the job path
-                # but it's safer to keep it in the dict
-                self.dic_all_jobs[value] = {
-                    "gen": depth,
-                    "l_keys": copy.copy(l_keys),
+    def _configure_job(self: Self, job: Job):
+        if not hasattr(self, "dic_config_jobs") or not hasattr(self, "skip_configured_jobs"):
+            raise AttributeError(
+                "dic_config_jobs and skip_configured_jobs should be set before calling this method"
+            )
+
+        dic_gen = job.node
+
+        # Ensure configuration is not already set
+        if "submission_type" in dic_gen:
+            if self.skip_configured_jobs is None:
+                self.skip_configured_jobs = ask_skip_configured_jobs()
+            if self.skip_configured_jobs:
+                return
+
+        # If it's the first time we find the job, ask for context and run_on
+        if job.name not in self.dic_config_jobs:
+            print(f"Found job at depth {job.gen}: {job.file}")
+            # Set context and run_on
+            ask_and_set_context(dic_gen)
+            ask_and_set_run_on(dic_gen)
+            if dic_gen["submission_type"] in ["htc", "htc_docker"]:
+                ask_and_set_htc_flavour(dic_gen)
+            else:
+                dic_gen["htc_flavor"] = None
+            dic_gen["status"] = "to_submit"
+            if ask_keep_setting():
+                self.dic_config_jobs[job.name] = {
+                    "context": dic_gen["context"],
+                    "submission_type": dic_gen["submission_type"],
+                    "status": dic_gen["status"],
+                    "htc_flavor": dic_gen["htc_flavor"],
                 }
 
-                # Stop the browsing if we only want to find the jobs
-                if find_only:
-                    return
-
-                # Otherwise ensure that the job can be configured
-                if not hasattr(self, "dic_config_jobs") or not hasattr(
-                    self, "skip_configured_jobs"
-                ):
-                    raise AttributeError(
-                        "dic_config_jobs and skip_configured_jobs should be set before calling this method"
-                    )
-
-                job_name = value.split("/")[-1]
-
-                # Ensure configuration is not already set
-                if "submission_type" in dic_gen:
-                    if self.skip_configured_jobs is None:
-                        self.skip_configured_jobs = ask_skip_configured_jobs()
-                    if self.skip_configured_jobs:
-                        return
-
-                # If it's the first time we find the job, ask for context and run_on
-                if job_name not in self.dic_config_jobs:
-                    print(f"Found job at depth {depth}: {value}")
-                    # Set context and run_on
-                    ask_and_set_context(dic_gen)
-                    ask_and_set_run_on(dic_gen)
-                    if dic_gen["submission_type"] in ["htc", "htc_docker"]:
-                        ask_and_set_htc_flavour(dic_gen)
-                    else:
-                        dic_gen["htc_flavor"] = None
-                    dic_gen["status"] = "to_submit"
-                    if ask_keep_setting():
-                        self.dic_config_jobs[job_name] = {
-                            "context": dic_gen["context"],
-                            "submission_type": dic_gen["submission_type"],
-                            "status": dic_gen["status"],
-                            "htc_flavor": dic_gen["htc_flavor"],
-                        }
-
-                else:
-                    # Merge the configuration of the job with the existing one
-                    dic_gen |= self.dic_config_jobs[job_name]
+        else:
+            # Merge the configuration of the job with the existing one
+            dic_gen |= self.dic_config_jobs[job.name]
 
     def find_and_configure_jobs(self: Self):
         # Variables to store the jobs and their configuration
         self.dic_config_jobs = {}
-        self.dic_all_jobs = {}
         self.skip_configured_jobs = None
 
-        self._find_and_configure_jobs_recursion(self.dic_tree, depth=-1, find_only=False)
+        # Find all jobs (single pass on the tree), then configure them one by one
+        self.job_index = JobIndex(self.dic_tree)
+        self.dic_all_jobs = self.job_index.to_dic_all_jobs()
+        for job in self.job_index.jobs():
+            self._configure_job(job)
 
         return self.dic_tree
 
     def find_all_jobs(self: Self):
-        # Variables to store the jobs and their configuration
-        self.dic_all_jobs = {}
-
         # Find all jobs and associated generation
-        self._find_and_configure_jobs_recursion(self.dic_tree, depth=-1, find_only=True)
+        self.job_index = JobIndex(self.dic_tree)
+        self.dic_all_jobs = self.job_index.to_dic_all_jobs()
 
         return self.dic_all_jobs
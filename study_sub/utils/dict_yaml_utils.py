@@ -1,21 +1,186 @@
 # ==================================================================================================
 # --- Imports
 # ==================================================================================================
+# Standard library imports
+import datetime
+import hashlib
+import io
+import os
+import pickle
+
 # Third party imports
 from ruamel import yaml
 
+# ==================================================================================================
+# --- Cache
+# ==================================================================================================
+
+# In-process cache of the parsed yaml files, keyed by absolute path. Each entry holds the parsed
+# dictionary, the (mtime, size, inode) signature of the file and the hash of its content.
+_dic_cache = {}
+
+
+# ==================================================================================================
+# --- Snapshot
+# ==================================================================================================
+
+# A binary snapshot of the parsed tree is kept next to each yaml file. It starts with the hash of
+# the yaml content it was built from, and is only used if this hash matches the current yaml file.
+SNAPSHOT_EXTENSION = ".snapshot"
+PICKLE_PROTOCOL = 5
+
+
+# Classes of the values parsed from yaml that are not builtin types (timestamps)
+SET_SNAPSHOT_CLASSES = {
+    ("datetime", "date"),
+    ("datetime", "datetime"),
+    ("datetime", "time"),
+    ("datetime", "timedelta"),
+    ("datetime", "timezone"),
+}
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    # Trees only contain builtin types and timestamps. Refusing any other class makes loading a
+    # tampered snapshot as safe as loading the yaml file itself.
+    def find_class(self, module, name):
+        if (module, name) in SET_SNAPSHOT_CLASSES:
+            return getattr(datetime, name)
+        raise pickle.UnpicklingError(f"Unexpected class {module}.{name} in snapshot")
+
+
+def get_path_snapshot(path):
+    return f"{path}{SNAPSHOT_EXTENSION}"
+
+
+def _write_snapshot(path, content_hash, dictionary):
+    path_snapshot = get_path_snapshot(path)
+    path_snapshot_temp = f"{path_snapshot}.{os.getpid()}.tmp"
+    try:
+        with open(path_snapshot_temp, "wb") as f:
+            f.write(content_hash.encode("ascii") + b"\n")
+            pickle.dump(dictionary, f, protocol=PICKLE_PROTOCOL)
+        os.replace(path_snapshot_temp, path_snapshot)
+    except (OSError, pickle.PicklingError) as e:
+        # The snapshot is only an accelerator, the yaml file remains the reference
+        print(f"Warning, could not write the snapshot of {path}: {e}")
+        if os.path.exists(path_snapshot_temp):
+            os.remove(path_snapshot_temp)
+
+
+def _load_snapshot(path, content_hash):
+    try:
+        with open(get_path_snapshot(path), "rb") as f:
+            if f.readline().rstrip(b"\n").decode("ascii") != content_hash:
+                return None
+            return _SnapshotUnpickler(f).load()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning, ignoring unreadable snapshot of {path}: {e}")
+        return None
+
 
 # ==================================================================================================
 # --- Functions
 # ==================================================================================================
+def _dump_yaml_content(dictionary):
+    stream = io.StringIO()
+    yaml.YAML().dump(dictionary, stream)
+    return stream.getvalue().encode("utf-8")
+
+
+def _parse_yaml_content(content):
+    # Safe loader backed by the libyaml C parser, much faster than the round-trip one
+    return yaml.YAML(typ="safe", pure=False).load(content)
+
+
+def _write_yaml_content(path, dictionary):
+    # Write the yaml file and refresh its snapshot together
+    content = _dump_yaml_content(dictionary)
+    with open(path, "wb") as f:
+        f.write(content)
+    content_hash = _hash_content(content)
+    _write_snapshot(path, content_hash, dictionary)
+    return content_hash
+
+
+def _load_yaml_content(path, content=None, content_hash=None):
+    # The hash of the content is only computed if not given by the caller
+    if content is None:
+        with open(path, "rb") as f:
+            content = f.read()
+    if content_hash is None:
+        content_hash = _hash_content(content)
+
+    # Use the snapshot if it is current, otherwise parse the yaml file and refresh the snapshot
+    dictionary = _load_snapshot(path, content_hash)
+    if dictionary is None:
+        dictionary = _parse_yaml_content(content)
+        _write_snapshot(path, content_hash, dictionary)
+    return dictionary, content_hash
+
+
 def write_yaml(path, dictionary):
-    ryaml = yaml.YAML()
-    with open(path, "w") as f:
-        ryaml.dump(dictionary, f)
+    _write_yaml_content(path, dictionary)
 
 
 def load_yaml(path):
-    ryaml = yaml.YAML()
-    with open(path, "r") as f:
-        dictionary = ryaml.load(f)
+    return _load_yaml_content(path)[0]
+
+
+def _get_stat_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _hash_content(content):
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def _update_cache(abs_path, dictionary, stat_signature, content_hash):
+    _dic_cache[abs_path] = {
+        "dictionary": dictionary,
+        "stat_signature": stat_signature,
+        "hash": content_hash,
+    }
+
+
+def load_yaml_cached(path):
+    # Beware that the returned dictionary is shared between all the callers: if it is mutated, it
+    # must be written back with write_yaml_cached (or the cache invalidated)
+    abs_path = os.path.abspath(path)
+    cached = _dic_cache.get(abs_path)
+
+    # Get the signature before reading, so that a concurrent write can only make it stale (and
+    # trigger an extra, harmless, hash check on the next access)
+    stat_signature = _get_stat_signature(abs_path)
+    if cached is not None and cached["stat_signature"] == stat_signature:
+        return cached["dictionary"]
+
+    # The file has been touched (e.g. rewritten by another process) but its content is the same
+    with open(abs_path, "rb") as f:
+        content = f.read()
+    content_hash = _hash_content(content)
+    if cached is not None and cached["hash"] == content_hash:
+        cached["stat_signature"] = stat_signature
+        return cached["dictionary"]
+
+    # Otherwise load the file again (from its snapshot if it is current)
+    dictionary, content_hash = _load_yaml_content(abs_path, content, content_hash)
+    _update_cache(abs_path, dictionary, stat_signature, content_hash)
     return dictionary
+
+
+def write_yaml_cached(path, dictionary):
+    abs_path = os.path.abspath(path)
+    content_hash = _write_yaml_content(abs_path, dictionary)
+    _update_cache(abs_path, dictionary, _get_stat_signature(abs_path), content_hash)
+
+
+def invalidate_yaml_cache(path=None):
+    # Drop a single entry, or the whole cache if no path is given
+    if path is None:
+        _dic_cache.clear()
+    else:
+        _dic_cache.pop(os.path.abspath(path), None)
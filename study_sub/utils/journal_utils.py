@@ -0,0 +1,180 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import glob
+import hashlib
+import json
+import os
+
+# Third party imports
+from filelock import SoftFileLock
+from study_gen._nested_dicts import nested_set
+
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Completion markers written by the run files, one per job, in a folder next to the tree
+MARKER_EXTENSION = ".done"
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def get_path_journal(path_tree):
+    return f"{path_tree}.journal"
+
+
+def get_path_markers(path_tree):
+    return f"{path_tree}.finished"
+
+
+def get_run_key(l_keys):
+    # Short identifier of a job in the file names of its marker and of its run registry entry, as
+    # the joined keys can exceed the maximum length of a file name, or collide
+    return hashlib.blake2b(json.dumps(list(l_keys)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_filename_marker(l_keys):
+    return f"{get_run_key(l_keys)}{MARKER_EXTENSION}"
+
+
+def get_marker_commands(path_tree, str_keys, filename_marker):
+    # Bash commands signalling the end of the job (exit code, runtime and host) without starting
+    # python: the marker is written aside and renamed, so that it is never read half-written
+    path_markers = os.path.abspath(get_path_markers(path_tree))
+    path_marker = f"{path_markers}/{filename_marker}"
+    return (
+        f"mkdir -p {path_markers}\n"
+        + "printf 'exit_code %s\\nruntime %s\\nhostname %s\\nkeys %s\\n' $exit_code"
+        + f' $((SECONDS - start_time)) "$HOSTNAME" "{str_keys}" > {path_marker}.$$.tmp\n'
+        + f"mv -f {path_marker}.$$.tmp {path_marker}\n"
+    )
+
+
+def _get_journal_lock(path_journal):
+    # This lock is only held for the duration of an append or a rename, and is independent from
+    # the lock of the tree
+    return SoftFileLock(f"{path_journal}.lock", timeout=30)
+
+
+def append_status_record(path_tree, l_keys, status="finished"):
+    path_journal = get_path_journal(path_tree)
+    record = json.dumps({"l_keys": list(l_keys), "status": status}) + "\n"
+
+    # Append the record in a single write, without touching the tree
+    with _get_journal_lock(path_journal):
+        fd = os.open(path_journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+def has_pending_records(path_tree):
+    path_journal = get_path_journal(path_tree)
+    if os.path.exists(path_journal) and os.path.getsize(path_journal) > 0:
+        return True
+    return has_pending_markers(path_tree)
+
+
+def has_pending_markers(path_tree):
+    try:
+        with os.scandir(get_path_markers(path_tree)) as it:
+            return any(entry.name.endswith(MARKER_EXTENSION) for entry in it)
+    except OSError:
+        return False
+
+
+def pop_status_records(path_tree):
+    path_journal = get_path_journal(path_tree)
+
+    # Move the journal aside so that new records go to a fresh file while the current ones are
+    # being folded into the tree
+    with _get_journal_lock(path_journal):
+        if os.path.exists(path_journal):
+            os.replace(path_journal, f"{path_journal}.{os.getpid()}.folding")
+
+    # Also collect journals left over by a previous compaction that did not complete
+    l_paths_folding = sorted(glob.glob(f"{glob.escape(path_journal)}.*.folding"))
+
+    l_records = []
+    for path_folding in l_paths_folding:
+        with open(path_folding, "r") as f:
+            for line in f:
+                try:
+                    l_records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"Warning, ignoring malformed record in {path_folding}: {line!r}")
+
+    return l_records, l_paths_folding
+
+
+def _read_marker(path_marker):
+    dic_marker = {}
+    with open(path_marker) as f:
+        for line in f:
+            l_split = line.rstrip("\n").split(" ", 1)
+            if len(l_split) == 2:
+                dic_marker[l_split[0]] = l_split[1]
+    return dic_marker
+
+
+def pop_marker_records(path_tree):
+    # Status records of the jobs that succeeded, from their markers, and markers (path and inode)
+    # to remove once the records are applied. Markers written meanwhile are left for the next fold.
+    l_records = []
+    l_paths_markers = []
+    try:
+        l_entries = list(os.scandir(get_path_markers(path_tree)))
+    except OSError:
+        return l_records, l_paths_markers
+
+    for entry in l_entries:
+        if not entry.name.endswith(MARKER_EXTENSION):
+            continue
+        try:
+            marker = (entry.path, entry.inode())
+            dic_marker = _read_marker(entry.path)
+            exit_code = int(dic_marker["exit_code"])
+            l_keys = dic_marker["keys"].split()
+        except OSError:
+            continue
+        except (KeyError, ValueError):
+            print(f"Warning, ignoring malformed marker {entry.path}")
+            l_paths_markers.append(marker)
+            continue
+
+        if exit_code == 0:
+            l_records.append({"l_keys": l_keys, "status": "finished"})
+        else:
+            print(
+                f"Warning, job {'/'.join(l_keys)} failed with exit code {exit_code} on"
+                f" {dic_marker.get('hostname')} after {dic_marker.get('runtime')}s."
+            )
+        l_paths_markers.append(marker)
+
+    return l_records, l_paths_markers
+
+
+def remove_markers(l_paths_markers):
+    for path_marker, inode in l_paths_markers:
+        # The marker may have been folded by another process already, or replaced by a new run of
+        # the job (hence a new inode), in which case it is kept for the next fold
+        try:
+            if os.stat(path_marker).st_ino == inode:
+                os.remove(path_marker)
+        except FileNotFoundError:
+            pass
+
+
+def apply_status_records(dic_tree, l_records):
+    # Records are applied in order, so that the last status written for a job wins
+    for record in l_records:
+        nested_set(dic_tree, record["l_keys"] + ["status"], record["status"])
+
+
+def remove_folded_journals(l_paths_folding):
+    for path_folding in l_paths_folding:
+        os.remove(path_folding)
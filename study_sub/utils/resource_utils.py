@@ -0,0 +1,109 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import math
+import os
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from ..cluster_submission.submission_statements import get_htc_flavour
+from ..job_index import JobIndex
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Written by run.sh in the folder of each job
+USAGE_FILENAME = "usage.txt"
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def read_usage(job_folder: str) -> dict[str, float] | None:
+    # Elapsed time (in seconds), and maximum memory (in kB) and cpu usage (in %) if measured
+    try:
+        with open(f"{job_folder}/{USAGE_FILENAME}") as f:
+            l_lines = f.read().split("\n")
+    except OSError:
+        return None
+
+    dic_usage = {}
+    for line in l_lines:
+        l_split = line.split()
+        if len(l_split) != 2:
+            continue
+        try:
+            dic_usage[l_split[0]] = float(l_split[1].rstrip("%"))
+        except ValueError:
+            # E.g. "?" for the cpu usage of a job that ran less than a second
+            continue
+    return dic_usage if "elapsed" in dic_usage else None
+
+
+def get_resources_from_usage(
+    l_usages: list[dict[str, float]], percentile: float = 90.0, margin: float = 1.2
+) -> dict[str, int]:
+    # Requests covering the given percentile of the measured usages, with a safety margin
+    dic_resources = {}
+    l_elapsed = [usage["elapsed"] for usage in l_usages]
+    walltime = np.percentile(l_elapsed, percentile) * margin / 60
+    dic_resources["walltime"] = max(1, math.ceil(walltime))
+
+    l_max_rss_kb = [usage["max_rss_kb"] for usage in l_usages if "max_rss_kb" in usage]
+    if l_max_rss_kb:
+        memory = np.percentile(l_max_rss_kb, percentile) * margin / 1024
+        dic_resources["memory"] = max(1, math.ceil(memory))
+
+    # The cpu usage is not increased by the margin, as it is a number of cores
+    l_cpu_percent = [usage["cpu_percent"] for usage in l_usages if "cpu_percent" in usage]
+    if l_cpu_percent:
+        dic_resources["cpus"] = max(1, math.ceil(np.percentile(l_cpu_percent, percentile) / 100))
+
+    return dic_resources
+
+
+def autosize_resources(
+    job_index: JobIndex,
+    abs_path_study: str,
+    percentile: float = 90.0,
+    margin: float = 1.2,
+    min_samples: int = 3,
+    overwrite: bool = False,
+) -> int:
+    # Set the resources of the unfinished jobs from the usage of the finished jobs running the
+    # same script, and pick the HTCondor flavour from the walltime. Resources already set are only
+    # replaced if overwrite is True. Returns the number of jobs updated.
+    dic_usages_by_name = {}
+    l_jobs_unfinished = []
+    for job in job_index.jobs():
+        if not job.is_finished:
+            l_jobs_unfinished.append(job)
+            continue
+        usage = read_usage(f"{abs_path_study}/{os.path.dirname(job.file)}")
+        if usage is not None:
+            dic_usages_by_name.setdefault(job.name, []).append(usage)
+
+    # Only scripts with enough finished jobs are sized
+    dic_resources_by_name = {
+        name: get_resources_from_usage(l_usages, percentile, margin)
+        for name, l_usages in dic_usages_by_name.items()
+        if len(l_usages) >= min_samples
+    }
+
+    n_jobs_updated = 0
+    for job in l_jobs_unfinished:
+        if job.name not in dic_resources_by_name:
+            continue
+        is_updated = False
+        for key, value in dic_resources_by_name[job.name].items():
+            if overwrite or job.node.get(key) is None:
+                job.node[key] = value
+                is_updated = True
+                if key == "walltime" and "htc" in job.node.get("submission_type", ""):
+                    job.node["htc_flavor"] = get_htc_flavour(value)
+        n_jobs_updated += is_updated
+
+    return n_jobs_updated
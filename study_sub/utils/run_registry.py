@@ -0,0 +1,85 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import socket
+import time
+
+# Third party imports
+import psutil
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Running jobs touch their file at this interval (in seconds). A file from another host that has
+# not been touched for several intervals belongs to a job that died without cleaning up.
+HEARTBEAT_INTERVAL = 60
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def get_path_run_registry(path_tree):
+    return f"{path_tree}.running"
+
+
+def _get_filename_run(run_key):
+    return f"{run_key}.pid"
+
+
+def get_registry_commands(path_tree, run_key, job_folder):
+    # Bash commands registering the job (pid, host and folder) when it starts, with a heartbeat
+    # while it runs, and unregistering it when it exits (whatever the exit code). The job is
+    # identified by its run key (see get_run_key).
+    path_registry = os.path.abspath(get_path_run_registry(path_tree))
+    path_file = f"{path_registry}/{_get_filename_run(run_key)}"
+    return (
+        f"mkdir -p {path_registry}\n"
+        + f'echo "$$ $(hostname) {job_folder}" > {path_file}\n'
+        + f"trap 'rm -f {path_file}' EXIT\n"
+        + f"( while kill -0 $$ 2> /dev/null; do touch -c {path_file}; sleep {HEARTBEAT_INTERVAL};"
+        + " done ) > /dev/null 2>&1 &\n"
+    )
+
+
+def _is_alive(pid, hostname, mtime_heartbeat):
+    # Jobs from other hosts can only be checked through their heartbeat
+    if hostname != socket.gethostname():
+        return time.time() - mtime_heartbeat < HEARTBEAT_TIMEOUT
+
+    # The pid may have been reused by a process started after the job, i.e. after its last
+    # heartbeat
+    try:
+        return psutil.Process(pid).create_time() <= mtime_heartbeat + 1
+    except psutil.Error:
+        return False
+
+
+def get_running_folders(path_tree):
+    # Folders of the jobs currently running, from a listing of the registry and a liveness check
+    # of the registered pids only. Files of dead jobs are removed.
+    path_registry = get_path_run_registry(path_tree)
+    if not os.path.isdir(path_registry):
+        return []
+
+    l_folders = []
+    for entry in os.scandir(path_registry):
+        try:
+            with open(entry.path) as f:
+                pid, hostname, folder = f.read().strip().split(" ", 2)
+            mtime = entry.stat().st_mtime
+        except (OSError, ValueError):
+            # E.g. the job just exited, or the file is being written
+            continue
+
+        if _is_alive(int(pid), hostname, mtime):
+            l_folders.append(folder)
+        elif hostname == socket.gethostname() or time.time() - mtime > HEARTBEAT_TIMEOUT:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    return l_folders
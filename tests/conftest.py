@@ -0,0 +1,95 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import json
+import os
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub import StudySub
+from study_sub.utils.dict_yaml_utils import write_yaml
+
+# ==================================================================================================
+# --- Constants
+# ==================================================================================================
+# Fake sbatch, squeue, condor_submit_dag, etc. sharing their state through a json file
+PATH_FAKE_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_bin")
+
+
+# ==================================================================================================
+# --- Classes
+# ==================================================================================================
+class FakeScheduler:
+    def __init__(self, path_state):
+        self.path_state = path_state
+        self.save({"counter": 0, "jobs": {}, "calls": []})
+
+    def load(self):
+        with open(self.path_state) as f:
+            return json.load(f)
+
+    def save(self, state):
+        with open(self.path_state, "w") as f:
+            json.dump(state, f)
+
+    def set_state(self, id_job, state_job):
+        # E.g. to start a queuing job, or to remove a finished one from the queue (None)
+        state = self.load()
+        if state_job is None:
+            del state["jobs"][id_job]
+        else:
+            state["jobs"][id_job]["state"] = state_job
+        self.save(state)
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def fake_scheduler(tmp_path, monkeypatch):
+    fake_scheduler = FakeScheduler(str(tmp_path / "scheduler_state.json"))
+    monkeypatch.setenv("FAKE_SCHEDULER_STATE", fake_scheduler.path_state)
+    monkeypatch.setenv("PATH", f"{PATH_FAKE_BIN}:{os.environ['PATH']}")
+    return fake_scheduler
+
+
+@pytest.fixture
+def make_study(tmp_path, monkeypatch):
+    # Study with one folder per job, all the jobs being children of a root job (already finished)
+    # unless flat is True
+    def make_study(n_jobs, submission_type="slurm_array", flat=True, **kwargs_node):
+        monkeypatch.chdir(tmp_path)
+        dic_tree = {}
+        if not flat:
+            dic_tree["root"] = {
+                "file": "study/root.py",
+                "context": "cpu",
+                "submission_type": submission_type,
+                "htc_flavor": "espresso",
+                "status": "finished",
+            }
+        for idx in range(n_jobs):
+            os.makedirs(tmp_path / "study" / f"job_{idx}", exist_ok=True)
+            dic_tree[f"job_{idx}"] = {
+                "job": {
+                    "file": f"study/job_{idx}/job.py",
+                    "context": "cpu",
+                    "submission_type": submission_type,
+                    "htc_flavor": "espresso",
+                    "status": "to_submit",
+                    **kwargs_node,
+                }
+            }
+        study = StudySub("study/tree.yaml", str(tmp_path / "venv"))
+
+        # As set by configure_jobs
+        dic_tree["python_environment"] = study.path_python_environment
+        dic_tree["container_image"] = None
+        dic_tree["absolute_path"] = study.abs_path
+        write_yaml(str(tmp_path / "study" / "tree.yaml"), dic_tree)
+        return study
+
+    return make_study
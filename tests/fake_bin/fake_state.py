@@ -0,0 +1,23 @@
+# State of the fake scheduler, shared by the fake commands through a json file (locked, as the
+# submission engine runs several commands at once)
+import contextlib
+import fcntl
+import json
+import os
+
+
+@contextlib.contextmanager
+def update_state():
+    with open(os.environ["FAKE_SCHEDULER_STATE"], "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        state = json.load(f)
+        yield state
+        f.seek(0)
+        f.truncate()
+        json.dump(state, f)
+
+
+def load_state():
+    with open(os.environ["FAKE_SCHEDULER_STATE"]) as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        return json.load(f)
@@ -0,0 +1,264 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import glob
+import os
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub import StudySub
+from study_sub.cluster_submission import submission_statements
+from study_sub.id_index import get_path_id_index
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def read_manifests(study):
+    dic_manifests = {}
+    for path_manifest in glob.glob(f"{study.abs_path}/study/submission/*.txt"):
+        with open(path_manifest) as f:
+            dic_manifests[path_manifest] = f.read()
+    return dic_manifests
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_array_top_up_keeps_manifest_of_pending_array(make_study, fake_scheduler):
+    study = make_study(4)
+    study.generate_run_files()
+
+    # First array, still pending when the scheduler is topped up
+    study.submit(max_in_flight=2)
+    dic_manifests_first = read_manifests(study)
+    assert len(dic_manifests_first) == 1
+    assert len(fake_scheduler.load()["jobs"]) == 2
+
+    study.scheduler_snapshot.invalidate()
+    study.submit(max_in_flight=4)
+    dic_manifests = read_manifests(study)
+    assert len(fake_scheduler.load()["jobs"]) == 4
+
+    # The second array has its own manifest and submission file, the first one being unchanged
+    assert len(dic_manifests) == 2
+    for path_manifest, manifest in dic_manifests_first.items():
+        assert dic_manifests[path_manifest] == manifest
+    l_scripts = [call[-1] for call in fake_scheduler.load()["calls"]]
+    assert len(set(l_scripts)) == 2
+
+    # Each job is in exactly one manifest
+    l_folders = [folder for manifest in dic_manifests.values() for folder in manifest.split()]
+    assert sorted(l_folders) == sorted(f"{study.abs_path}/study/job_{idx}" for idx in range(4))
+
+
+def test_array_split_by_resources(make_study, fake_scheduler):
+    study = make_study(3)
+    with study._edit_tree() as dic_tree:
+        dic_tree["job_0"]["job"]["memory"] = 4000
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+    study.submit()
+
+    # Tasks of an array share their resources
+    assert len(fake_scheduler.load()["calls"]) == 2
+    assert sorted(len(manifest.split()) for manifest in read_manifests(study).values()) == [1, 2]
+
+
+def test_htc_runner_executable_with_bundles(make_study, fake_scheduler):
+    study = make_study(3, submission_type="htc")
+    with study._edit_tree() as dic_tree:
+        dic_tree["job_1"]["job"]["htc_flavor"] = "microcentury"
+        dic_tree["job_2"]["job"]["htc_flavor"] = "microcentury"
+        study.dic_tree = dic_tree
+    study.generate_run_files(runner=True)
+
+    # A plain job and a bundle in the same submission file, the bundle being written last
+    study.submit(bundle_size=2)
+    assert len(fake_scheduler.load()["jobs"]) == 2
+    with open(f"{study.abs_path}/study/submission/submission_file_htc.sub") as fid:
+        assert f"executable = {study.dic_tree['path_runner']}\n" in fid.read()
+
+
+def test_recover_ids_of_runner_jobs(make_study, fake_scheduler):
+    study = make_study(3, submission_type="slurm")
+    study.generate_run_files(runner=True)
+    study.submit()
+    l_jobs = [f"study/job_{idx}/job.py" for idx in range(3)]
+    dic_ids = {job: study.id_index.get_id(job) for job in l_jobs}
+
+    # Lose the id index (and the ids kept in the tree)
+    os.remove(get_path_id_index(study.path_tree))
+    with study._edit_tree() as dic_tree:
+        for idx in range(3):
+            del dic_tree[f"job_{idx}"]["job"]["id_sub"]
+        study.dic_tree = dic_tree
+    study = StudySub("study/tree.yaml", study.path_python_environment)
+
+    # The ids are recovered from the folders given to the runner, nothing being submitted again
+    study.submit()
+    assert len(fake_scheduler.load()["calls"]) == 3
+    assert {job: study.id_index.get_id(job) for job in dic_ids} == dic_ids
+
+
+def test_window_by_priority(make_study, fake_scheduler):
+    study = make_study(5, submission_type="slurm")
+    with study._edit_tree() as dic_tree:
+        for idx, weight in enumerate([1, 5, 3, 4, 2]):
+            dic_tree[f"job_{idx}"]["job"]["weight"] = weight
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+
+    # Only the jobs with the highest weights are submitted, up to the quota
+    study.submit(max_in_flight=2, priority="weight")
+    assert sorted(study.id_index.dic_job_to_ids) == ["study/job_1/job.py", "study/job_3/job.py"]
+
+    # Once a job is done, the next one is submitted
+    fake_scheduler.set_state(study.id_index.get_id("study/job_1/job.py"), None)
+    study.tree_store.set_status(["job_1", "job"], "finished")
+    study.scheduler_snapshot.invalidate()
+    study.submit(max_in_flight=2, priority="weight")
+    assert study.id_index.get_id("study/job_2/job.py") is not None
+    assert study.id_index.get_id("study/job_4/job.py") is None
+    assert len(fake_scheduler.load()["calls"]) == 3
+
+
+def test_window_by_runtime(make_study, fake_scheduler):
+    study = make_study(3, submission_type="slurm")
+    with study._edit_tree() as dic_tree:
+        dic_tree["job_1"]["job"]["walltime"] = 600
+        dic_tree["job_2"]["job"]["walltime"] = 30
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+
+    # The longest job first, the jobs without walltime last
+    study.submit(max_in_flight=2, priority="runtime")
+    assert sorted(study.id_index.dic_job_to_ids) == ["study/job_1/job.py", "study/job_2/job.py"]
+
+
+def test_ids_of_finished_jobs_cleared(make_study, fake_scheduler):
+    study = make_study(2, submission_type="slurm")
+    study.generate_run_files()
+    study.submit()
+    id_job = study.id_index.get_id("study/job_0/job.py")
+
+    # The job finishes, hence it is not part of the jobs to submit anymore
+    fake_scheduler.set_state(id_job, None)
+    study.tree_store.set_status(["job_0", "job"], "finished")
+    study.scheduler_snapshot.invalidate()
+    study.submit()
+    assert study.id_index.get_id("study/job_0/job.py") is None
+    assert study.id_index.get_history("study/job_0/job.py") == [id_job]
+    assert "id_sub" not in study.dic_tree["job_0"]["job"]
+    assert study.id_index.get_id("study/job_1/job.py") is not None
+
+
+def test_done_bundles_removed(make_study, fake_scheduler):
+    study = make_study(2, submission_type="slurm")
+    study.generate_run_files()
+    study.submit(bundle_size=2)
+    l_bundles = glob.glob(f"{study.abs_path}/study/submission/bundles/*")
+    assert len(l_bundles) == 1
+
+    # Kept while the bundle is queuing
+    study.scheduler_snapshot.invalidate()
+    study.submit(bundle_size=2)
+    assert glob.glob(f"{study.abs_path}/study/submission/bundles/*") == l_bundles
+
+    # Removed once it is done
+    fake_scheduler.set_state("1", None)
+    study.tree_store.set_status(["job_0", "job"], "finished")
+    study.tree_store.set_status(["job_1", "job"], "finished")
+    study.scheduler_snapshot.invalidate()
+    study.submit(bundle_size=2)
+    assert glob.glob(f"{study.abs_path}/study/submission/bundles/*") == []
+
+
+def test_htc_jobs_not_materialized_kept(make_study, fake_scheduler):
+    study = make_study(3, submission_type="htc")
+    study.generate_run_files()
+    study.submit(htc_max_materialize=1)
+
+    # Only the first job is materialized, the others wait in the factory of the cluster
+    assert len(fake_scheduler.load()["jobs"]) == 1
+    assert study.scheduler_snapshot.get_condor_states() == {
+        f"1.{idx}": "queuing" for idx in range(3)
+    }
+
+    # Hence none of them is submitted again
+    study.scheduler_snapshot.invalidate()
+    study.submit(htc_max_materialize=1)
+    assert len(fake_scheduler.load()["calls"]) == 1
+    for idx in range(3):
+        assert study.id_index.get_id(f"study/job_{idx}/job.py") == f"1.{idx}"
+
+
+def test_slurm_docker_array_fix(make_study, fake_scheduler, monkeypatch, tmp_path):
+    # The folder of the study plays the role of the path to fix
+    monkeypatch.setattr(submission_statements, "INFN_PATH_TO_REPLACE", str(tmp_path))
+    monkeypatch.setattr(submission_statements, "INFN_PATH_REPLACEMENT", "/home/HPC")
+    study = make_study(2, submission_type="slurm_docker")
+    with study._edit_tree() as dic_tree:
+        dic_tree["container_image"] = f"{tmp_path}/image.sif"
+        study.dic_tree = dic_tree
+
+    # The run files are fixed when generated
+    study.generate_run_files()
+    for idx in range(2):
+        with open(f"{study.abs_path}/study/job_{idx}/run.sh") as fid:
+            run_str = fid.read()
+        assert str(tmp_path) not in run_str
+        assert f"/home/HPC/study/job_{idx}" in run_str
+
+    # Hence they are left untouched by the submission, which only fixes its own files
+    mtime = os.path.getmtime(f"{study.abs_path}/study/job_0/run.sh")
+    study.submit()
+    assert os.path.getmtime(f"{study.abs_path}/study/job_0/run.sh") == mtime
+    dic_manifests = read_manifests(study)
+    assert len(dic_manifests) == 1
+    assert list(dic_manifests.values())[0].split() == [
+        f"/home/HPC/study/job_{idx}" for idx in range(2)
+    ]
+    (filename_sub,) = glob.glob(f"{study.abs_path}/study/submission/*_docker_array_*.sub")
+    with open(filename_sub) as fid:
+        assert "singularity exec /home/HPC/image.sif" in fid.read()
+    assert len(study.id_index) == 2
+
+
+def test_window_counts_bundles(make_study, fake_scheduler):
+    study = make_study(5, submission_type="slurm")
+    study.generate_run_files()
+
+    # Two scheduler jobs: a bundle of two jobs, then a bundle of the next two
+    study.submit(max_in_flight=2, bundle_size=2)
+    assert len(fake_scheduler.load()["jobs"]) == 2
+    assert len(study.id_index) == 4
+    assert study.id_index.get_id("study/job_4/job.py") is None
+
+    # The window is full
+    study.scheduler_snapshot.invalidate()
+    study.submit(max_in_flight=2, bundle_size=2)
+    assert len(fake_scheduler.load()["calls"]) == 2
+
+
+def test_window_rejected_with_dag(make_study, fake_scheduler):
+    study = make_study(2, submission_type="slurm")
+    study.generate_run_files()
+    with pytest.raises(ValueError, match="max_in_flight"):
+        study.submit(dag=True, max_in_flight=2)
+    assert fake_scheduler.load()["calls"] == []
+
+
+def test_bundle_unknown_flavour(make_study, fake_scheduler):
+    study = make_study(2, submission_type="htc", htc_flavor="unknown", walltime=5)
+    study.generate_run_files()
+    study.submit(bundle_size=2)
+
+    # The bundle falls back to the longest flavour
+    (filename_manifest,) = glob.glob(f"{study.abs_path}/study/submission/*_htc_manifest.txt")
+    with open(filename_manifest) as fid:
+        assert fid.read().split(", ")[1] == "nextweek"
+    assert len(study.id_index) == 2
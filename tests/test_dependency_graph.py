@@ -0,0 +1,85 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import random
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.dependency_graph import DependencyGraph
+from study_sub.job_index import JobIndex
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def make_random_tree(rng, max_depth):
+    # Folders with 0 to 3 jobs and 0 to 3 subfolders, down to max_depth levels. Returns the tree
+    # and the parents of every job, i.e. the jobs of all its ancestor folders.
+    dic_parents = {}
+
+    def make_folder(path, depth, l_ancestors):
+        dic_folder = {}
+        l_jobs_folder = []
+        for idx_job in range(rng.randint(0, 3)):
+            file = f"{path}/job_{idx_job}.py"
+            status = "finished" if rng.random() < 0.3 else "to_submit"
+            dic_folder[f"job_{idx_job}"] = {"file": file, "status": status}
+            dic_parents[file] = list(l_ancestors)
+            l_jobs_folder.append(file)
+        if depth < max_depth:
+            for idx_folder in range(rng.randint(0, 3)):
+                dic_folder[f"folder_{idx_folder}"] = make_folder(
+                    f"{path}/folder_{idx_folder}", depth + 1, l_ancestors + l_jobs_folder
+                )
+        return dic_folder
+
+    return make_folder("study", 0, []), dic_parents
+
+
+def get_n_unfinished_parents(dic_parents, set_finished):
+    # Brute force recomputation of the counters
+    return {
+        file: sum(parent not in set_finished for parent in l_parents)
+        for file, l_parents in dic_parents.items()
+    }
+
+
+def get_ready_jobs(dic_parents, set_finished):
+    dic_n_unfinished = get_n_unfinished_parents(dic_parents, set_finished)
+    return {file for file, n in dic_n_unfinished.items() if n == 0 and file not in set_finished}
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+@pytest.mark.parametrize("seed", range(50))
+def test_apply_completions_matches_brute_force(seed):
+    rng = random.Random(seed)
+    dic_tree, dic_parents = make_random_tree(rng, max_depth=rng.randint(1, 6))
+    job_index = JobIndex(dic_tree)
+    dependency_graph = DependencyGraph(job_index)
+
+    set_finished = {job.file for job in job_index.jobs() if job.is_finished}
+    l_ready_jobs = dependency_graph.initialize_readiness()
+    assert set(l_ready_jobs) == get_ready_jobs(dic_parents, set_finished)
+    assert dependency_graph.dic_n_unfinished_parents == get_n_unfinished_parents(
+        dic_parents, set_finished
+    )
+
+    # Batches of completions in any order, with duplicates and jobs already finished
+    l_files = list(dic_parents)
+    while len(set_finished) < len(l_files):
+        l_batch = rng.choices(l_files, k=rng.randint(1, 5))
+        set_ready_before = get_ready_jobs(dic_parents, set_finished)
+        l_newly_ready = dependency_graph.apply_completions(l_batch)
+        set_finished |= set(l_batch)
+
+        assert dependency_graph.dic_n_unfinished_parents == get_n_unfinished_parents(
+            dic_parents, set_finished
+        )
+        set_ready_after = get_ready_jobs(dic_parents, set_finished)
+        assert set_ready_after - set_ready_before <= set(l_newly_ready)
+        assert not set(l_newly_ready) & set_ready_before
@@ -0,0 +1,133 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import datetime
+import os
+import pickle
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.utils import dict_yaml_utils
+from study_sub.utils.dict_yaml_utils import (
+    get_path_snapshot,
+    invalidate_yaml_cache,
+    load_yaml,
+    load_yaml_cached,
+    write_yaml,
+    write_yaml_cached,
+)
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def path_yaml(tmp_path):
+    path_yaml = str(tmp_path / "tree.yaml")
+    write_yaml(path_yaml, {"job": {"file": "study/job.py", "status": "to_submit"}})
+    yield path_yaml
+    invalidate_yaml_cache()
+
+
+@pytest.fixture
+def no_parsing(monkeypatch):
+    # Any parsing of the yaml content fails, to check that the cache or the snapshot is used
+    def parse_yaml_content(content):
+        raise AssertionError("The yaml file should not be parsed")
+
+    monkeypatch.setattr(dict_yaml_utils, "_parse_yaml_content", parse_yaml_content)
+
+
+def rewrite_externally(path, content):
+    # Rewrite as another process would, without going through the cache nor the snapshot
+    with open(path, "w") as f:
+        f.write(content)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_cached_tree_is_shared(path_yaml, no_parsing):
+    dic_tree = load_yaml_cached(path_yaml)
+    assert load_yaml_cached(path_yaml) is dic_tree
+    assert dic_tree == {"job": {"file": "study/job.py", "status": "to_submit"}}
+
+
+def test_cache_follows_writes(path_yaml):
+    dic_tree = load_yaml_cached(path_yaml)
+    dic_tree["job"]["status"] = "finished"
+    write_yaml_cached(path_yaml, dic_tree)
+    assert load_yaml_cached(path_yaml) is dic_tree
+    assert load_yaml(path_yaml)["job"]["status"] == "finished"
+
+
+def test_cache_reloads_modified_file(path_yaml):
+    dic_tree = load_yaml_cached(path_yaml)
+    rewrite_externally(path_yaml, "job:\n  file: study/job.py\n  status: finished\n")
+    dic_tree_reloaded = load_yaml_cached(path_yaml)
+    assert dic_tree_reloaded is not dic_tree
+    assert dic_tree_reloaded["job"]["status"] == "finished"
+
+
+def test_cache_kept_if_content_unchanged(path_yaml):
+    dic_tree = load_yaml_cached(path_yaml)
+    with open(path_yaml) as f:
+        content = f.read()
+
+    # Touched, but with the same content
+    rewrite_externally(path_yaml, content)
+    assert load_yaml_cached(path_yaml) is dic_tree
+
+
+def test_snapshot_used_when_current(path_yaml, no_parsing):
+    assert os.path.exists(get_path_snapshot(path_yaml))
+    assert load_yaml(path_yaml)["job"]["status"] == "to_submit"
+
+
+def test_snapshot_ignored_when_stale(path_yaml):
+    load_yaml_cached(path_yaml)
+    rewrite_externally(path_yaml, "job:\n  file: study/job.py\n  status: finished\n")
+
+    # The snapshot was built from the previous content, the yaml file is parsed again and the
+    # snapshot refreshed
+    assert load_yaml(path_yaml)["job"]["status"] == "finished"
+    with open(get_path_snapshot(path_yaml), "rb") as f:
+        f.readline()
+        assert pickle.load(f)["job"]["status"] == "finished"
+
+
+def test_snapshot_with_class_rejected(path_yaml):
+    # A snapshot referencing a class is never unpickled, the yaml file is parsed instead
+    with open(get_path_snapshot(path_yaml), "rb") as f:
+        content_hash = f.readline()
+    with open(get_path_snapshot(path_yaml), "wb") as f:
+        f.write(content_hash)
+        pickle.dump({"job": os.stat_result((0,) * 10)}, f)
+    assert load_yaml(path_yaml)["job"]["status"] == "to_submit"
+
+
+def test_snapshot_with_timestamps(path_yaml, monkeypatch):
+    # Timestamps parsed from the yaml file are kept in the snapshot
+    rewrite_externally(
+        path_yaml,
+        "job:\n  file: study/job.py\n  date: 2024-01-02\n  time: 2024-01-02 03:04:05+01:00\n",
+    )
+    dic_tree = load_yaml(path_yaml)
+    assert isinstance(dic_tree["job"]["date"], datetime.date)
+
+    # And loaded from it, the content being hashed only once
+    l_hashed = []
+    hash_content = dict_yaml_utils._hash_content
+    monkeypatch.setattr(
+        dict_yaml_utils,
+        "_hash_content",
+        lambda content: l_hashed.append(content) or hash_content(content),
+    )
+    monkeypatch.setattr(dict_yaml_utils, "_parse_yaml_content", None)
+    assert load_yaml_cached(path_yaml) == dic_tree
+    assert len(l_hashed) == 1
@@ -0,0 +1,169 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import random
+import subprocess
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.generate_run import (
+    generate_run_file,
+    generate_runner_file,
+    generate_runner_manifest,
+    write_run_files,
+)
+from study_sub.utils.journal_utils import get_filename_marker, get_path_markers, get_run_key
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def make_records(rng, n_jobs):
+    # Folders of various lengths, with characters sorted differently depending on the locale
+    l_records = []
+    for idx_job in range(n_jobs):
+        name = "".join(rng.choices("aB_-.0z", k=rng.randint(1, 12)))
+        job_folder = f"/study/{name}_{idx_job}"
+        l_records.append((job_folder, f"job_{idx_job}.py", idx_job % 2 == 0, [name, str(idx_job)]))
+    return l_records
+
+
+def write_lookup(tmp_path, l_records):
+    # Runner stopped right after the lookup of the job, printing the record found
+    manifest_str, width = generate_runner_manifest(l_records)
+    path_manifest = tmp_path / "runner_manifest.txt"
+    path_manifest.write_text(manifest_str)
+    runner_str = generate_runner_file(
+        str(path_manifest), width, len(l_records), "/venv/bin/activate", "/study/tree.yaml"
+    )
+    lookup_str = runner_str.split('if [ "$is_local" = 1 ]; then\n')[0]
+    path_lookup = tmp_path / "lookup.sh"
+    path_lookup.write_text(lookup_str + 'echo "$job_folder|$job_name|$is_local|$run_key"\n')
+    return str(path_lookup)
+
+
+def lookup(path_lookup, job):
+    return subprocess.run(["bash", path_lookup, job], capture_output=True, text=True)
+
+
+def run_staged_job(tmp_path, staging):
+    # Job writing its output next to its input, run from the scratch area
+    job_folder = tmp_path / "study" / "job"
+    job_folder.mkdir(parents=True)
+    (job_folder / "job.py").write_text(
+        "import os\n"
+        + "with open('result.txt', 'w') as f:\n"
+        + "    f.write(open('input.txt').read() + os.getcwd())\n"
+    )
+    (job_folder / "input.txt").write_text("input ")
+    (tmp_path / "activate").write_text("")
+    path_tree = str(tmp_path / "study" / "tree.yaml")
+    path_activate = str(tmp_path / "activate")
+    run_str = generate_run_file(
+        str(job_folder), "job.py", path_activate, 1, path_tree, ["job"], staging=staging
+    )
+    (job_folder / "run.sh").write_text(run_str)
+    process = subprocess.run(["bash", str(job_folder / "run.sh")], capture_output=True, text=True)
+    return process, job_folder, f"{get_path_markers(path_tree)}/{get_filename_marker(['job'])}"
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_manifest_sorted_and_padded():
+    l_records = [
+        ("/study/b", "job.py", False, ["b"]),
+        ("/study/a_long_folder", "job.py", True, ["a_long_folder"]),
+    ]
+    manifest_str, width = generate_runner_manifest(l_records)
+    l_lines = manifest_str.split("\n")[:-1]
+    assert all(len(line) + 1 == width for line in l_lines)
+    assert [line.split("\t")[0] for line in l_lines] == ["/study/a_long_folder", "/study/b"]
+    assert l_lines[0].split("\t")[2] == "1"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_runner_lookup(tmp_path, seed):
+    l_records = make_records(random.Random(seed), 40)
+    path_lookup = write_lookup(tmp_path, l_records)
+
+    # Each job is found by its folder (with or without trailing slash) and by its index
+    l_folders_sorted = sorted(job_folder for job_folder, *_ in l_records)
+    for job_folder, job_name, local, l_keys in l_records:
+        expected = f"{job_folder}|{job_name}|{int(local)}|{get_run_key(l_keys)}"
+        assert lookup(path_lookup, job_folder).stdout.strip() == expected
+        assert lookup(path_lookup, f"{job_folder}/").stdout.strip() == expected
+        idx_job = l_folders_sorted.index(job_folder)
+        assert lookup(path_lookup, str(idx_job)).stdout.strip() == expected
+
+
+def test_runner_lookup_missing_folder(tmp_path):
+    path_lookup = write_lookup(tmp_path, make_records(random.Random(0), 10))
+    output = lookup(path_lookup, "/study/missing")
+    assert output.returncode == 1
+    assert "not found" in output.stderr
+
+
+def test_staging(tmp_path):
+    (tmp_path / "scratch").mkdir()
+    staging = {
+        "inputs": ["input.txt"],
+        "outputs": ["result.txt"],
+        "scratch": str(tmp_path / "scratch"),
+    }
+    process, job_folder, path_marker = run_staged_job(tmp_path, staging)
+
+    # The job ran in the scratch area, which is removed once the outputs are copied back
+    assert process.returncode == 0
+    assert (job_folder / "result.txt").read_text().startswith(f"input {tmp_path}/scratch/")
+    assert list((tmp_path / "scratch").iterdir()) == []
+    assert os.path.exists(path_marker)
+
+
+@pytest.mark.parametrize(
+    "input_file, scratch", [("input.txt", "missing_scratch"), ("missing.txt", "scratch")]
+)
+def test_staging_failure(tmp_path, input_file, scratch):
+    # The job is not run if the scratch area can't be used or the inputs can't be copied
+    (tmp_path / "scratch").mkdir()
+    staging = {"inputs": [input_file], "scratch": str(tmp_path / scratch)}
+    process, job_folder, path_marker = run_staged_job(tmp_path, staging)
+    assert process.returncode == 1
+    assert not (job_folder / "result.txt").exists()
+    assert not (job_folder / "output_python.txt").exists()
+    assert list((tmp_path / "scratch").iterdir()) == []
+
+    # But its failure is signalled
+    with open(path_marker) as f:
+        assert f.readline() == "exit_code 1\n"
+
+
+def test_staging_input_outside_scratch(tmp_path):
+    # An input more than one level above the job would be copied outside of the scratch folder
+    staging = {"inputs": ["../input.txt", "data/../../../input.txt"]}
+    with pytest.raises(ValueError, match="data/../../../input.txt"):
+        generate_run_file(
+            "/study/job", "job.py", "/venv", 1, "/tree.yaml", ["job"], staging=staging
+        )
+
+
+def test_write_run_files_skips_unchanged(tmp_path):
+    path_hashes = str(tmp_path / "tree.yaml.run_hashes.json")
+    dic_run_str = {str(tmp_path / f"run_{idx}.sh"): f"echo {idx}\n" for idx in range(3)}
+    assert write_run_files(dic_run_str, path_hashes=path_hashes) == 3
+
+    # Unchanged files are compared through their hash, without being read
+    (tmp_path / "run_0.sh").write_text("edited\n")
+    assert write_run_files(dic_run_str, path_hashes=path_hashes) == 0
+    assert (tmp_path / "run_0.sh").read_text() == "edited\n"
+
+    # Changed or removed files are written again
+    dic_run_str[str(tmp_path / "run_1.sh")] = "echo changed\n"
+    os.remove(tmp_path / "run_2.sh")
+    assert write_run_files(dic_run_str, path_hashes=path_hashes) == 2
+    assert (tmp_path / "run_1.sh").read_text() == "echo changed\n"
+    assert (tmp_path / "run_2.sh").read_text() == "echo 2\n"
@@ -0,0 +1,100 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import json
+import os
+
+# Local imports
+from study_sub.id_index import (
+    IdIndex,
+    get_id_key_bundle_member,
+    get_path_id_index,
+    get_path_id_log,
+)
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_add_and_history():
+    id_index = IdIndex(None)
+    id_index.add(1234, "study/job_0/job.py")
+    assert id_index.get_job("1234") == "study/job_0/job.py"
+    assert id_index.get_id("study/job_0/job.py") == "1234"
+
+    # A new id of the job moves the previous one to its history
+    id_index.add("1240_3", "study/job_0/job.py")
+    assert 1234 not in id_index
+    assert id_index.get_id("study/job_0/job.py") == "1240_3"
+    assert id_index.get_history("study/job_0/job.py") == ["1234"]
+
+    # An id can only refer to one job
+    id_index.add("1240_3", "study/job_1/job.py")
+    assert id_index.get_id("study/job_0/job.py") is None
+    assert id_index.get_jobs("1240_3") == ["study/job_1/job.py"]
+    assert len(id_index) == 1
+
+
+def test_bundle_members():
+    id_index = IdIndex(None)
+    for idx_member in range(3):
+        id_index.add(get_id_key_bundle_member(1234, idx_member), f"study/job_{idx_member}/job.py")
+
+    # The bundle id gives all its jobs, until they are all removed
+    assert id_index.get_jobs(1234) == [f"study/job_{idx}/job.py" for idx in range(3)]
+    id_index.remove(get_id_key_bundle_member(1234, 0))
+    assert id_index.get_jobs(1234) == [f"study/job_{idx}/job.py" for idx in range(1, 3)]
+    id_index.remove(get_id_key_bundle_member(1234, 1))
+    id_index.remove(get_id_key_bundle_member(1234, 2))
+    assert id_index.get_jobs(1234) == []
+    assert id_index.dic_bundle_to_jobs == {}
+
+
+def test_record_replayed_from_log(tmp_path):
+    path_tree = str(tmp_path / "tree.yaml")
+    path_id_log = get_path_id_log(get_path_id_index(path_tree))
+    id_index = IdIndex(path_tree)
+    id_index.record(1234, "study/job_0/job.py")
+    id_index.record(get_id_key_bundle_member(1235, 0), "study/job_1/job.py")
+
+    # E.g. an interrupted submission, with a partially written last line
+    with open(path_id_log, "a") as f:
+        f.write('{"id": "12')
+    id_index_reloaded = IdIndex(path_tree)
+    assert id_index_reloaded.get_id("study/job_0/job.py") == "1234"
+    assert id_index_reloaded.get_jobs(1235) == ["study/job_1/job.py"]
+
+    # Writing the index folds the log into it
+    id_index_reloaded.write()
+    assert not os.path.exists(path_id_log)
+    with open(get_path_id_index(path_tree)) as f:
+        assert json.load(f)["study/job_0/job.py"] == {"current": "1234", "history": []}
+
+
+def test_refresh(tmp_path):
+    path_tree = str(tmp_path / "tree.yaml")
+    id_index = IdIndex(path_tree)
+    id_index.add(1234, "study/job_0/job.py")
+    id_index.write()
+
+    # Written by another process
+    id_index_other = IdIndex(path_tree)
+    id_index_other.remove(1234)
+    id_index_other.add(1300, "study/job_0/job.py")
+    id_index_other.write()
+
+    id_index.refresh()
+    assert id_index.get_id("study/job_0/job.py") == "1300"
+    assert id_index.get_history("study/job_0/job.py") == ["1234"]
+
+
+def test_write_only_if_modified(tmp_path):
+    path_tree = str(tmp_path / "tree.yaml")
+    id_index = IdIndex(path_tree)
+    id_index.write()
+    assert not id_index.exists()
+    id_index.add(1234, "study/job_0/job.py")
+    id_index.write()
+    assert id_index.exists()
+    assert not id_index.modified
@@ -0,0 +1,82 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.job_index import JobIndex
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def dic_tree():
+    # Two jobs in the root folder, each point having a job and a subfolder with another job
+    return {
+        "base": {"file": "study/base.py", "status": "finished"},
+        "base_bis": {"file": "study/base_bis.py"},
+        "point_0": {
+            "job": {"file": "study/point_0/job.py", "status": "to_submit"},
+            "sub": {"job": {"file": "study/point_0/sub/job.py"}},
+        },
+        "point_1": {"job": {"file": "study/point_1/job.py"}, "parameters": {"x": 1}},
+        "python_environment": "/venv",
+    }
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_jobs_in_tree_order(dic_tree):
+    job_index = JobIndex(dic_tree)
+    assert list(job_index) == [
+        "study/base.py",
+        "study/base_bis.py",
+        "study/point_0/job.py",
+        "study/point_0/sub/job.py",
+        "study/point_1/job.py",
+    ]
+    assert len(job_index) == 5
+    assert "study/point_1/job.py" in job_index
+    assert "study/point_1" not in job_index
+
+    job = job_index["study/point_0/sub/job.py"]
+    assert job.l_keys == ["point_0", "sub", "job"]
+    assert job.gen == 2
+    assert job.name == "job.py"
+    assert job_index.get_job_from_l_keys(["point_0", "sub", "job"]) is job
+    assert job_index.get_job_from_l_keys(["point_0", "missing"]) is None
+
+
+def test_parents_and_children(dic_tree):
+    job_index = JobIndex(dic_tree)
+    base, base_bis = job_index["study/base.py"], job_index["study/base_bis.py"]
+    job_0, job_1 = job_index["study/point_0/job.py"], job_index["study/point_1/job.py"]
+    job_sub = job_index["study/point_0/sub/job.py"]
+
+    # The jobs of the ancestor folders are the parents, the jobs of a same folder being siblings
+    assert base.parents == []
+    assert job_0.parents == [base, base_bis]
+    assert job_sub.parents == [base, base_bis, job_0]
+    assert job_1.parents is job_0.parents
+    assert base.children == [job_0, job_sub, job_1]
+    assert job_0.children == [job_sub]
+
+
+def test_nodes_shared_with_tree(dic_tree):
+    job_index = JobIndex(dic_tree)
+    job = job_index["study/point_0/job.py"]
+    assert job.status == "to_submit"
+    assert job_index["study/base.py"].is_finished
+    assert job_index["study/base_bis.py"].status is None
+
+    # The attributes are read and written through the node of the tree
+    job.node["status"] = "finished"
+    assert dic_tree["point_0"]["job"]["status"] == "finished"
+    assert job.is_finished
+    assert job_index.to_dic_all_jobs()["study/point_0/sub/job.py"] == {
+        "gen": 2,
+        "l_keys": ["point_0", "sub", "job"],
+    }
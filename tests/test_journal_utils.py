@@ -0,0 +1,130 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import subprocess
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.tree_store.tree_store import YamlTreeStore
+from study_sub.utils.dict_yaml_utils import invalidate_yaml_cache, load_yaml, write_yaml
+from study_sub.utils.journal_utils import (
+    append_status_record,
+    get_filename_marker,
+    get_marker_commands,
+    get_path_journal,
+    get_path_markers,
+    has_pending_records,
+    pop_marker_records,
+    remove_markers,
+)
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def tree_store(tmp_path):
+    path_tree = str(tmp_path / "tree.yaml")
+    write_yaml(
+        path_tree,
+        {
+            "job_0": {"file": "study/job_0.py", "status": "to_submit"},
+            "folder": {"job_1": {"file": "study/folder/job_1.py", "status": "to_submit"}},
+        },
+    )
+    yield YamlTreeStore(path_tree)
+    invalidate_yaml_cache()
+
+
+def write_marker(path_tree, l_keys, exit_code=0):
+    # As written by the run file at the end of the job
+    str_commands = get_marker_commands(path_tree, " ".join(l_keys), get_filename_marker(l_keys))
+    subprocess.run(
+        ["bash", "-c", f"exit_code={exit_code}\nstart_time=$SECONDS\n{str_commands}"], check=True
+    )
+    return f"{get_path_markers(path_tree)}/{get_filename_marker(l_keys)}"
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_compact_journal(tree_store):
+    append_status_record(tree_store.path_tree, ["job_0"], "running")
+    append_status_record(tree_store.path_tree, ["folder", "job_1"], "finished")
+    append_status_record(tree_store.path_tree, ["job_0"], "finished")
+    assert has_pending_records(tree_store.path_tree)
+
+    # The records are applied in order, and the journal removed
+    l_finished = tree_store.compact()
+    assert sorted(l_finished) == [["folder", "job_1"], ["job_0"]]
+    dic_tree = load_yaml(tree_store.path_tree)
+    assert dic_tree["job_0"]["status"] == "finished"
+    assert dic_tree["folder"]["job_1"]["status"] == "finished"
+    assert not has_pending_records(tree_store.path_tree)
+    assert not os.path.exists(get_path_journal(tree_store.path_tree))
+
+
+def test_compact_leftover_journal(tree_store):
+    # Journal moved aside by a compaction that was interrupted before writing the tree
+    path_journal = get_path_journal(tree_store.path_tree)
+    append_status_record(tree_store.path_tree, ["job_0"], "finished")
+    os.replace(path_journal, f"{path_journal}.1.folding")
+    append_status_record(tree_store.path_tree, ["folder", "job_1"], "finished")
+
+    assert len(tree_store.compact()) == 2
+    assert tree_store.load()["job_0"]["status"] == "finished"
+    assert not os.path.exists(f"{path_journal}.1.folding")
+
+
+def test_load_folds_markers(tree_store):
+    path_marker = write_marker(tree_store.path_tree, ["folder", "job_1"])
+    assert has_pending_records(tree_store.path_tree)
+
+    # Loading the tree folds the markers first
+    assert tree_store.load()["folder"]["job_1"]["status"] == "finished"
+    assert not os.path.exists(path_marker)
+    assert not has_pending_records(tree_store.path_tree)
+
+
+def test_failed_and_malformed_markers(tree_store):
+    path_marker_failed = write_marker(tree_store.path_tree, ["job_0"], exit_code=1)
+    path_marker_malformed = f"{get_path_markers(tree_store.path_tree)}/malformed.done"
+    with open(path_marker_malformed, "w") as f:
+        f.write("exit_code\n")
+
+    # Neither changes the status, both are removed
+    assert tree_store.compact() == []
+    assert tree_store.load()["job_0"]["status"] == "to_submit"
+    assert not os.path.exists(path_marker_failed)
+    assert not os.path.exists(path_marker_malformed)
+
+
+def test_marker_rewritten_during_fold_is_kept(tree_store):
+    path_marker = write_marker(tree_store.path_tree, ["job_0"], exit_code=1)
+    l_records, l_paths_markers = pop_marker_records(tree_store.path_tree)
+    assert l_records == []
+
+    # The job is run again and succeeds before the previous marker is removed
+    write_marker(tree_store.path_tree, ["job_0"])
+    remove_markers(l_paths_markers)
+    assert os.path.exists(path_marker)
+    assert tree_store.load()["job_0"]["status"] == "finished"
+
+
+def test_marker_names(tree_store):
+    # Long keys don't exceed the maximum length of a file name, and joined keys don't collide
+    l_keys_long = [f"{'a' * 50}_{idx}" for idx in range(20)]
+    assert len(get_filename_marker(l_keys_long)) < 255
+    assert get_filename_marker(["job__0"]) != get_filename_marker(["job", "0"])
+
+    # The keys are read from the content of the marker
+    with open(tree_store.path_tree, "a") as f:
+        f.write("job__0:\n  file: study/job__0.py\n  status: to_submit\n")
+    write_marker(tree_store.path_tree, ["job__0"])
+    write_marker(tree_store.path_tree, ["job_0"])
+    assert sorted(tree_store.compact()) == [["job_0"], ["job__0"]]
+    assert tree_store.load()["job__0"]["status"] == "finished"
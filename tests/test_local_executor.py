@@ -0,0 +1,149 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import socket
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.cluster_submission.local_executor import LocalExecutor
+from study_sub.utils.run_registry import get_path_run_registry
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def make_job_folder(tmp_path, name, commands=""):
+    # Job appending its name to a log shared by all the jobs, then running the given commands
+    folder = tmp_path / name
+    folder.mkdir()
+    (folder / "run.sh").write_text(f"echo {name} >> {tmp_path}/log.txt\n{commands}\n")
+    return str(folder)
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def make_job(tmp_path):
+    def make_job(name, commands=""):
+        return make_job_folder(tmp_path, name, commands)
+
+    return make_job
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_children_start_once_parents_succeeded(tmp_path, make_job):
+    executor = LocalExecutor(max_workers=4, poll_interval=0.05)
+    dic_jobs = {
+        "parent": (make_job("parent", "sleep 0.3"), 1, 0),
+        "child": (make_job("child"), 1, 0),
+        "grandchild": (make_job("grandchild"), 1, 0),
+    }
+    executor.submit(
+        dic_jobs, {"child": ["parent"], "grandchild": ["child", "parent"]}, blocking=True
+    )
+    assert (tmp_path / "log.txt").read_text().split() == ["parent", "child", "grandchild"]
+    assert executor.dic_exit_codes == {"parent": 0, "child": 0, "grandchild": 0}
+
+
+def test_descendants_of_failed_job_cancelled(tmp_path, make_job):
+    executor = LocalExecutor(max_workers=4, poll_interval=0.05)
+    dic_jobs = {
+        "parent": (make_job("parent", "exit 1"), 1, 0),
+        "child": (make_job("child"), 1, 0),
+        "grandchild": (make_job("grandchild"), 1, 0),
+        "other": (make_job("other"), 1, 0),
+    }
+    executor.submit(dic_jobs, {"child": ["parent"], "grandchild": ["child"]}, blocking=True)
+    assert sorted((tmp_path / "log.txt").read_text().split()) == ["other", "parent"]
+    assert executor.dic_exit_codes == {"parent": 1, "child": None, "grandchild": None, "other": 0}
+    assert not executor.is_tracking("grandchild")
+
+
+def test_cpu_budget(make_job):
+    executor = LocalExecutor(max_workers=2, poll_interval=0.05)
+    dic_jobs = {
+        "job_0": (make_job("job_0", "sleep 0.5"), 1, 0),
+        "job_1": (make_job("job_1", "sleep 0.5"), 2, 0),
+        "job_2": (make_job("job_2", "sleep 0.5"), 1, 0),
+    }
+    executor.submit(dic_jobs)
+
+    # The jobs are followed from a thread which doesn't keep the interpreter alive
+    assert executor._thread.daemon
+
+    # The jobs fitting in the free cores are started, in order
+    assert sorted(executor.get_running_jobs()) == ["job_0", "job_2"]
+    assert executor.get_queuing_jobs() == ["job_1"]
+    executor.wait()
+    assert executor.dic_exit_codes == {"job_0": 0, "job_1": 0, "job_2": 0}
+
+
+def test_job_larger_than_budget_runs_alone(make_job):
+    executor = LocalExecutor(max_workers=2, max_memory=1000, poll_interval=0.05)
+    dic_jobs = {
+        "job_0": (make_job("job_0", "sleep 0.5"), 4, 2000),
+        "job_1": (make_job("job_1", "sleep 0.5"), 1, 100),
+    }
+    executor.submit(dic_jobs)
+    assert executor.get_running_jobs() == ["job_0"]
+    executor.wait()
+    assert executor.dic_exit_codes == {"job_0": 0, "job_1": 0}
+
+
+def test_next_generations_run_by_submit(make_study):
+    study = make_study(2, submission_type="local", flat=False)
+    with study._edit_tree() as dic_tree:
+        dic_tree["root"]["status"] = "to_submit"
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+
+    # Jobs only logging their folder
+    for path_run in [f"{study.abs_path}/study/run.sh"] + [
+        f"{study.abs_path}/study/job_{idx}/run.sh" for idx in range(2)
+    ]:
+        with open(path_run, "w") as fid:
+            fid.write(f"basename $(pwd) >> {study.abs_path}/log.txt\n")
+
+    # The children only ready once the root is done are started by the executor
+    study.submit(local_blocking=True)
+    with open(f"{study.abs_path}/log.txt") as fid:
+        l_folders = fid.read().split()
+    assert l_folders[0] == "study"
+    assert sorted(l_folders[1:]) == ["job_0", "job_1"]
+
+
+def test_resources_left_empty(make_study):
+    # E.g. resources not sized by autosize_resources
+    study = make_study(1, submission_type="local", cpus=None, memory=None)
+    study.generate_run_files()
+    with open(f"{study.abs_path}/study/job_0/run.sh", "w") as fid:
+        fid.write("exit 0\n")
+    study.submit(local_blocking=True)
+    assert study.local_executor.dic_exit_codes == {"study/job_0/job.py": 0}
+
+
+def test_jobs_of_other_sessions_found(make_study, tmp_path):
+    study = make_study(2, submission_type="local")
+    study.generate_run_files()
+    for idx in range(2):
+        with open(f"{study.abs_path}/study/job_{idx}/run.sh", "w") as fid:
+            fid.write("exit 0\n")
+
+    # The executor of this session runs another job, while job_1 runs in another session
+    study.local_executor.submit({"other": (make_job_folder(tmp_path, "other", "sleep 1"), 1, 0)})
+    path_registry = get_path_run_registry(study.abs_path_tree)
+    os.makedirs(path_registry)
+    with open(f"{path_registry}/job_1.pid", "w") as fid:
+        fid.write(f"{os.getpid()} {socket.gethostname()} {study.abs_path}/study/job_1\n")
+
+    study.submit()
+    assert study.local_executor.is_tracking("study/job_0/job.py")
+    assert not study.local_executor.is_tracking("study/job_1/job.py")
+    study.wait_local_jobs()
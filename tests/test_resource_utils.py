@@ -0,0 +1,90 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Local imports
+from study_sub.utils.resource_utils import get_resources_from_usage, read_usage
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def write_usage(study, idx, elapsed, max_rss_kb=None, cpu_percent=None):
+    # As written by run.sh, the memory and cpu usage being missing without GNU time
+    usage_str = ""
+    if max_rss_kb is not None:
+        usage_str += f"max_rss_kb {max_rss_kb}\ncpu_percent {cpu_percent}\n"
+    usage_str += f"elapsed {elapsed}\n"
+    with open(f"{study.abs_path}/study/job_{idx}/usage.txt", "w") as fid:
+        fid.write(usage_str)
+
+
+def set_finished(study, l_idx):
+    with study._edit_tree() as dic_tree:
+        for idx in l_idx:
+            dic_tree[f"job_{idx}"]["job"]["status"] = "finished"
+        study.dic_tree = dic_tree
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_read_usage(tmp_path):
+    (tmp_path / "usage.txt").write_text("max_rss_kb 2048\ncpu_percent ?%\nelapsed 12\n")
+    assert read_usage(str(tmp_path)) == {"max_rss_kb": 2048.0, "elapsed": 12.0}
+
+    # The usage is only known once the job is done
+    (tmp_path / "usage.txt").write_text("max_rss_kb 2048\n")
+    assert read_usage(str(tmp_path)) is None
+    assert read_usage(str(tmp_path / "missing")) is None
+
+
+def test_resources_from_usage():
+    l_usages = [
+        {"elapsed": 600.0, "max_rss_kb": 1024.0 * 1000, "cpu_percent": 150.0},
+        {"elapsed": 60.0, "max_rss_kb": 1024.0 * 100, "cpu_percent": 90.0},
+    ]
+    dic_resources = get_resources_from_usage(l_usages, percentile=100.0, margin=1.5)
+    assert dic_resources == {"walltime": 15, "memory": 1500, "cpus": 2}
+
+    # Without GNU time, only the walltime is known, and it is at least one minute
+    assert get_resources_from_usage([{"elapsed": 1.0}]) == {"walltime": 1}
+
+
+def test_autosize_resources(make_study):
+    study = make_study(5, submission_type="htc")
+    for idx in range(3):
+        write_usage(study, idx, 100 * (idx + 1), max_rss_kb=1024 * 100, cpu_percent=99)
+    set_finished(study, range(3))
+    with study._edit_tree() as dic_tree:
+        dic_tree["job_4"]["job"]["memory"] = 4000
+        study.dic_tree = dic_tree
+
+    # The unfinished jobs are sized from the finished ones, the resources already set being kept
+    study.autosize_resources(percentile=100.0, margin=1.2)
+    for idx in [3, 4]:
+        node = study.dic_tree[f"job_{idx}"]["job"]
+        assert node["walltime"] == 6
+        assert node["cpus"] == 1
+        assert node["htc_flavor"] == "espresso"
+    assert study.dic_tree["job_3"]["job"]["memory"] == 120
+    assert study.dic_tree["job_4"]["job"]["memory"] == 4000
+
+    # Unless they are overwritten
+    study.autosize_resources(percentile=100.0, margin=1.2, overwrite=True)
+    assert study.dic_tree["job_4"]["job"]["memory"] == 120
+
+    # And the finished jobs are left untouched
+    assert "walltime" not in study.dic_tree["job_0"]["job"]
+
+
+def test_autosize_resources_min_samples(make_study):
+    study = make_study(3, submission_type="slurm")
+    write_usage(study, 0, 100)
+    set_finished(study, [0])
+
+    # A single finished job is not enough to size the others
+    study.autosize_resources(min_samples=2)
+    assert "walltime" not in study.dic_tree["job_1"]["job"]
+    study.autosize_resources(min_samples=1, percentile=100.0, margin=1.2)
+    assert study.dic_tree["job_1"]["job"]["walltime"] == 2
+    assert "memory" not in study.dic_tree["job_1"]["job"]
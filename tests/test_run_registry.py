@@ -0,0 +1,90 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import os
+import socket
+import subprocess
+import time
+
+# Third party imports
+import psutil
+import pytest
+
+# Local imports
+from study_sub.utils.run_registry import (
+    HEARTBEAT_TIMEOUT,
+    get_path_run_registry,
+    get_registry_commands,
+    get_running_folders,
+)
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def path_tree(tmp_path):
+    return str(tmp_path / "tree.yaml")
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def register(path_tree, name, pid, hostname, mtime=None):
+    # As written by the registry commands of a job
+    path_registry = get_path_run_registry(path_tree)
+    os.makedirs(path_registry, exist_ok=True)
+    path_file = f"{path_registry}/{name}.pid"
+    with open(path_file, "w") as f:
+        f.write(f"{pid} {hostname} /study/{name}\n")
+    if mtime is not None:
+        os.utime(path_file, (mtime, mtime))
+    return path_file
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_registry_commands(path_tree, tmp_path):
+    # The job is registered while it runs, and unregistered when it exits, even if it failed
+    path_signal = tmp_path / "signal"
+    str_commands = get_registry_commands(path_tree, "run_key", "/study/job")
+    process = subprocess.Popen(
+        ["bash", "-c", f"{str_commands}touch {path_signal}\nsleep 0.5\nexit 3"]
+    )
+    while not path_signal.exists():
+        time.sleep(0.01)
+    assert get_running_folders(path_tree) == ["/study/job"]
+    assert process.wait() == 3
+    assert get_running_folders(path_tree) == []
+    assert os.listdir(get_path_run_registry(path_tree)) == []
+
+
+def test_running_folders_of_this_host(path_tree):
+    hostname = socket.gethostname()
+    register(path_tree, "alive", os.getpid(), hostname)
+
+    # A process that exited, and a pid reused by a process started after the last heartbeat
+    process = subprocess.Popen(["true"])
+    process.wait()
+    path_dead = register(path_tree, "dead", process.pid, hostname)
+    create_time = psutil.Process(os.getpid()).create_time()
+    path_reused = register(path_tree, "reused", os.getpid(), hostname, mtime=create_time - 10)
+
+    assert get_running_folders(path_tree) == ["/study/alive"]
+    assert not os.path.exists(path_dead)
+    assert not os.path.exists(path_reused)
+
+
+def test_running_folders_of_other_hosts(path_tree):
+    # Jobs of other hosts are only checked through their heartbeat
+    register(path_tree, "alive", 1, "other_host")
+    path_stale = register(path_tree, "stale", 1, "other_host", time.time() - HEARTBEAT_TIMEOUT - 1)
+    path_malformed = register(path_tree, "malformed", 1, "other_host")
+    with open(path_malformed, "w") as f:
+        f.write("1\n")
+
+    assert get_running_folders(path_tree) == ["/study/alive"]
+    assert not os.path.exists(path_stale)
+    assert os.path.exists(path_malformed)
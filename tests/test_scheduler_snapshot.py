@@ -0,0 +1,26 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Local imports
+from study_sub.cluster_submission.scheduler_snapshot import SchedulerSnapshot
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_commands_keep_runner_arguments(fake_scheduler):
+    state = fake_scheduler.load()
+    state["jobs"] = {
+        "1": {"state": "RUNNING", "command": "/study/runner.sh /study/job 0/", "workdir": "/w 0"},
+        "2.0": {"state": "PENDING", "command": "/study/runner.sh /study/job 1/", "workdir": "/w"},
+        "3.0": {"state": "PENDING", "command": "/study/job_2/run.sh", "workdir": "/study/job_2"},
+    }
+    fake_scheduler.save(state)
+    snapshot = SchedulerSnapshot()
+
+    # The command is kept whole, with the folder given to the runner
+    dic_slurm_commands = snapshot.get_slurm_commands()
+    assert dic_slurm_commands["1"] == ("/w 0", "/w 0/output.txt", "/study/runner.sh /study/job 0/")
+    dic_condor_commands = snapshot.get_condor_commands()
+    assert dic_condor_commands["2.0"] == ("/w", "/study/runner.sh /study/job 1/")
+    assert dic_condor_commands["3.0"] == ("/study/job_2", "/study/job_2/run.sh")
@@ -0,0 +1,141 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import subprocess
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.tree_store import SqliteTreeStore
+from study_sub.utils.dict_yaml_utils import write_yaml
+from study_sub.utils.journal_utils import get_filename_marker, get_marker_commands
+
+
+# ==================================================================================================
+# --- Fixtures
+# ==================================================================================================
+@pytest.fixture
+def path_tree(tmp_path):
+    # Database imported from a yaml tree, with a node that is not a job
+    path_yaml = str(tmp_path / "tree.yaml")
+    write_yaml(
+        path_yaml,
+        {
+            "job_0": {"file": "study/job_0.py", "status": "to_submit", "submission_type": "local"},
+            "folder": {
+                "job_1": {"file": "study/folder/job_1.py", "status": "to_submit", "id_sub": 12},
+                "parameters": {"a": 1},
+            },
+            "python_environment": "/venv",
+        },
+    )
+    path_tree = str(tmp_path / "tree.sqlite")
+    SqliteTreeStore(path_tree).import_yaml(path_yaml)
+    return path_tree
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def write_marker(path_tree, l_keys):
+    # As written by the run file at the end of a successful job
+    str_commands = get_marker_commands(path_tree, " ".join(l_keys), get_filename_marker(l_keys))
+    subprocess.run(["bash", "-c", f"exit_code=0\nstart_time=$SECONDS\n{str_commands}"], check=True)
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_round_trip(path_tree):
+    tree_store = SqliteTreeStore(path_tree)
+    dic_tree = tree_store.load()
+    assert list(dic_tree) == ["job_0", "folder", "python_environment"]
+    assert list(dic_tree["folder"]) == ["job_1", "parameters"]
+    assert dic_tree["folder"]["job_1"]["id_sub"] == 12
+    assert dic_tree["folder"]["parameters"] == {"a": 1}
+
+    # The tree is cached until another connection commits
+    assert tree_store.load() is dic_tree
+    SqliteTreeStore(path_tree).set_status(["job_0"], "finished")
+    dic_tree = tree_store.load()
+    assert dic_tree["job_0"]["status"] == "finished"
+
+    # Queries on the indexed columns
+    assert list(tree_store.get_jobs(status="finished")) == ["study/job_0.py"]
+    assert list(tree_store.get_jobs(exclude_status="finished", gen=1)) == ["study/folder/job_1.py"]
+    assert tree_store.get_job_from_id_sub(12) == {
+        "study/folder/job_1.py": {"gen": 1, "l_keys": ["folder", "job_1"]}
+    }
+
+
+def test_write_keeps_concurrent_status(path_tree):
+    tree_store = SqliteTreeStore(path_tree)
+    dic_tree = tree_store.load()
+
+    # Job finished by another connection while the tree is edited
+    SqliteTreeStore(path_tree).set_status(["folder", "job_1"], "finished")
+    dic_tree["folder"]["job_1"]["id_sub"] = 13
+    dic_tree["job_0"]["status"] = "running"
+    tree_store.write(dic_tree)
+
+    # Only the edited attributes are written, and the tree is reloaded as it is not current
+    dic_tree = tree_store.load()
+    assert dic_tree["folder"]["job_1"] == {
+        "file": "study/folder/job_1.py",
+        "status": "finished",
+        "id_sub": 13,
+    }
+    assert dic_tree["job_0"]["status"] == "running"
+    assert list(tree_store.get_jobs(status="finished")) == ["study/folder/job_1.py"]
+    assert SqliteTreeStore(path_tree).load() == dic_tree
+
+
+def test_write_only_changed_rows(path_tree):
+    tree_store = SqliteTreeStore(path_tree)
+    dic_tree = tree_store.load()
+    dic_tree["folder"]["job_1"]["id_sub"] = 13
+    del dic_tree["job_0"]
+
+    l_statements = []
+    tree_store.connection.set_trace_callback(l_statements.append)
+    tree_store.write(dic_tree)
+    tree_store.connection.set_trace_callback(None)
+    l_updates = [statement for statement in l_statements if statement.startswith("UPDATE")]
+    assert len(l_updates) == 1
+    assert "study/folder/job_1.py" in l_updates[0]
+    assert SqliteTreeStore(path_tree).load() == dic_tree
+
+    # The tree written is up to date, hence kept
+    assert tree_store.load() is dic_tree
+
+
+def test_compact_folds_markers_in_place(path_tree):
+    tree_store = SqliteTreeStore(path_tree)
+    dic_tree = tree_store.load()
+    write_marker(path_tree, ["folder", "job_1"])
+
+    assert tree_store.compact() == [["folder", "job_1"]]
+    assert tree_store.load() is dic_tree
+    assert dic_tree["folder"]["job_1"]["status"] == "finished"
+    assert SqliteTreeStore(path_tree).load() == dic_tree
+
+
+def test_compact_reloads_changes_of_other_connections(path_tree):
+    tree_store = SqliteTreeStore(path_tree)
+    dic_tree = tree_store.load()
+
+    # Another connection changes more than a status
+    other_store = SqliteTreeStore(path_tree)
+    dic_tree_other = other_store.load()
+    dic_tree_other["job_0"]["submission_type"] = "slurm"
+    other_store.write(dic_tree_other)
+    write_marker(path_tree, ["folder", "job_1"])
+
+    # The tree is reloaded in full rather than only updated with the markers
+    tree_store.compact()
+    dic_tree_reloaded = tree_store.load()
+    assert dic_tree_reloaded is not dic_tree
+    assert dic_tree_reloaded["job_0"]["submission_type"] == "slurm"
+    assert dic_tree_reloaded["folder"]["job_1"]["status"] == "finished"
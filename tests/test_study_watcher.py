@@ -0,0 +1,39 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Local imports
+from study_sub.study_watcher import StudyWatcher
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_completion_folded_while_loading(make_study, fake_scheduler, monkeypatch):
+    study = make_study(2, submission_type="slurm", flat=False)
+    with study._edit_tree() as dic_tree:
+        dic_tree["root"]["status"] = "to_submit"
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+    watcher = StudyWatcher(study)
+    assert watcher.poll() == "active"
+    assert study.id_index.get_id("study/root.py") is not None
+
+    # The root job finishes right after the pending updates have been folded, hence its
+    # completion is folded when the tree is loaded
+    fake_scheduler.set_state(study.id_index.get_id("study/root.py"), None)
+    compact = study.tree_store.compact
+
+    def compact_then_finish():
+        l_keys_finished = compact()
+        monkeypatch.setattr(study.tree_store, "compact", compact)
+        study.tree_store.set_status(["root"], "finished")
+        return l_keys_finished
+
+    monkeypatch.setattr(study.tree_store, "compact", compact_then_finish)
+    study.scheduler_snapshot.invalidate()
+    assert watcher.poll() == "active"
+
+    # The children are ready, and submitted
+    assert "study/root.py" in watcher.dependency_graph.set_finished_jobs
+    assert study.id_index.get_id("study/job_0/job.py") is not None
+    assert study.id_index.get_id("study/job_1/job.py") is not None
@@ -0,0 +1,37 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.cluster_submission.submission_engine import is_transient_error
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+@pytest.mark.parametrize(
+    "output",
+    [
+        "sbatch: error: Batch job submission failed: Socket timed out on send/recv operation",
+        "sbatch: error: Batch job submission failed: Unable to contact slurm controller",
+        "sbatch: error: QOSMaxSubmitJobPerUserLimit",
+        "ERROR: Can't find address of local schedd",
+        "ERROR: Failed to connect to local queue manager",
+    ],
+)
+def test_transient_errors(output):
+    assert is_transient_error(output)
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        "sbatch: error: invalid partition specified: slurm_hpc_acc",
+        "ERROR: Failed to commit job submission into the queue. The schedd rejected the job",
+        "ERROR: on Line 4 of submit file: executable /study/job/run.sh does not exist",
+    ],
+)
+def test_permanent_errors(output):
+    assert not is_transient_error(output)
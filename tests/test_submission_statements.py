@@ -0,0 +1,52 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import glob
+
+# Local imports
+from study_sub.cluster_submission.submission_statements import HTC, HTCDag, Slurm
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_slurm_resources_rounded_up():
+    Sub = Slurm("run.sub", "/study/job/", None, resources={"memory": 1000.5, "walltime": 7.5})
+    assert "--mem=1001M" in Sub.body
+    assert "--time=8 " in Sub.body
+
+
+def test_htc_max_runtime_only_with_walltime():
+    Sub = HTC("run.sub", "/study/job/", None, htc_flavor=None, resources={"walltime": 90.5})
+    assert "+MaxRuntime = $(max_runtime)" in Sub.head
+    assert Sub.body == "/study/job, longlunch, 0, 1, 2000, 5430"
+
+    # Without walltime, the runtime is only limited by the flavour (the shortest by default)
+    Sub = HTC("run.sub", "/study/job/", None, htc_flavor=None)
+    assert "MaxRuntime" not in Sub.head
+    assert Sub.body == "/study/job, espresso, 0, 1, 2000, undefined"
+
+    Sub = HTCDag("dag.sub", "/study/job/", None, "job_0", htc_flavor="workday")
+    assert "MaxRuntime" not in Sub.head
+    assert 'htc_flavor="workday"' in Sub.body
+
+
+def test_htc_manifest(make_study, fake_scheduler):
+    study = make_study(2, submission_type="htc", htc_flavor=None)
+    with study._edit_tree() as dic_tree:
+        dic_tree["job_1"]["job"]["walltime"] = 30
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+    study.submit()
+
+    # The head of the submission file sets the maximum runtime, as a job has a walltime
+    (filename_sub,) = glob.glob(f"{study.abs_path}/study/submission/*_htc.sub")
+    with open(filename_sub) as fid:
+        assert "+MaxRuntime = $(max_runtime)" in fid.read()
+    with open(filename_sub.replace(".sub", "_manifest.txt")) as fid:
+        l_lines = fid.read().split("\n")[:-1]
+    assert l_lines == [
+        f"{study.abs_path}/study/job_0, espresso, 0, 1, 2000, undefined",
+        f"{study.abs_path}/study/job_1, microcentury, 0, 1, 2000, 1800",
+    ]
@@ -0,0 +1,128 @@
+# ==================================================================================================
+# --- Imports
+# ==================================================================================================
+# Standard library imports
+import glob
+
+# Third party imports
+import pytest
+
+# Local imports
+from study_sub.id_index import IdIndex
+
+
+# ==================================================================================================
+# --- Functions
+# ==================================================================================================
+def set_root_unfinished(study, **kwargs_tree):
+    with study._edit_tree() as dic_tree:
+        dic_tree["root"]["status"] = "to_submit"
+        dic_tree |= kwargs_tree
+        study.dic_tree = dic_tree
+
+
+# ==================================================================================================
+# --- Tests
+# ==================================================================================================
+def test_dag_slurm_dependencies(make_study, fake_scheduler):
+    study = make_study(3, submission_type="slurm", flat=False)
+    set_root_unfinished(study)
+    study.generate_run_files()
+    study.submit(dag=True)
+
+    # The root is submitted first, its children depending on it
+    l_calls = fake_scheduler.load()["calls"]
+    assert len(l_calls) == 4
+    assert not any(arg.startswith("--dependency") for arg in l_calls[0])
+    for call in l_calls[1:]:
+        assert "--dependency=afterok:1" in call
+    assert study.id_index.get_id("study/root.py") == "1"
+    assert len(study.id_index) == 4
+
+
+def test_dag_slurm_docker_fix(make_study, fake_scheduler):
+    study = make_study(2, submission_type="slurm_docker", flat=False)
+    set_root_unfinished(study, container_image="/images/image.sif")
+    study.generate_run_files()
+    study.submit(dag=True)
+
+    # The submission files of the nodes apply the same fix as the other slurm_docker submissions
+    l_filenames = glob.glob(f"{study.abs_path}/study/submission/*_dag_*.sub")
+    assert len(l_filenames) == 3
+    for filename in l_filenames:
+        with open(filename) as fid:
+            assert "sed -i" in fid.read()
+    assert len(study.id_index) == 3
+
+
+def test_dag_htc_records_nodes(make_study, fake_scheduler):
+    study = make_study(3, submission_type="htc", flat=False)
+    set_root_unfinished(study)
+    study.generate_run_files()
+    study.submit(dag=True)
+
+    # All the nodes are recorded with the id of the DAGMan job
+    assert len(fake_scheduler.load()["calls"]) == 1
+    assert len(study.id_index) == 4
+    assert sorted(study.id_index.get_jobs("1")) == sorted(
+        ["study/root.py"] + [f"study/job_{idx}/job.py" for idx in range(3)]
+    )
+
+    # Hence they are not submitted again while DAGMan runs
+    study.scheduler_snapshot.invalidate()
+    study.submit(dag=True)
+    assert len(fake_scheduler.load()["calls"]) == 1
+
+    # But they are once it is done
+    fake_scheduler.set_state("1.0", None)
+    study.scheduler_snapshot.invalidate()
+    study.submit(dag=True)
+    assert len(fake_scheduler.load()["calls"]) == 2
+    assert len(study.id_index.get_jobs("2")) == 4
+
+
+def test_dag_slurm_ids_recorded_before_failure(make_study, fake_scheduler):
+    study = make_study(3, submission_type="slurm", flat=False)
+    set_root_unfinished(study)
+    study.generate_run_files()
+    state = fake_scheduler.load()
+    state["reject"] = ["job_1"]
+    fake_scheduler.save(state)
+
+    # The rejected job is reported once the other jobs are submitted
+    with pytest.raises(RuntimeError, match="job_1"):
+        study.submit(dag=True)
+    assert len(fake_scheduler.load()["jobs"]) == 3
+
+    # The ids submitted so far are on disk, hence not submitted again
+    id_index = IdIndex(study.path_tree)
+    assert id_index.get_id("study/root.py") is not None
+    assert id_index.get_id("study/job_0/job.py") is not None
+    assert id_index.get_id("study/job_1/job.py") is None
+    state = fake_scheduler.load()
+    state["reject"] = []
+    fake_scheduler.save(state)
+    study.scheduler_snapshot.invalidate()
+    study.submit(dag=True)
+    assert len(fake_scheduler.load()["jobs"]) == 4
+
+
+def test_dag_slurm_dependency_on_bundle(make_study, fake_scheduler):
+    study = make_study(2, submission_type="slurm", flat=False)
+    with study._edit_tree() as dic_tree:
+        dic_tree["root"]["status"] = "to_submit"
+        dic_tree["root_bis"] = dic_tree["root"] | {"file": "study/root_bis.py"}
+        study.dic_tree = dic_tree
+    study.generate_run_files()
+
+    # Both parents are queuing in the same bundle
+    study.submit(bundle_size=2)
+    assert study.id_index.get_jobs("1") == ["study/root.py", "study/root_bis.py"]
+
+    # The children depend on the scheduler job of the bundle
+    study.scheduler_snapshot.invalidate()
+    study.submit(dag=True)
+    l_calls = fake_scheduler.load()["calls"]
+    assert len(l_calls) == 3
+    for call in l_calls[1:]:
+        assert "--dependency=afterok:1" in call